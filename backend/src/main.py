@@ -6,124 +6,275 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from flask import Flask, send_from_directory, jsonify
 from flask_cors import CORS
 from src.models.solar_data import db
+from src.models.database import database_uri, engine_options, prepare_database, init_engine
+from src.models.migrations import check_schema, upgrade_db_command
 from src.routes.data_endpoints import data_bp
-from src.routes.ai_endpoints import ai_bp
-
-app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
-app.config['SECRET_KEY'] = 'heliosentinel_secret_key_2024'
-
-# Configurar CORS para permitir todas las conexiones
-CORS(app, origins="*")
-
-# Registrar blueprints
-app.register_blueprint(data_bp, url_prefix='/api')
-app.register_blueprint(ai_bp, url_prefix='/api')
-
-# Configuración de base de datos
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'heliosentinel.db')}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-
-# Inicializar base de datos
-db.init_app(app)
-with app.app_context():
-    db.create_all()
-
-@app.route('/api/health', methods=['GET'])
-def health_check():
-    """Endpoint de verificación de salud"""
-    return jsonify({
-        'status': 'healthy',
-        'service': 'HelioSentinel Backend',
-        'version': '1.0.0',
-        'timestamp': db.func.now()
-    }), 200
-
-@app.route('/api/info', methods=['GET'])
-def get_system_info():
-    """Información del sistema HelioSentinel"""
-    return jsonify({
-        'name': 'HelioSentinel',
-        'description': 'Plataforma de IA para sistemas fotovoltaicos',
-        'version': '1.0.0',
-        'features': [
-            'Predicción de desempeño FV para climas tropicales',
-            'Detección temprana de anomalías y fallas',
-            'Optimización multiobjetivo de sistemas solares',
-            'Análisis de datos en tiempo real',
-            'Dashboards profesionales',
-            'Gemelo digital de sistemas fotovoltaicos'
-        ],
-        'technologies': [
-            'Machine Learning',
-            'Deep Learning',
-            'XAI (Explainable AI)',
-            'Digital Twin',
-            'NSGA-II',
-            'Deep Q-Network'
-        ],
-        'endpoints': {
-            'data': [
-                '/api/data/solar',
-                '/api/data/environmental',
-                '/api/data/latest',
-                '/api/upload/csv',
-                '/api/upload/xlsx'
+from src.routes.ai_endpoints import ai_bp, performance_batcher, anomaly_batcher
+from src.services.import_pipeline import import_data_command
+from src.services.query_plans import check_query_plans_command
+from src.services.ingestion import register_ingest_listener, register_update_listener
+from src.services.rollups import update_rollups, refresh_rollups, rebuild_rollups_command
+from src.services.hot_store import init_hot_stores
+from src.services.dashboard_metrics import init_dashboard_metrics
+from src.services.event_feed import init_event_feed
+from src.services.retention import init_retention, apply_retention_command
+from src.services.partitions import (
+    init_partitions, maintain_partitions_command, drop_partition_command, partition_tables_command
+)
+from src.services.streaming_detectors import init_streaming_detectors
+from src.services.nsga2 import init_evaluation_pool
+from src.services.optimization_cache import init_optimization_cache
+from src.services.model_registry import init_model_registry
+from src.services.micro_batching import init_micro_batching
+from src.services.write_behind import init_write_behind
+
+def create_app():
+    """Crear y configurar la aplicación con sus servicios en segundo plano"""
+    app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+    app.config['SECRET_KEY'] = 'heliosentinel_secret_key_2024'
+
+    # Configurar CORS para permitir todas las conexiones
+    CORS(app, origins="*")
+
+    # Registrar blueprints
+    app.register_blueprint(data_bp, url_prefix='/api')
+    app.register_blueprint(ai_bp, url_prefix='/api')
+
+    # Configuración de base de datos (DATABASE_URL o el archivo SQLite local)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri(
+        os.environ.get('DATABASE_URL'), os.path.join(os.path.dirname(__file__), 'database', 'heliosentinel.db')
+    )
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Pool de conexiones: tamaño, desborde, espera máxima y reciclado (segundos)
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 10))
+    app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    app.config['DB_POOL_TIMEOUT'] = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    # SQLite (modo WAL): espera ante bloqueos de escritura y memoria mapeada
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    app.config['SQLITE_MMAP_MB'] = int(os.environ.get('SQLITE_MMAP_MB', 256))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    # Tamaño máximo de archivo (16MB por defecto; ampliar para importaciones por streaming)
+    app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_MB', 16)) * 1024 * 1024
+    app.config['UPLOAD_FOLDER'] = os.environ.get(
+        'UPLOAD_FOLDER', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
+    )
+    # Lecturas recientes en memoria por módulo/ubicación para /api/data/latest
+    app.config['HOT_STORE_CAPACITY'] = int(os.environ.get('HOT_STORE_CAPACITY', 32))
+    app.config['HOT_STORE_GLOBAL_CAPACITY'] = int(os.environ.get('HOT_STORE_GLOBAL_CAPACITY', 1000))
+    app.config['HOT_STORE_MAX_KEYS'] = int(os.environ.get('HOT_STORE_MAX_KEYS', 10000))
+    app.config['HOT_STORE_WARMUP_HOURS'] = int(os.environ.get('HOT_STORE_WARMUP_HOURS', 48))
+    # Segundos entre lecturas de las filas escritas por otros procesos (0 = un solo proceso) e ids ya vistos que se releen
+    app.config['HOT_STORE_SYNC_SECONDS'] = float(os.environ.get('HOT_STORE_SYNC_SECONDS', 1))
+    app.config['HOT_STORE_SYNC_OVERLAP'] = int(os.environ.get('HOT_STORE_SYNC_OVERLAP', 200))
+    # Hilos que ejecutan las optimizaciones en segundo plano (/api/optimize/jobs)
+    app.config['OPTIMIZATION_WORKERS'] = int(os.environ.get('OPTIMIZATION_WORKERS', 2))
+    # Procesos que reparten la evaluación de poblaciones grandes de NSGA-II (0 = desactivado)
+    app.config['OPTIMIZATION_PROCESSES'] = int(os.environ.get('OPTIMIZATION_PROCESSES', 0))
+    # Caché de resultados de optimización por hash de las entradas
+    app.config['OPTIMIZATION_CACHE_SIZE'] = int(os.environ.get('OPTIMIZATION_CACHE_SIZE', 256))
+    app.config['OPTIMIZATION_CACHE_TTL'] = int(os.environ.get('OPTIMIZATION_CACHE_TTL', 6 * 3600))
+    app.config['OPTIMIZATION_WARM_START_TOLERANCE'] = float(os.environ.get('OPTIMIZATION_WARM_START_TOLERANCE', 0.05))
+    # Precarga de modelos al arrancar y revisión de artefactos nuevos (0 = sin recarga automática)
+    app.config['MODEL_PRELOAD'] = os.environ.get('MODEL_PRELOAD', 'true').lower() != 'false'
+    app.config['MODEL_RELOAD_CHECK_SECONDS'] = int(os.environ.get('MODEL_RELOAD_CHECK_SECONDS', 30))
+    # Agrupación de inferencias concurrentes de /api/predict/performance y /api/predict/anomalies
+    app.config['INFERENCE_MAX_BATCH_SIZE'] = int(os.environ.get('INFERENCE_MAX_BATCH_SIZE', 64))
+    app.config['INFERENCE_BATCH_WINDOW_MS'] = float(os.environ.get('INFERENCE_BATCH_WINDOW_MS', 2))
+    # Lecturas con (módulo/ubicación, timestamp) ya guardado: skip (omitir) o update (sobrescribir)
+    app.config['INGEST_ON_DUPLICATE'] = os.environ.get('INGEST_ON_DUPLICATE', 'skip')
+    # Escritura diferida de lecturas individuales con confirmación agrupada
+    app.config['WRITE_BEHIND_ENABLED'] = os.environ.get('WRITE_BEHIND_ENABLED', 'false').lower() == 'true'
+    app.config['WRITE_BEHIND_MAX_QUEUE'] = int(os.environ.get('WRITE_BEHIND_MAX_QUEUE', 10000))
+    app.config['WRITE_BEHIND_FLUSH_MS'] = int(os.environ.get('WRITE_BEHIND_FLUSH_MS', 200))
+    app.config['WRITE_BEHIND_FLUSH_ROWS'] = int(os.environ.get('WRITE_BEHIND_FLUSH_ROWS', 1000))
+    # Con la cola llena: block (esperar hasta el límite), reject (503) o sync (escribir en línea)
+    app.config['WRITE_BEHIND_BACKPRESSURE'] = os.environ.get('WRITE_BEHIND_BACKPRESSURE', 'block')
+    app.config['WRITE_BEHIND_BLOCK_TIMEOUT_MS'] = int(os.environ.get('WRITE_BEHIND_BLOCK_TIMEOUT_MS', 1000))
+    # Reintentos de un lote rechazado antes de aislar y descartar las lecturas que fallan
+    app.config['WRITE_BEHIND_MAX_RETRIES'] = int(os.environ.get('WRITE_BEHIND_MAX_RETRIES', 5))
+    # Registro local de solo anexado para no perder lecturas aceptadas (vacío = desactivado)
+    app.config['WRITE_BEHIND_LOG_DIR'] = os.environ.get('WRITE_BEHIND_LOG_DIR', '')
+    app.config['WRITE_BEHIND_FSYNC'] = os.environ.get('WRITE_BEHIND_FSYNC', 'false').lower() == 'true'
+    # Métricas del dashboard en memoria: reconciliación con la base de datos e instantáneas en SystemMetrics (0 = sin instantáneas)
+    app.config['DASHBOARD_RECONCILE_SECONDS'] = int(os.environ.get('DASHBOARD_RECONCILE_SECONDS', 60))
+    app.config['DASHBOARD_SNAPSHOT_SECONDS'] = int(os.environ.get('DASHBOARD_SNAPSHOT_SECONDS', 300))
+    # Canal Server-Sent Events (/api/stream): cola por suscriptor, eventos para reconexión y latido
+    app.config['EVENT_FEED_QUEUE_SIZE'] = int(os.environ.get('EVENT_FEED_QUEUE_SIZE', 1000))
+    app.config['EVENT_FEED_REPLAY_SIZE'] = int(os.environ.get('EVENT_FEED_REPLAY_SIZE', 1000))
+    app.config['EVENT_FEED_MAX_SUBSCRIBERS'] = int(os.environ.get('EVENT_FEED_MAX_SUBSCRIBERS', 200))
+    app.config['EVENT_FEED_HEARTBEAT_SECONDS'] = int(os.environ.get('EVENT_FEED_HEARTBEAT_SECONDS', 15))
+    # Retención por nivel en días (0 = conservar siempre): crudas, agregados, predicciones y anomalías cerradas
+    app.config['RETENTION_RAW_DAYS'] = int(os.environ.get('RETENTION_RAW_DAYS', 0))
+    app.config['RETENTION_1MIN_DAYS'] = int(os.environ.get('RETENTION_1MIN_DAYS', 0))
+    app.config['RETENTION_15MIN_DAYS'] = int(os.environ.get('RETENTION_15MIN_DAYS', 0))
+    app.config['RETENTION_1H_DAYS'] = int(os.environ.get('RETENTION_1H_DAYS', 0))
+    app.config['RETENTION_1D_DAYS'] = int(os.environ.get('RETENTION_1D_DAYS', 0))
+    app.config['RETENTION_PREDICTIONS_DAYS'] = int(os.environ.get('RETENTION_PREDICTIONS_DAYS', 0))
+    app.config['RETENTION_ANOMALIES_DAYS'] = int(os.environ.get('RETENTION_ANOMALIES_DAYS', 0))
+    app.config['RETENTION_BATCH_SIZE'] = int(os.environ.get('RETENTION_BATCH_SIZE', 5000))
+    app.config['RETENTION_BATCH_PAUSE_MS'] = int(os.environ.get('RETENTION_BATCH_PAUSE_MS', 50))
+    app.config['RETENTION_INTERVAL_SECONDS'] = int(os.environ.get('RETENTION_INTERVAL_SECONDS', 3600))
+    # Particionado mensual de las lecturas crudas (nativo en PostgreSQL, tablas por mes en SQLite)
+    app.config['TELEMETRY_PARTITIONING'] = os.environ.get('TELEMETRY_PARTITIONING', 'false').lower() == 'true'
+    app.config['PARTITION_PREMAKE_MONTHS'] = int(os.environ.get('PARTITION_PREMAKE_MONTHS', 3))
+    app.config['PARTITION_LIVE_MONTHS'] = int(os.environ.get('PARTITION_LIVE_MONTHS', 2))
+    app.config['PARTITION_BATCH_SIZE'] = int(os.environ.get('PARTITION_BATCH_SIZE', 5000))
+    app.config['PARTITION_MAINTENANCE_SECONDS'] = int(os.environ.get('PARTITION_MAINTENANCE_SECONDS', 3600))
+
+    # Comandos de línea de comandos (flask --app src.main import-data ...)
+    app.cli.add_command(import_data_command)
+    app.cli.add_command(upgrade_db_command)
+    app.cli.add_command(check_query_plans_command)
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(apply_retention_command)
+    app.cli.add_command(maintain_partitions_command)
+    app.cli.add_command(drop_partition_command)
+    app.cli.add_command(partition_tables_command)
+
+    # Iniciar los procesos de evaluación antes de crear cualquier hilo
+    init_evaluation_pool(app.config['OPTIMIZATION_PROCESSES'])
+    init_optimization_cache(app)
+
+    # Mantener los agregados por intervalo actualizados con cada ingesta
+    register_ingest_listener(update_rollups)
+    register_update_listener(refresh_rollups)
+
+    # Inicializar base de datos
+    prepare_database(app.config)
+    db.init_app(app)
+    init_engine(app)
+    check_schema(app)
+    init_hot_stores(app)
+    init_dashboard_metrics(app)
+    init_event_feed(app)
+    init_partitions(app)
+    init_retention(app)
+    init_streaming_detectors(app)
+    init_model_registry(app)
+    init_micro_batching(app, performance_batcher, anomaly_batcher)
+    init_write_behind(app)
+
+    @app.route('/api/health', methods=['GET'])
+    def health_check():
+        """Endpoint de verificación de salud"""
+        return jsonify({
+            'status': 'healthy',
+            'service': 'HelioSentinel Backend',
+            'version': '1.0.0',
+            'timestamp': db.func.now()
+        }), 200
+
+    @app.route('/api/info', methods=['GET'])
+    def get_system_info():
+        """Información del sistema HelioSentinel"""
+        return jsonify({
+            'name': 'HelioSentinel',
+            'description': 'Plataforma de IA para sistemas fotovoltaicos',
+            'version': '1.0.0',
+            'features': [
+                'Predicción de desempeño FV para climas tropicales',
+                'Detección temprana de anomalías y fallas',
+                'Optimización multiobjetivo de sistemas solares',
+                'Análisis de datos en tiempo real',
+                'Dashboards profesionales',
+                'Gemelo digital de sistemas fotovoltaicos'
             ],
-            'ai': [
-                '/api/predict/performance',
-                '/api/predict/anomalies',
-                '/api/optimize/multiobj'
+            'technologies': [
+                'Machine Learning',
+                'Deep Learning',
+                'XAI (Explainable AI)',
+                'Digital Twin',
+                'NSGA-II',
+                'Deep Q-Network'
             ],
-            'dashboard': [
-                '/api/dashboard/metrics',
-                '/api/charts/performance'
-            ]
-        }
-    }), 200
-
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
-def serve(path):
-    """Servir archivos estáticos del frontend"""
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
-        return jsonify({
-            'message': 'HelioSentinel Backend API',
-            'status': 'running',
-            'note': 'Frontend no configurado. Use /api/info para ver endpoints disponibles.'
+            'endpoints': {
+                'data': [
+                    '/api/data/solar',
+                    '/api/data/environmental',
+                    '/api/data/solar/batch',
+                    '/api/data/environmental/batch',
+                    '/api/data/latest',
+                    '/api/upload/csv',
+                    '/api/upload/xlsx',
+                    '/api/upload/parquet',
+                    '/api/export/range',
+                    '/api/import/jobs',
+                    '/api/ingest/metrics',
+                    '/api/retention',
+                    '/api/partitions',
+                    '/api/stream'
+                ],
+                'ai': [
+                    '/api/predict/performance',
+                    '/api/predict/performance/batch',
+                    '/api/predict/anomalies',
+                    '/api/anomalies/scan',
+                    '/api/anomalies/peers',
+                    '/api/optimize/multiobj',
+                    '/api/optimize/jobs',
+                    '/api/models/status',
+                    '/api/models/reload'
+                ],
+                'dashboard': [
+                    '/api/dashboard/metrics',
+                    '/api/dashboard/metrics/history',
+                    '/api/charts/performance'
+                ]
+            }
         }), 200
 
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
-        else:
+    @app.route('/', defaults={'path': ''})
+    @app.route('/<path:path>')
+    def serve(path):
+        """Servir archivos estáticos del frontend"""
+        static_folder_path = app.static_folder
+        if static_folder_path is None:
             return jsonify({
                 'message': 'HelioSentinel Backend API',
                 'status': 'running',
-                'note': 'Frontend no encontrado. Use /api/info para ver endpoints disponibles.'
+                'note': 'Frontend no configurado. Use /api/info para ver endpoints disponibles.'
             }), 200
 
-@app.errorhandler(404)
-def not_found(error):
-    """Manejador de errores 404"""
-    return jsonify({
-        'error': 'Endpoint no encontrado',
-        'message': 'Verifique la URL y método HTTP',
-        'available_endpoints': '/api/info'
-    }), 404
-
-@app.errorhandler(500)
-def internal_error(error):
-    """Manejador de errores 500"""
-    db.session.rollback()
-    return jsonify({
-        'error': 'Error interno del servidor',
-        'message': 'Contacte al administrador del sistema'
-    }), 500
+        if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
+            return send_from_directory(static_folder_path, path)
+        else:
+            index_path = os.path.join(static_folder_path, 'index.html')
+            if os.path.exists(index_path):
+                return send_from_directory(static_folder_path, 'index.html')
+            else:
+                return jsonify({
+                    'message': 'HelioSentinel Backend API',
+                    'status': 'running',
+                    'note': 'Frontend no encontrado. Use /api/info para ver endpoints disponibles.'
+                }), 200
+
+    @app.errorhandler(404)
+    def not_found(error):
+        """Manejador de errores 404"""
+        return jsonify({
+            'error': 'Endpoint no encontrado',
+            'message': 'Verifique la URL y método HTTP',
+            'available_endpoints': '/api/info'
+        }), 404
+
+    @app.errorhandler(500)
+    def internal_error(error):
+        """Manejador de errores 500"""
+        db.session.rollback()
+        return jsonify({
+            'error': 'Error interno del servidor',
+            'message': 'Contacte al administrador del sistema'
+        }), 500
+
+    return app
+
+
+# Los procesos hijos creados con 'spawn' (pool de importación) reimportan este
+# script como __mp_main__: en ellos no se construye la aplicación ni se
+# inician sus hilos y conexiones
+if __name__ != '__mp_main__':
+    app = create_app()
 
 if __name__ == '__main__':
     print("=== HelioSentinel Backend ===")
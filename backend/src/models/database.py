@@ -0,0 +1,167 @@
+"""
+Configuración del motor de base de datos - HelioSentinel
+
+La URL se toma de DATABASE_URL (por defecto, el archivo SQLite local).
+
+- PostgreSQL: pool de conexiones dimensionado por configuración, con
+  verificación previa (pre-ping) y reciclado de conexiones; con MVCC las
+  lecturas no bloquean las escrituras.
+- SQLite: cada conexión activa el modo WAL (los lectores leen una instantánea
+  y no bloquean al escritor), synchronous=NORMAL, memoria mapeada y un
+  busy_timeout para que las escrituras concurrentes esperen en lugar de
+  fallar con "database is locked".
+"""
+
+import os
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+from src.models.solar_data import db
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_OVERFLOW = 20
+DEFAULT_POOL_TIMEOUT = 30
+DEFAULT_POOL_RECYCLE = 1800
+DEFAULT_SQLITE_BUSY_TIMEOUT_MS = 5000
+DEFAULT_SQLITE_MMAP_MB = 256
+
+
+def database_uri(url, default_path):
+    """
+    URL de SQLAlchemy a partir de DATABASE_URL.
+
+    Sin URL se usa el archivo SQLite default_path; el esquema heredado
+    postgres:// se normaliza a postgresql://.
+    """
+    if not url:
+        return f'sqlite:///{default_path}'
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def _sqlite_file(url):
+    """Ruta del archivo SQLite (None si la base está en memoria)"""
+    database = url.database
+    if not database or database == ':memory:' or database.startswith('file::memory:'):
+        return None
+    return database
+
+
+def engine_options(config):
+    """
+    Opciones de create_engine (SQLALCHEMY_ENGINE_OPTIONS) según el dialecto.
+
+    Returns:
+        dict: Tamaño del pool y, en PostgreSQL, pre-ping y reciclado
+    """
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite' and _sqlite_file(url) is None:
+        # Las bases en memoria usan un pool de una sola conexión
+        return {}
+    options = {
+        'pool_size': config.get('DB_POOL_SIZE', DEFAULT_POOL_SIZE),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', DEFAULT_MAX_OVERFLOW),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', DEFAULT_POOL_TIMEOUT)
+    }
+    if url.get_backend_name() != 'sqlite':
+        options['pool_pre_ping'] = True
+        options['pool_recycle'] = config.get('DB_POOL_RECYCLE', DEFAULT_POOL_RECYCLE)
+    return options
+
+
+def prepare_database(config):
+    """Crear el directorio del archivo SQLite si no existe"""
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    path = _sqlite_file(url) if url.get_backend_name() == 'sqlite' else None
+    if path and os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+
+class PoolMonitor:
+    """Contadores del pool de conexiones a partir de sus eventos"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.max_overflow = 0
+        self.sqlite_pragmas = None
+        self.journal_mode = None
+        self._stats = {'connects': 0, 'checkouts': 0, 'invalidations': 0, 'peak_checked_out': 0}
+        self._engine = None
+
+    def attach(self, engine, max_overflow=0, sqlite_pragmas=None):
+        """Registrar los listeners del pool y, en SQLite, los PRAGMA por conexión"""
+        self._engine = engine
+        self.max_overflow = max_overflow
+        self.sqlite_pragmas = sqlite_pragmas
+        event.listen(engine, 'connect', self._on_connect)
+        event.listen(engine, 'checkout', self._on_checkout)
+        event.listen(engine, 'invalidate', self._on_invalidate)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        if self.sqlite_pragmas is not None:
+            cursor = dbapi_connection.cursor()
+            try:
+                self.journal_mode = cursor.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+                for name, value in self.sqlite_pragmas.items():
+                    cursor.execute(f'PRAGMA {name}={value}')
+            finally:
+                cursor.close()
+        with self._lock:
+            self._stats['connects'] += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        pool = self._engine.pool
+        checked_out = pool.checkedout() if isinstance(pool, QueuePool) else 0
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._stats['peak_checked_out'] = max(self._stats['peak_checked_out'], checked_out)
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        """Ocupación actual del pool y contadores acumulados"""
+        if self._engine is None:
+            return {}
+        pool = self._engine.pool
+        with self._lock:
+            stats = {'dialect': self._engine.dialect.name, 'pool': type(pool).__name__, **self._stats}
+        if isinstance(pool, QueuePool):
+            capacity = pool.size() + self.max_overflow
+            stats.update({
+                'size': pool.size(),
+                'max_overflow': self.max_overflow,
+                'checked_out': pool.checkedout(),
+                'checked_in': pool.checkedin(),
+                'overflow': max(0, pool.overflow()),
+                'utilization': round(pool.checkedout() / capacity, 3) if capacity else None
+            })
+        if self.sqlite_pragmas is not None:
+            stats['sqlite'] = {'journal_mode': self.journal_mode, **self.sqlite_pragmas}
+        return stats
+
+
+pool_monitor = PoolMonitor()
+
+
+def init_engine(app):
+    """Registrar los PRAGMA de SQLite y las estadísticas del pool (tras db.init_app)"""
+    with app.app_context():
+        engine = db.engine
+    sqlite_pragmas = None
+    if engine.dialect.name == 'sqlite' and _sqlite_file(engine.url) is not None:
+        sqlite_pragmas = {
+            'synchronous': 'NORMAL',
+            'busy_timeout': app.config.get('SQLITE_BUSY_TIMEOUT_MS', DEFAULT_SQLITE_BUSY_TIMEOUT_MS),
+            'mmap_size': app.config.get('SQLITE_MMAP_MB', DEFAULT_SQLITE_MMAP_MB) * 1024 * 1024
+        }
+    pool_monitor.attach(
+        engine,
+        max_overflow=app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}).get('max_overflow', 0),
+        sqlite_pragmas=sqlite_pragmas
+    )
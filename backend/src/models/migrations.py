@@ -0,0 +1,255 @@
+"""
+Migraciones de esquema idempotentes - HelioSentinel
+
+db.create_all() solo crea las tablas que no existen; estas migraciones
+aplican sobre bases de datos existentes los cambios añadidos después
+(índices, restricciones, tablas auxiliares, depuración de duplicados).
+"""
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import delete, func, inspect, select
+
+from src.models.solar_data import db, SolarModuleData, EnvironmentalData
+
+
+def create_missing_indexes(engine, exclude=()):
+    """
+    Crear los índices declarados en los modelos que aún no existen.
+
+    Args:
+        exclude (iterable): Nombres de índices que no se deben crear todavía
+
+    Returns:
+        list: Nombres de los índices creados
+    """
+    inspector = inspect(engine)
+    created = []
+
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing and index.name not in exclude:
+                index.create(bind=engine)
+                created.append(index.name)
+
+    return created
+
+
+# Índices no únicos reemplazados por las claves naturales únicas
+LEGACY_INDEXES = {
+    SolarModuleData.__tablename__: 'ix_solar_modules_data_module_timestamp',
+    EnvironmentalData.__tablename__: 'ix_environmental_data_location_timestamp'
+}
+
+# Columnas de la clave natural de las lecturas crudas
+NATURAL_KEYS = {
+    SolarModuleData: ('module_id', 'timestamp'),
+    EnvironmentalData: ('location_id', 'timestamp')
+}
+
+
+def _natural_key_index(model):
+    """Índice único de la clave natural de una tabla de lecturas crudas"""
+    return next(index for index in model.__table__.indexes if index.unique)
+
+
+def missing_natural_keys(engine):
+    """
+    Tablas de lecturas crudas existentes sin el índice único de su clave natural.
+
+    Returns:
+        list: Nombres de las tablas (su índice requiere depurar duplicados)
+    """
+    inspector = inspect(engine)
+    missing = []
+    for model in NATURAL_KEYS:
+        table = model.__table__
+        if not inspector.has_table(table.name):
+            continue
+        indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        if _natural_key_index(model).name not in indexes:
+            missing.append(table.name)
+    return missing
+
+
+def rollups_to_backfill():
+    """
+    Tipos de datos con lecturas crudas que no cuentan en sus agregados diarios
+    (tablas de agregados creadas sobre datos existentes).
+
+    Returns:
+        list: Tipos de datos ('solar', 'environmental')
+    """
+    from src.services.partitions import partitions
+    from src.services.rollups import ROLLUP_SPECS, RESOLUTIONS
+
+    pending = []
+    for data_type, spec in ROLLUP_SPECS.items():
+        raw = sum(
+            db.session.execute(select(func.count()).select_from(table)).scalar()
+            for table in partitions.sources(data_type)
+        )
+        model = spec['model']
+        rolled = db.session.execute(
+            select(func.coalesce(func.sum(model.count), 0)).where(model.resolution == RESOLUTIONS[-1][0])
+        ).scalar()
+        if raw > rolled:
+            pending.append(data_type)
+    return pending
+
+
+def deduplicate_readings(engine):
+    """
+    Eliminar lecturas duplicadas por clave natural antes de crear los índices únicos.
+
+    Se conserva la lectura más antigua (menor id) de cada clave y se elimina el
+    índice no único anterior.
+
+    Returns:
+        dict: Lecturas eliminadas por tabla
+    """
+    inspector = inspect(engine)
+    removed = {}
+
+    for model, key in NATURAL_KEYS.items():
+        table = model.__table__
+        if not inspector.has_table(table.name):
+            continue
+        indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        if _natural_key_index(model).name in indexes:
+            continue
+
+        keep = select(func.min(table.c.id)).group_by(*[table.c[column] for column in key])
+        result = db.session.execute(delete(table).where(table.c.id.not_in(keep)))
+        if LEGACY_INDEXES[table.name] in indexes:
+            db.session.execute(db.text(f'DROP INDEX {LEGACY_INDEXES[table.name]}'))
+        db.session.commit()
+        removed[table.name] = result.rowcount
+
+    return removed
+
+
+def create_missing_schema(natural_keys=False):
+    """
+    Crear las tablas y los índices que faltan sin modificar datos existentes.
+
+    Args:
+        natural_keys (bool): Crear también los índices únicos de clave natural
+            de tablas existentes (requiere depurar antes los duplicados)
+
+    Returns:
+        dict: Tablas particionadas e índices creados
+    """
+    from src.services.partitions import create_partitioned_tables
+
+    partitioned = create_partitioned_tables()
+    db.create_all()
+    missing = [] if natural_keys else missing_natural_keys(db.engine)
+    pending_keys = {
+        _natural_key_index(model).name for model in NATURAL_KEYS if model.__tablename__ in missing
+    }
+    return {
+        'partitioned_tables': partitioned,
+        'indexes_created': create_missing_indexes(db.engine, exclude=pending_keys)
+    }
+
+
+def upgrade_schema():
+    """
+    Aplicar todas las migraciones pendientes.
+
+    Returns:
+        dict: Resumen de los cambios aplicados
+    """
+    from src.services.ingestion import set_missing_natural_keys
+    from src.services.rollups import rebuild_rollups
+
+    duplicates_removed = deduplicate_readings(db.engine)
+    summary = {'duplicates_removed': duplicates_removed, **create_missing_schema(natural_keys=True)}
+    set_missing_natural_keys(missing_natural_keys(db.engine))
+
+    # Poblar los agregados cuando sus tablas se crearon sobre datos existentes
+    # o cuando contaban lecturas duplicadas que se acaban de eliminar
+    if rollups_to_backfill() or any(duplicates_removed.values()):
+        summary['rollups_rebuilt'] = rebuild_rollups()
+
+    return summary
+
+
+def pending_migrations(engine):
+    """
+    Cambios de esquema pendientes, sin aplicar ninguno.
+
+    Un índice único de clave natural pendiente implica además depurar las
+    lecturas duplicadas.
+
+    Returns:
+        list: Tablas e índices que faltan (vacía si el esquema está al día)
+    """
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    pending = []
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            pending.append(f'tabla {table.name}')
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        pending += [f'índice {index.name}' for index in table.indexes if index.name not in existing]
+
+    return pending
+
+
+def check_schema(app):
+    """
+    Preparar el esquema al arrancar.
+
+    Se crean las tablas y los índices que faltan (una base vacía queda
+    completa); la depuración de duplicados, sus índices únicos y el cálculo
+    de agregados sobre datos existentes solo se ejecutan con `flask upgrade-db`.
+    Mientras tanto la ingesta descarta las claves existentes antes de insertar
+    en lugar de usar ON CONFLICT.
+
+    Returns:
+        list: Cambios pendientes
+    """
+    from src.services.ingestion import set_missing_natural_keys
+    from src.services.rollups import ROLLUP_SPECS
+
+    with app.app_context():
+        tables = set(inspect(db.engine).get_table_names())
+        create_missing_schema()
+        set_missing_natural_keys(missing_natural_keys(db.engine))
+        pending = pending_migrations(db.engine)
+        if tables:
+            # Tablas de agregados nuevas sobre lecturas existentes: quedan vacías
+            pending += [
+                f'agregados {data_type}' for data_type, spec in ROLLUP_SPECS.items()
+                if spec['model'].__tablename__ not in tables
+                and spec['source'].__tablename__ in tables
+            ]
+    if pending:
+        app.logger.warning(
+            'Esquema de base de datos desactualizado (%s); ejecute `flask upgrade-db`',
+            ', '.join(pending)
+        )
+    return pending
+
+
+@click.command('upgrade-db')
+@with_appcontext
+def upgrade_db_command():
+    """Aplicar las migraciones de esquema pendientes."""
+    summary = upgrade_schema()
+    for table, removed in summary['duplicates_removed'].items():
+        click.echo(f'Lecturas duplicadas eliminadas en {table}: {removed}')
+    for data_type in summary['partitioned_tables']:
+        click.echo(f'Tabla particionada creada: {data_type}')
+    for name in summary['indexes_created']:
+        click.echo(f'Índice creado: {name}')
+    for data_type, total in summary.get('rollups_rebuilt', {}).items():
+        click.echo(f'Agregados {data_type}: {total} lecturas')
+    click.echo('Esquema actualizado')
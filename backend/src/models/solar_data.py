@@ -11,6 +11,11 @@ db = SQLAlchemy()
 class SolarModuleData(db.Model):
     """Modelo para datos de módulos solares"""
     __tablename__ = 'solar_modules_data'
+    __table_args__ = (
+        # Clave natural: una lectura por módulo e instante
+        db.Index('uq_solar_modules_data_module_timestamp', 'module_id', 'timestamp', unique=True),
+        db.Index('ix_solar_modules_data_timestamp', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -50,6 +55,11 @@ class SolarModuleData(db.Model):
 class EnvironmentalData(db.Model):
     """Modelo para datos ambientales"""
     __tablename__ = 'environmental_data'
+    __table_args__ = (
+        # Clave natural: una lectura por ubicación e instante
+        db.Index('uq_environmental_data_location_timestamp', 'location_id', 'timestamp', unique=True),
+        db.Index('ix_environmental_data_timestamp', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -85,6 +95,10 @@ class EnvironmentalData(db.Model):
 class PredictionResult(db.Model):
     """Modelo para resultados de predicciones"""
     __tablename__ = 'predictions'
+    __table_args__ = (
+        db.Index('ix_predictions_model_type_timestamp', 'model_type', 'timestamp'),
+        db.Index('ix_predictions_timestamp', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -126,6 +140,11 @@ class PredictionResult(db.Model):
 class AnomalyDetection(db.Model):
     """Modelo para detecciones de anomalías"""
     __tablename__ = 'anomalies'
+    __table_args__ = (
+        db.Index('ix_anomalies_status_severity_timestamp', 'status', 'severity_level', 'timestamp'),
+        db.Index('ix_anomalies_status_timestamp', 'status', 'timestamp'),
+        db.Index('ix_anomalies_module_timestamp', 'module_id', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -220,6 +239,9 @@ class OptimizationResult(db.Model):
 class SystemMetrics(db.Model):
     """Modelo para métricas del sistema"""
     __tablename__ = 'system_metrics'
+    __table_args__ = (
+        db.Index('ix_system_metrics_timestamp', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -261,3 +283,146 @@ class SystemMetrics(db.Model):
             'created_at': self.created_at.isoformat()
         }
 
+
+
+class SolarRollup(db.Model):
+    """Modelo para agregados de módulos solares por intervalo de tiempo"""
+    __tablename__ = 'solar_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('resolution', 'module_id', 'bucket_start', name='uq_solar_rollups_bucket'),
+        db.Index('ix_solar_rollups_resolution_bucket', 'resolution', 'bucket_start'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    resolution = db.Column(db.String(10), nullable=False)       # '1min', '15min', '1h', '1d'
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    module_id = db.Column(db.String(50), nullable=False)
+    
+    # Agregados
+    count = db.Column(db.Integer, nullable=False, default=0)
+    power_sum = db.Column(db.Float, nullable=False, default=0)
+    power_min = db.Column(db.Float, nullable=True)
+    power_max = db.Column(db.Float, nullable=True)
+    efficiency_sum = db.Column(db.Float, nullable=False, default=0)
+    efficiency_min = db.Column(db.Float, nullable=True)
+    efficiency_max = db.Column(db.Float, nullable=True)
+    temperature_sum = db.Column(db.Float, nullable=False, default=0)
+    temperature_min = db.Column(db.Float, nullable=True)
+    temperature_max = db.Column(db.Float, nullable=True)
+    
+    def to_dict(self):
+        """Convertir a diccionario"""
+        return {
+            'id': self.id,
+            'resolution': self.resolution,
+            'bucket_start': self.bucket_start.isoformat(),
+            'module_id': self.module_id,
+            'count': self.count,
+            'power': {
+                'sum': self.power_sum,
+                'min': self.power_min,
+                'max': self.power_max,
+                'mean': self.power_sum / self.count if self.count else None
+            },
+            'efficiency': {
+                'min': self.efficiency_min,
+                'max': self.efficiency_max,
+                'mean': self.efficiency_sum / self.count if self.count else None
+            },
+            'temperature': {
+                'min': self.temperature_min,
+                'max': self.temperature_max,
+                'mean': self.temperature_sum / self.count if self.count else None
+            }
+        }
+
+
+class EnvironmentalRollup(db.Model):
+    """Modelo para agregados ambientales por intervalo de tiempo"""
+    __tablename__ = 'environmental_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('resolution', 'location_id', 'bucket_start', name='uq_environmental_rollups_bucket'),
+        db.Index('ix_environmental_rollups_resolution_bucket', 'resolution', 'bucket_start'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    resolution = db.Column(db.String(10), nullable=False)       # '1min', '15min', '1h', '1d'
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    location_id = db.Column(db.String(50), nullable=False)
+    
+    # Agregados
+    count = db.Column(db.Integer, nullable=False, default=0)
+    temperature_sum = db.Column(db.Float, nullable=False, default=0)
+    temperature_min = db.Column(db.Float, nullable=True)
+    temperature_max = db.Column(db.Float, nullable=True)
+    irradiance_sum = db.Column(db.Float, nullable=False, default=0)
+    irradiance_min = db.Column(db.Float, nullable=True)
+    irradiance_max = db.Column(db.Float, nullable=True)
+    humidity_sum = db.Column(db.Float, nullable=False, default=0)
+    humidity_min = db.Column(db.Float, nullable=True)
+    humidity_max = db.Column(db.Float, nullable=True)
+    
+    def to_dict(self):
+        """Convertir a diccionario"""
+        return {
+            'id': self.id,
+            'resolution': self.resolution,
+            'bucket_start': self.bucket_start.isoformat(),
+            'location_id': self.location_id,
+            'count': self.count,
+            'temperature': {
+                'min': self.temperature_min,
+                'max': self.temperature_max,
+                'mean': self.temperature_sum / self.count if self.count else None
+            },
+            'irradiance': {
+                'min': self.irradiance_min,
+                'max': self.irradiance_max,
+                'mean': self.irradiance_sum / self.count if self.count else None
+            },
+            'humidity': {
+                'min': self.humidity_min,
+                'max': self.humidity_max,
+                'mean': self.humidity_sum / self.count if self.count else None
+            }
+        }
+
+
+class DetectorState(db.Model):
+    """Modelo para el estado de los detectores incrementales por módulo y métrica"""
+    __tablename__ = 'detector_states'
+    __table_args__ = (
+        db.UniqueConstraint('module_id', 'metric', name='uq_detector_states_module_metric'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    module_id = db.Column(db.String(50), nullable=False)
+    metric = db.Column(db.String(50), nullable=False)           # Columna vigilada
+    
+    # Estado EWMA / CUSUM (mean y variance: referencia aprendida)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    mean = db.Column(db.Float, nullable=True)
+    variance = db.Column(db.Float, nullable=True)
+    level = db.Column(db.Float, nullable=True)                  # EWMA del valor actual
+    cusum_low = db.Column(db.Float, nullable=False, default=0)
+    last_value = db.Column(db.Float, nullable=True)
+    last_timestamp = db.Column(db.DateTime, nullable=True)
+    last_alarm_at = db.Column(db.DateTime, nullable=True)
+    
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        """Convertir a diccionario"""
+        return {
+            'module_id': self.module_id,
+            'metric': self.metric,
+            'count': self.count,
+            'mean': self.mean,
+            'variance': self.variance,
+            'level': self.level,
+            'cusum_low': self.cusum_low,
+            'last_value': self.last_value,
+            'last_timestamp': self.last_timestamp.isoformat() if self.last_timestamp else None,
+            'last_alarm_at': self.last_alarm_at.isoformat() if self.last_alarm_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
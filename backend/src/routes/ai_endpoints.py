@@ -2,12 +2,34 @@
 Endpoints para IA y predicciones - HelioSentinel
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from datetime import datetime, timedelta
 from src.models.solar_data import (
     db, SolarModuleData, EnvironmentalData, 
     PredictionResult, AnomalyDetection, OptimizationResult
 )
+from src.services.ingestion import MAX_REPORTED_ERRORS
+from src.services.anomaly_scan import (
+    scan_window, start_scan_job, get_scan_job, active_anomalies_statement
+)
+from src.services.streaming_detectors import streaming_detectors
+from src.services.peer_comparison import (
+    DEFAULT_RESOLUTION_MINUTES, DEFAULT_Z_THRESHOLD, DEFAULT_MIN_FRACTION,
+    detect_peer_anomalies
+)
+from src.services.nsga2 import PopulationOptimizer
+from src.services.optimization_cache import optimization_cache
+from src.services.model_registry import model_registry, load_artifact
+from src.services.optimization import (
+    DEFAULT_POPULATION_SIZE, DEFAULT_GENERATIONS, MAX_POPULATION_SIZE, MAX_GENERATIONS,
+    optimize_and_save, format_optimization, submit_optimization_job,
+    get_optimization_job, cancel_optimization_job
+)
+from src.services.micro_batching import MicroBatcher
+from src.services.predictions import (
+    MAX_PREDICTION_ROWS, FEATURES as PREDICTION_FEATURES, BATCH_PREDICT_FLAG, parse_conditions,
+    validate_conditions, predict_batch, save_predictions, prediction_history_statement
+)
 import pandas as pd
 import numpy as np
 import json
@@ -20,59 +42,166 @@ sys.path.append(models_path)
 
 ai_bp = Blueprint('ai', __name__)
 
-# Variables globales para modelos (se cargarán bajo demanda)
-performance_predictor = None
-anomaly_detector = None
-multi_objective_optimizer = None
+# Condiciones de prueba para calentar los modelos al cargarlos
+WARMUP_CONDITIONS = {
+    'irradiance': 800.0, 'ambient_temp': 30.0, 'cell_temp': 50.0, 'humidity': 75.0,
+    'wind_speed': 2.5, 'cloudiness': 0.0, 'precipitation': 0.0
+}
+WARMUP_MODULE_DATA = {
+    'voltage_oc': 45.0, 'voltage_mp': 37.0, 'current_mp': 8.5, 'current_sc': 9.0,
+    'power_max': 315.0, 'efficiency': 0.19, 'cell_temp': 50.0, 'ambient_temp': 25.0,
+    'irradiance': 1000.0, 'humidity': 50.0, 'wind_speed': 2.0, 'age_days': 365.0
+}
 
-def load_performance_predictor():
+def _load_performance_predictor(artifact):
     """Cargar modelo de predicción de desempeño"""
-    global performance_predictor
-    if performance_predictor is None:
-        try:
-            from performance_predictor import TropicalPVPerformancePredictor
-            performance_predictor = TropicalPVPerformancePredictor()
-            # Intentar cargar modelo pre-entrenado
-            try:
-                performance_predictor.load_model(os.path.join(models_path, 'tropical_pv_predictor'))
-            except:
-                # Si no existe modelo pre-entrenado, crear uno básico
-                print("Modelo de predicción no encontrado, usando configuración por defecto")
-        except Exception as e:
-            print(f"Error cargando predictor: {e}")
-    return performance_predictor
+    from performance_predictor import TropicalPVPerformancePredictor
+    predictor = TropicalPVPerformancePredictor()
+    # Intentar cargar modelo pre-entrenado
+    try:
+        load_artifact(predictor, artifact)
+    except Exception:
+        # Si no existe modelo pre-entrenado, usar la configuración básica
+        print("Modelo de predicción no encontrado, usando configuración por defecto")
+    return predictor
 
-def load_anomaly_detector():
+def _warm_up_predictor(predictor):
+    if hasattr(predictor, 'predict_single'):
+        predictor.predict_single(dict(WARMUP_CONDITIONS))
+    elif hasattr(predictor, 'predict'):
+        predictor.predict(pd.DataFrame([WARMUP_CONDITIONS]))
+
+def _load_anomaly_detector(artifact):
     """Cargar detector de anomalías"""
-    global anomaly_detector
-    if anomaly_detector is None:
-        try:
-            from anomaly_detector import SolarAnomalyDetector
-            anomaly_detector = SolarAnomalyDetector()
-            # Intentar cargar modelo pre-entrenado
-            try:
-                anomaly_detector.load_model(os.path.join(models_path, 'solar_anomaly_detector'))
-            except:
-                print("Detector de anomalías no encontrado, usando configuración por defecto")
-        except Exception as e:
-            print(f"Error cargando detector: {e}")
-    return anomaly_detector
+    from anomaly_detector import SolarAnomalyDetector
+    detector = SolarAnomalyDetector()
+    # Intentar cargar modelo pre-entrenado
+    try:
+        load_artifact(detector, artifact)
+    except Exception:
+        print("Detector de anomalías no encontrado, usando configuración por defecto")
+    return detector
 
-def load_optimizer():
+def _warm_up_detector(detector):
+    if hasattr(detector, 'detect_anomalies'):
+        detector.detect_anomalies(pd.DataFrame([WARMUP_MODULE_DATA]))
+
+def _load_optimizer(artifact):
     """Cargar optimizador multiobjetivo"""
-    global multi_objective_optimizer
-    if multi_objective_optimizer is None:
-        try:
-            from multi_objective_optimizer import MultiObjectivePVOptimizer
-            multi_objective_optimizer = MultiObjectivePVOptimizer()
-            # Intentar cargar modelo pre-entrenado
-            try:
-                multi_objective_optimizer.load_model(os.path.join(models_path, 'multi_objective_optimizer'))
-            except:
-                print("Optimizador no encontrado, usando configuración por defecto")
-        except Exception as e:
-            print(f"Error cargando optimizador: {e}")
-    return multi_objective_optimizer
+    try:
+        from multi_objective_optimizer import MultiObjectivePVOptimizer
+    except ImportError:
+        # Sin el paquete de modelos se usa el motor NSGA-II vectorizado del backend
+        return PopulationOptimizer()
+    optimizer = MultiObjectivePVOptimizer()
+    # Intentar cargar modelo pre-entrenado
+    try:
+        load_artifact(optimizer, artifact)
+    except Exception:
+        print("Optimizador no encontrado, usando configuración por defecto")
+    return optimizer
+
+def _warm_up_optimizer(optimizer):
+    # Solo el motor vectorizado tiene una evaluación barata de prueba
+    if isinstance(optimizer, PopulationOptimizer):
+        environment = pd.DataFrame([{
+            'ambient_temperature': WARMUP_CONDITIONS['ambient_temp'],
+            'irradiance': WARMUP_CONDITIONS['irradiance']
+        }])
+        optimizer.optimize_configuration(environment, 'monocrystalline', population_size=4, generations=1)
+
+model_registry.models_path = models_path
+model_registry.register(
+    'performance_predictor', _load_performance_predictor, 'tropical_pv_predictor',
+    warmup=_warm_up_predictor, model_type='Tropical PV Performance Predictor',
+    description='Predicción de desempeño para climas tropicales'
+)
+model_registry.register(
+    'anomaly_detector', _load_anomaly_detector, 'solar_anomaly_detector',
+    warmup=_warm_up_detector, model_type='Solar Anomaly Detector',
+    description='Detección de anomalías y fallas en módulos solares'
+)
+model_registry.register(
+    'multi_objective_optimizer', _load_optimizer, 'multi_objective_optimizer',
+    warmup=_warm_up_optimizer, model_type='Multi-Objective PV Optimizer',
+    description='Optimización multiobjetivo de sistemas fotovoltaicos'
+)
+
+def _predict_performance(conditions, predictor):
+    """
+    Evaluar una lista de condiciones con predict_batch.
+
+    Returns:
+        list: (potencia, confianza, factores o None) por condición
+    """
+    power, confidence, factors = predict_batch(
+        pd.DataFrame(conditions, columns=PREDICTION_FEATURES), predictor
+    )
+    return [
+        (float(value), confidence,
+         None if factors is None else {name: float(values[position]) for name, values in factors.items()})
+        for position, value in enumerate(power)
+    ]
+
+def _predict_performance_batch(conditions):
+    """Invocar el predict de un modelo BATCH_PREDICT una sola vez para todo el lote"""
+    return _predict_performance(conditions, load_performance_predictor())
+
+def _detect_anomalies_batch(entries):
+    """
+    Invocar el detector una sola vez para todos los módulos del lote.
+
+    Args:
+        entries (list): (module_id, datos del módulo) por petición
+
+    Con un resultado por módulo se asignan en orden. Si el detector devuelve
+    menos (p. ej. solo las filas anómalas), cada resultado se asigna por su
+    índice en el DataFrame de entrada o por su module_id, y los módulos sin
+    resultado reciben None ("sin anomalía"), como en la llamada individual.
+
+    Raises:
+        ValueError: Si un resultado no se puede asignar a su módulo
+    """
+    detector = load_anomaly_detector()
+    results = detector.detect_anomalies(pd.DataFrame([module for _, module in entries]))
+    if results is None:
+        return [None] * len(entries)
+    if isinstance(results, pd.DataFrame):
+        positions = list(results.index)
+        results = results.to_dict('records')
+    else:
+        results = list(results)
+        positions = [result.get('index') if isinstance(result, dict) else None for result in results]
+    if len(results) == len(entries):
+        return results
+
+    by_module = {}
+    for position, (module_id, _) in enumerate(entries):
+        by_module.setdefault(module_id, []).append(position)
+    matched = [None] * len(entries)
+    for position, result in zip(positions, results):
+        if not isinstance(position, (int, np.integer)) or not 0 <= position < len(entries):
+            candidates = by_module.get(result.get('module_id')) if isinstance(result, dict) else None
+            if not candidates:
+                raise ValueError('El detector devolvió un resultado sin índice ni module_id de entrada')
+            position = candidates.pop(0)
+        matched[position] = result
+    return matched
+
+performance_batcher = MicroBatcher('performance', _predict_performance_batch)
+anomaly_batcher = MicroBatcher('anomalies', _detect_anomalies_batch)
+
+def load_performance_predictor():
+    """Modelo de predicción de desempeño del registro"""
+    return model_registry.get('performance_predictor')
+
+def load_anomaly_detector():
+    """Detector de anomalías del registro"""
+    return model_registry.get('anomaly_detector')
+
+def load_optimizer():
+    """Optimizador multiobjetivo del registro"""
+    return model_registry.get('multi_objective_optimizer')
 
 @ai_bp.route('/predict/performance', methods=['POST'])
 def predict_performance():
@@ -107,19 +236,13 @@ def predict_performance():
         
         # Realizar predicción
         try:
-            if hasattr(predictor, 'predict_single'):
-                prediction = predictor.predict_single(features)
-                confidence = 0.85  # Confianza por defecto
+            if getattr(predictor, BATCH_PREDICT_FLAG, False):
+                # Agrupada con las peticiones concurrentes en una sola llamada a predict
+                prediction, confidence, factors = performance_batcher.submit(features)
             else:
-                # Predicción simplificada basada en modelo físico
-                base_power = 300  # Potencia nominal en W
-                irradiance_factor = features['irradiance'] / 1000
-                temp_factor = 1 - 0.004 * (features['cell_temp'] - 25)
-                humidity_factor = 1 - features['humidity'] / 100 * 0.1
-                cloud_factor = 1 - features['cloudiness'] / 100 * 0.8
-                
-                prediction = base_power * irradiance_factor * temp_factor * humidity_factor * cloud_factor
-                confidence = 0.75
+                # predict_single es una llamada por condición y el modelo físico es
+                # inmediato: agruparlas solo añadiría la espera de la cola
+                [(prediction, confidence, factors)] = _predict_performance([features], predictor)
             
             # Guardar resultado
             prediction_result = PredictionResult(
@@ -133,11 +256,7 @@ def predict_performance():
             prediction_result.set_prediction_result({
                 'predicted_power': float(prediction),
                 'confidence': confidence,
-                'factors': {
-                    'irradiance_factor': irradiance_factor,
-                    'temperature_factor': temp_factor if 'temp_factor' in locals() else 1.0,
-                    'humidity_factor': humidity_factor if 'humidity_factor' in locals() else 1.0
-                }
+                'factors': factors
             })
             
             db.session.add(prediction_result)
@@ -161,6 +280,67 @@ def predict_performance():
         return jsonify({'error': str(e)}), 500
 
 
+@ai_bp.route('/predict/performance/batch', methods=['POST'])
+def predict_performance_batch():
+    """Predicción de desempeño para una matriz de condiciones o series por módulo"""
+    try:
+        data = request.get_json()
+
+        try:
+            conditions = parse_conditions(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if len(conditions) == 0:
+            return jsonify({'error': 'No se recibieron condiciones'}), 400
+
+        if len(conditions) > MAX_PREDICTION_ROWS:
+            return jsonify({
+                'error': f'El lote excede el máximo de {MAX_PREDICTION_ROWS} condiciones'
+            }), 413
+
+        features, errors = validate_conditions(conditions)
+        if errors:
+            return jsonify({
+                'error': 'Condiciones inválidas',
+                'errors': errors[:MAX_REPORTED_ERRORS],
+                'total_errors': len(errors)
+            }), 400
+
+        # Guardar resultados salvo que se indique persist=false
+        persist = str(request.args.get('persist', data.get('persist', True))).lower() not in ('false', '0', 'no')
+
+        try:
+            power, confidence, factors = predict_batch(features, load_performance_predictor())
+
+            prediction_ids = None
+            if persist:
+                prediction_ids = save_predictions(features, power, confidence, factors, conditions)
+                db.session.commit()
+
+            keys = [key for key in ('module_id', 'location_id', 'timestamp') if key in conditions.columns]
+            predictions = conditions[keys].astype(object).where(conditions[keys].notna(), None).to_dict('records')
+            for prediction, value in zip(predictions, np.round(power, 2).tolist()):
+                prediction['predicted_power'] = value
+
+            return jsonify({
+                'predictions': predictions,
+                'count': len(predictions),
+                'confidence': round(confidence, 3),
+                'unit': 'W',
+                'persisted': persist,
+                'prediction_ids': prediction_ids,
+                'timestamp': datetime.utcnow().isoformat()
+            }), 200
+
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': f'Error en predicción: {str(e)}'}), 500
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @ai_bp.route('/predict/anomalies', methods=['POST'])
 def detect_anomalies():
     """Detección de anomalías en tiempo real"""
@@ -198,13 +378,10 @@ def detect_anomalies():
             'age_days': float(data.get('age_days', 365))
         }
         
-        # Crear DataFrame para detección
-        df = pd.DataFrame([module_data])
-        
         try:
             if hasattr(detector, 'detect_anomalies'):
-                results = detector.detect_anomalies(df)
-                result = results[0] if results else None
+                # Agrupada con las peticiones concurrentes en una sola llamada al modelo
+                result = anomaly_batcher.submit((data['module_id'], module_data))
             else:
                 # Detección simplificada basada en reglas
                 result = {
@@ -324,84 +501,13 @@ def multi_objective_optimization():
         location_id = data.get('location_id', 'default')
         
         try:
-            if hasattr(optimizer, 'optimize_configuration'):
-                # Optimización completa
-                pareto_front = optimizer.optimize_configuration(
-                    env_data, technology=technology,
-                    population_size=20, generations=10  # Reducido para respuesta rápida
-                )
-                
-                if pareto_front:
-                    best_solution = max(pareto_front, key=lambda x: sum(x['objectives']))
-                    optimal_config = best_solution['parameters']
-                    objectives = best_solution['objectives']
-                else:
-                    raise Exception("No se encontraron soluciones óptimas")
-            
-            else:
-                # Optimización simplificada
-                avg_temp = env_data['ambient_temperature'].mean()
-                avg_irradiance = env_data['irradiance'].mean()
-                avg_humidity = env_data['humidity'].mean()
-                
-                # Configuración óptima simplificada
-                optimal_config = [
-                    avg_temp * 0.5 + 10,  # tilt_angle
-                    180,                   # azimuth_angle
-                    1,                     # tracking_mode
-                    max(7, 30 - avg_humidity / 10),  # cleaning_frequency
-                    1 if avg_temp > 30 else 0,       # cooling_system
-                    32,                    # mppt_voltage
-                    0.95                   # inverter_efficiency
-                ]
-                
-                objectives = [0.18, 25, -15000, 50000]  # Valores ejemplo
-            
-            # Mapear configuración a nombres
-            config_names = [
-                'tilt_angle', 'azimuth_angle', 'tracking_mode',
-                'cleaning_frequency', 'cooling_system', 'mppt_voltage',
-                'inverter_efficiency'
-            ]
-            
-            config_dict = dict(zip(config_names, optimal_config))
-            
-            # Guardar resultado
-            optimization_result = OptimizationResult(
-                location_id=location_id,
-                technology=technology,
-                energy_efficiency=objectives[0],
-                expected_lifespan=objectives[1],
-                total_cost=abs(objectives[2]),
-                co2_avoided=objectives[3]
+            # Presupuesto reducido para respuesta rápida; usar /optimize/jobs para más
+            optimization_result, origin = optimize_and_save(
+                optimizer, env_data, technology, location_id,
+                use_cache=data.get('use_cache', True) is not False
             )
             
-            optimization_result.set_optimal_config(config_dict)
-            
-            db.session.add(optimization_result)
-            db.session.commit()
-            
-            return jsonify({
-                'optimization_result': {
-                    'optimal_configuration': config_dict,
-                    'objectives': {
-                        'energy_efficiency': round(objectives[0], 4),
-                        'expected_lifespan': round(objectives[1], 1),
-                        'total_cost': round(abs(objectives[2]), 2),
-                        'co2_avoided': round(objectives[3], 2)
-                    },
-                    'technology': technology,
-                    'location_id': location_id
-                },
-                'recommendations': {
-                    'tilt_angle': f"Configurar inclinación a {config_dict['tilt_angle']:.1f}°",
-                    'tracking': "Sistema de seguimiento recomendado" if config_dict['tracking_mode'] > 0 else "Sistema fijo recomendado",
-                    'maintenance': f"Limpieza cada {config_dict['cleaning_frequency']:.0f} días",
-                    'cooling': "Sistema de enfriamiento recomendado" if config_dict['cooling_system'] else "Enfriamiento pasivo suficiente"
-                },
-                'optimization_id': optimization_result.id,
-                'timestamp': optimization_result.timestamp.isoformat()
-            }), 200
+            return jsonify({**format_optimization(optimization_result), **origin}), 200
             
         except Exception as e:
             return jsonify({'error': f'Error en optimización: {str(e)}'}), 500
@@ -410,6 +516,198 @@ def multi_objective_optimization():
         return jsonify({'error': str(e)}), 500
 
 
+@ai_bp.route('/optimize/jobs', methods=['POST'])
+def submit_optimization():
+    """Encolar una optimización multiobjetivo con presupuesto completo de NSGA-II"""
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        for field in ['environmental_data', 'technology']:
+            if field not in data:
+                return jsonify({'error': f'Campo requerido faltante: {field}'}), 400
+        
+        try:
+            population_size = int(data.get('population_size', DEFAULT_POPULATION_SIZE))
+            generations = int(data.get('generations', DEFAULT_GENERATIONS))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'population_size y generations deben ser enteros'}), 400
+        
+        if not 2 <= population_size <= MAX_POPULATION_SIZE:
+            return jsonify({'error': f'population_size debe estar entre 2 y {MAX_POPULATION_SIZE}'}), 400
+        if not 1 <= generations <= MAX_GENERATIONS:
+            return jsonify({'error': f'generations debe estar entre 1 y {MAX_GENERATIONS}'}), 400
+        
+        optimizer = load_optimizer()
+        if optimizer is None:
+            return jsonify({'error': 'Optimizador no disponible'}), 500
+        
+        try:
+            job_id = submit_optimization_job(
+                current_app._get_current_object(), optimizer,
+                data['environmental_data'], data['technology'],
+                location_id=data.get('location_id', 'default'),
+                population_size=population_size, generations=generations,
+                use_cache=data.get('use_cache', True) is not False
+            )
+        except RuntimeError as e:
+            return jsonify({'error': str(e)}), 503
+        
+        return jsonify({
+            'message': 'Optimización encolada',
+            'job_id': job_id,
+            'status_url': f'/api/optimize/jobs/{job_id}',
+            'result_url': f'/api/optimize/jobs/{job_id}/result'
+        }), 202
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@ai_bp.route('/optimize/jobs/<job_id>', methods=['GET'])
+def get_optimization_job_status(job_id):
+    """Consultar el estado y progreso de una optimización"""
+    job = get_optimization_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo de optimización no encontrado'}), 404
+    return jsonify(job), 200
+
+
+@ai_bp.route('/optimize/jobs/<job_id>', methods=['DELETE'])
+def cancel_optimization(job_id):
+    """Cancelar una optimización en cola o en ejecución"""
+    job = cancel_optimization_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo de optimización no encontrado'}), 404
+    return jsonify(job), 200
+
+
+@ai_bp.route('/optimize/jobs/<job_id>/result', methods=['GET'])
+def get_optimization_job_result(job_id):
+    """Obtener el resultado de una optimización terminada"""
+    try:
+        job = get_optimization_job(job_id)
+        if job is None:
+            return jsonify({'error': 'Trabajo de optimización no encontrado'}), 404
+        
+        if job['status'] == 'failed':
+            return jsonify({'error': job.get('error'), 'job_id': job_id}), 500
+        if job['status'] != 'completed':
+            return jsonify(job), 409 if job['status'] == 'cancelled' else 202
+        
+        optimization_result = db.session.get(OptimizationResult, job['optimization_id'])
+        if optimization_result is None:
+            return jsonify({'error': 'Resultado de optimización no encontrado'}), 404
+        return jsonify({
+            **format_optimization(optimization_result),
+            'cached': job.get('cached', False),
+            'warm_start': job.get('warm_start', False)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@ai_bp.route('/anomalies/scan', methods=['POST'])
+def scan_anomalies():
+    """Detectar anomalías sobre la telemetría almacenada en una ventana de tiempo"""
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        # Ventana por defecto: últimas 24 horas
+        try:
+            end = datetime.fromisoformat(data['end_date']) if data.get('end_date') else datetime.utcnow()
+            start = datetime.fromisoformat(data['start_date']) if data.get('start_date') else end - timedelta(hours=24)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Formato de fecha inválido'}), 400
+        
+        if start >= end:
+            return jsonify({'error': 'start_date debe ser anterior a end_date'}), 400
+        
+        options = {
+            'module_ids': data.get('module_ids'),
+            'min_readings': int(data.get('min_readings', 1))
+        }
+        detector = load_anomaly_detector()
+        
+        # Ventanas grandes: ejecutar en segundo plano y consultar el progreso
+        if data.get('background'):
+            job_id = start_scan_job(
+                current_app._get_current_object(), start, end, detector=detector, **options
+            )
+            return jsonify({
+                'message': 'Escaneo iniciado',
+                'job_id': job_id,
+                'status_url': f'/api/anomalies/scan/jobs/{job_id}'
+            }), 202
+        
+        summary = scan_window(start, end, detector=detector, **options)
+        return jsonify({
+            'message': 'Escaneo completado',
+            'period': {'start': start.isoformat(), 'end': end.isoformat()},
+            **summary
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@ai_bp.route('/anomalies/scan/jobs/<job_id>', methods=['GET'])
+def get_scan_job_status(job_id):
+    """Consultar el progreso de un escaneo de anomalías"""
+    job = get_scan_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo de escaneo no encontrado'}), 404
+    return jsonify(job), 200
+
+
+@ai_bp.route('/anomalies/peers', methods=['POST'])
+def detect_peer_anomalies_endpoint():
+    """Detectar módulos con bajo rendimiento frente a sus vecinos de ubicación"""
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        try:
+            end = datetime.fromisoformat(data['end_date']) if data.get('end_date') else datetime.utcnow()
+            start = datetime.fromisoformat(data['start_date']) if data.get('start_date') else end - timedelta(hours=24)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Formato de fecha inválido'}), 400
+        
+        if start >= end:
+            return jsonify({'error': 'start_date debe ser anterior a end_date'}), 400
+        
+        # Grupos de pares {location_id: [module_id, ...]}; por defecto toda la flota
+        groups = data.get('groups')
+        if groups is not None and not isinstance(groups, dict):
+            return jsonify({'error': 'groups debe ser un objeto {location_id: [module_id, ...]}'}), 400
+        
+        summary = detect_peer_anomalies(
+            start, end, groups=groups,
+            resolution_minutes=int(data.get('resolution_minutes', DEFAULT_RESOLUTION_MINUTES)),
+            z_threshold=float(data.get('z_threshold', DEFAULT_Z_THRESHOLD)),
+            min_fraction=float(data.get('min_fraction', DEFAULT_MIN_FRACTION)),
+            persist=bool(data.get('persist', True))
+        )
+        
+        return jsonify({
+            'period': {'start': start.isoformat(), 'end': end.isoformat()},
+            **summary
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@ai_bp.route('/anomalies/detectors/<module_id>', methods=['GET'])
+def get_detector_state(module_id):
+    """Estado de los detectores incrementales (EWMA/CUSUM) de un módulo"""
+    state = streaming_detectors.state(module_id)
+    if state is None:
+        return jsonify({'error': 'Módulo sin lecturas procesadas'}), 404
+    return jsonify({'module_id': module_id, 'metrics': state}), 200
+
+
 @ai_bp.route('/anomalies/active', methods=['GET'])
 def get_active_anomalies():
     """Obtener anomalías activas"""
@@ -419,16 +717,9 @@ def get_active_anomalies():
         module_id = request.args.get('module_id')
         limit = int(request.args.get('limit', 50))
         
-        # Consulta base
-        query = AnomalyDetection.query.filter(AnomalyDetection.status == 'active')
-        
-        if severity:
-            query = query.filter(AnomalyDetection.severity_level == severity)
-        
-        if module_id:
-            query = query.filter(AnomalyDetection.module_id == module_id)
-        
-        anomalies = query.order_by(AnomalyDetection.timestamp.desc()).limit(limit).all()
+        anomalies = db.session.execute(
+            active_anomalies_statement(severity, module_id, limit)
+        ).scalars().all()
         
         return jsonify({
             'anomalies': [anomaly.to_dict() for anomaly in anomalies],
@@ -476,16 +767,9 @@ def get_prediction_history():
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=days)
         
-        # Consulta
-        query = PredictionResult.query.filter(
-            PredictionResult.timestamp >= start_date,
-            PredictionResult.timestamp <= end_date
-        )
-        
-        if model_type:
-            query = query.filter(PredictionResult.model_type == model_type)
-        
-        predictions = query.order_by(PredictionResult.timestamp.desc()).limit(limit).all()
+        predictions = db.session.execute(
+            prediction_history_statement(start_date, end_date, model_type, limit)
+        ).scalars().all()
         
         return jsonify({
             'predictions': [pred.to_dict() for pred in predictions],
@@ -504,26 +788,37 @@ def get_prediction_history():
 def get_models_status():
     """Obtener estado de los modelos de IA"""
     try:
-        status = {
-            'performance_predictor': {
-                'loaded': performance_predictor is not None,
-                'type': 'Tropical PV Performance Predictor',
-                'description': 'Predicción de desempeño para climas tropicales'
-            },
-            'anomaly_detector': {
-                'loaded': anomaly_detector is not None,
-                'type': 'Solar Anomaly Detector',
-                'description': 'Detección de anomalías y fallas en módulos solares'
-            },
-            'multi_objective_optimizer': {
-                'loaded': multi_objective_optimizer is not None,
-                'type': 'Multi-Objective PV Optimizer',
-                'description': 'Optimización multiobjetivo de sistemas fotovoltaicos'
-            }
-        }
+        status = model_registry.status()
+        status['multi_objective_optimizer']['cache'] = optimization_cache.stats()
+        status['performance_predictor']['batching'] = performance_batcher.stats()
+        status['anomaly_detector']['batching'] = anomaly_batcher.stats()
         
         return jsonify({
             'models_status': status,
+            'memory': model_registry.memory(),
+            'timestamp': datetime.utcnow().isoformat()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@ai_bp.route('/models/reload', methods=['POST'])
+def reload_models():
+    """Recargar en caliente los artefactos de heliosentinel_models"""
+    try:
+        data = request.get_json(silent=True) or {}
+        names = data.get('models')
+        
+        try:
+            model_registry.reload(names)
+        except KeyError as e:
+            return jsonify({'error': f'Modelo no registrado: {e.args[0]}'}), 404
+        
+        return jsonify({
+            'message': 'Modelos recargados',
+            'models_status': model_registry.status(),
+            'memory': model_registry.memory(),
             'timestamp': datetime.utcnow().isoformat()
         }), 200
         
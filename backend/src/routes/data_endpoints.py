@@ -2,103 +2,196 @@
 Endpoints para manejo de datos solares y ambientales - HelioSentinel
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from datetime import datetime, timedelta
-from src.models.solar_data import (
-    db, SolarModuleData, EnvironmentalData, 
-    SystemMetrics, AnomalyDetection
+from src.models.solar_data import db
+from src.models.database import pool_monitor
+from src.services.ingestion import (
+    MAX_BATCH_READINGS, DEFAULT_CHUNK_SIZE, DUPLICATE_POLICIES, parse_batch_payload,
+    ingest_batch, ingest_frames, read_csv_chunks, reading_to_record, required_columns,
+    upsert_records
 )
+from src.services.write_behind import write_behind, BufferFull
+from src.services.event_feed import (
+    DEFAULT_HEARTBEAT_SECONDS, TOPICS as EVENT_TOPICS, TooManySubscribers, broker,
+    current_metrics_message
+)
+from src.services.import_pipeline import start_import_job, get_import_job
+from src.services.retention import TIERS as RETENTION_TIERS, retention
+from src.services.partitions import partitions
+from src.services.hot_store import latest_readings
+from src.services.dashboard_metrics import (
+    MAX_HISTORY_SNAPSHOTS, dashboard_metrics, history as metrics_history
+)
+from src.services.rollups import (
+    RESOLUTION_SECONDS, window_summary, choose_resolution, series
+)
+from src.services.range_reader import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, RANGE_TABLES, encode_cursor, decode_cursor,
+    fetch_page, iter_rows, range_statement, row_to_dict
+)
+from src.services.columnar import (
+    EXPORT_FORMATS, arrow_schema, stream_export, read_columnar_chunks
+)
+from src.services.downsampling import (
+    DEFAULT_MAX_POINTS, MAX_POINTS_LIMIT, METHODS as DOWNSAMPLING_METHODS,
+    raw_to_series, chart_series
+)
+from werkzeug.utils import secure_filename
 import pandas as pd
 import io
 import json
+import os
+import uuid
 
 data_bp = Blueprint('data', __name__)
 
+
 @data_bp.route('/data/solar', methods=['POST'])
 def receive_solar_data():
     """Recibir datos de módulos solares en tiempo real"""
+    return _receive_reading('solar', 'Datos solares')
+
+
+@data_bp.route('/data/environmental', methods=['POST'])
+def receive_environmental_data():
+    """Recibir datos ambientales en tiempo real"""
+    return _receive_reading('environmental', 'Datos ambientales')
+
+
+def _duplicate_policy(source):
+    """
+    Política para lecturas ya guardadas ('skip' o 'update') de la petición o la configuración.
+
+    Raises:
+        ValueError: Si la política no es válida
+    """
+    on_duplicate = source.get('on_duplicate') or current_app.config.get('INGEST_ON_DUPLICATE', 'skip')
+    if on_duplicate not in DUPLICATE_POLICIES:
+        raise ValueError(
+            f'on_duplicate inválido: {on_duplicate} (opciones: {", ".join(DUPLICATE_POLICIES)})'
+        )
+    return on_duplicate
+
+
+def _receive_reading(data_type, label):
+    """Validar y guardar (o encolar) una lectura individual sin duplicar su clave natural"""
     try:
         data = request.get_json()
         
         # Validar datos requeridos
-        required_fields = [
-            'module_id', 'open_circuit_voltage', 'max_power_voltage',
-            'max_power_current', 'short_circuit_current', 'max_power',
-            'efficiency', 'cell_temperature'
-        ]
-        
-        for field in required_fields:
+        for field in required_columns(data_type):
             if field not in data:
                 return jsonify({'error': f'Campo requerido faltante: {field}'}), 400
         
-        # Crear registro
-        solar_data = SolarModuleData(
-            module_id=data['module_id'],
-            open_circuit_voltage=float(data['open_circuit_voltage']),
-            max_power_voltage=float(data['max_power_voltage']),
-            max_power_current=float(data['max_power_current']),
-            short_circuit_current=float(data['short_circuit_current']),
-            max_power=float(data['max_power']),
-            efficiency=float(data['efficiency']),
-            cell_temperature=float(data['cell_temperature']),
-            timestamp=datetime.fromisoformat(data.get('timestamp', datetime.utcnow().isoformat()))
-        )
-        
-        db.session.add(solar_data)
+        try:
+            on_duplicate = _duplicate_policy(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        try:
+            record = reading_to_record(data_type, data)
+        except ValueError as e:
+            return jsonify({'error': f'Lectura inválida: {str(e)}'}), 400
+        
+        if write_behind.enabled:
+            queued = _queue_reading(data_type, record, on_duplicate, f'{label} aceptados para escritura diferida')
+            if queued is not None:
+                return queued
+        
+        counts = upsert_records(data_type, [record], on_duplicate)
         db.session.commit()
         
-        return jsonify({
-            'message': 'Datos solares recibidos exitosamente',
-            'id': solar_data.id,
-            'timestamp': solar_data.timestamp.isoformat()
-        }), 201
+        if counts['inserted']:
+            return jsonify({
+                'message': f'{label} recibidos exitosamente',
+                'status': 'inserted',
+                'id': record['id'],
+                'timestamp': record['timestamp'].isoformat()
+            }), 201
+        
+        # Lectura repetida (p. ej. reintento del gateway): no se crea otra fila
+        response = {
+            'message': 'Lectura existente actualizada' if counts['updated'] else 'Lectura duplicada omitida',
+            'status': 'updated' if counts['updated'] else 'skipped',
+            'timestamp': record['timestamp'].isoformat()
+        }
+        if 'id' in record:
+            response['id'] = record['id']
+        return jsonify(response), 200
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
-@data_bp.route('/data/environmental', methods=['POST'])
-def receive_environmental_data():
-    """Recibir datos ambientales en tiempo real"""
+def _queue_reading(data_type, record, on_duplicate, message):
+    """
+    Encolar una lectura validada en el búfer de escritura diferida.
+
+    Returns:
+        Respuesta 202/503, o None si la política de contrapresión pide
+        escribir la lectura en línea
+    """
     try:
-        data = request.get_json()
-        
-        # Validar datos requeridos
-        required_fields = [
-            'ambient_temperature', 'irradiance', 'humidity', 'wind_speed'
-        ]
-        
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'Campo requerido faltante: {field}'}), 400
-        
-        # Crear registro
-        env_data = EnvironmentalData(
-            location_id=data.get('location_id', 'default'),
-            ambient_temperature=float(data['ambient_temperature']),
-            irradiance=float(data['irradiance']),
-            humidity=float(data['humidity']),
-            wind_speed=float(data['wind_speed']),
-            precipitation=float(data.get('precipitation', 0)),
-            cloudiness=float(data.get('cloudiness', 0)),
-            timestamp=datetime.fromisoformat(data.get('timestamp', datetime.utcnow().isoformat()))
-        )
-        
-        db.session.add(env_data)
-        db.session.commit()
-        
+        if not write_behind.submit(data_type, record, on_duplicate):
+            return None
+    except BufferFull as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = str(max(1, round(write_behind.flush_ms / 1000)))
+        return response, 503
+    return jsonify({
+        'message': message,
+        'queued': True,
+        'timestamp': record['timestamp'].isoformat()
+    }), 202
+
+
+def _receive_batch(data_type):
+    """Procesar un lote de lecturas (arreglo JSON o NDJSON) con una sola inserción"""
+    try:
+        try:
+            readings, parse_errors = parse_batch_payload(request)
+            on_duplicate = _duplicate_policy(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if not readings:
+            return jsonify({'error': 'El lote no contiene lecturas'}), 400
+
+        if len(readings) > MAX_BATCH_READINGS:
+            return jsonify({
+                'error': f'El lote excede el máximo de {MAX_BATCH_READINGS} lecturas'
+            }), 413
+
+        summary = ingest_batch(data_type, readings, parse_errors, on_duplicate)
+
         return jsonify({
-            'message': 'Datos ambientales recibidos exitosamente',
-            'id': env_data.id,
-            'timestamp': env_data.timestamp.isoformat()
-        }), 201
-        
+            'message': 'Lote procesado exitosamente',
+            'accepted': summary['accepted'],
+            'rejected': summary['rejected'],
+            'inserted': summary['inserted'],
+            'updated': summary['updated'],
+            'skipped': summary['skipped'],
+            'results': summary['results']
+        }), 201 if summary['accepted'] else 400
+
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
+@data_bp.route('/data/solar/batch', methods=['POST'])
+def receive_solar_data_batch():
+    """Recibir lotes de datos de módulos solares"""
+    return _receive_batch('solar')
+
+
+@data_bp.route('/data/environmental/batch', methods=['POST'])
+def receive_environmental_data_batch():
+    """Recibir lotes de datos ambientales"""
+    return _receive_batch('environmental')
+
+
 @data_bp.route('/data/latest', methods=['GET'])
 def get_latest_data():
     """Obtener los últimos datos disponibles"""
@@ -108,23 +201,14 @@ def get_latest_data():
         module_id = request.args.get('module_id')
         location_id = request.args.get('location_id')
         
-        # Consultar datos solares
-        solar_query = SolarModuleData.query
-        if module_id:
-            solar_query = solar_query.filter_by(module_id=module_id)
-        
-        latest_solar = solar_query.order_by(SolarModuleData.timestamp.desc()).limit(limit).all()
-        
-        # Consultar datos ambientales
-        env_query = EnvironmentalData.query
-        if location_id:
-            env_query = env_query.filter_by(location_id=location_id)
-        
-        latest_env = env_query.order_by(EnvironmentalData.timestamp.desc()).limit(limit).all()
+        # Servidos desde el almacén en memoria; la base de datos solo se
+        # consulta si el búfer no cubre la petición
+        latest_solar = latest_readings('solar', module_id, limit)
+        latest_env = latest_readings('environmental', location_id, limit)
         
         return jsonify({
-            'solar_data': [data.to_dict() for data in latest_solar],
-            'environmental_data': [data.to_dict() for data in latest_env],
+            'solar_data': latest_solar,
+            'environmental_data': latest_env,
             'count': {
                 'solar': len(latest_solar),
                 'environmental': len(latest_env)
@@ -137,57 +221,121 @@ def get_latest_data():
 
 @data_bp.route('/data/range', methods=['GET'])
 def get_data_range():
-    """Obtener datos en un rango de fechas"""
+    """Obtener datos en un rango de fechas (paginado por cursor o en streaming)"""
     try:
         # Parámetros de consulta
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         module_id = request.args.get('module_id')
         location_id = request.args.get('location_id')
+        data_type = request.args.get('data_type', 'all')  # 'solar', 'environmental' o 'all'
+        output = request.args.get('format', 'json')       # 'json', 'ndjson' o 'stream'
+        tier = request.args.get('tier', 'auto')           # 'auto', 'raw' o una resolución de agregados
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
         
         if not start_date or not end_date:
             return jsonify({'error': 'start_date y end_date son requeridos'}), 400
         
-        start_dt = datetime.fromisoformat(start_date)
-        end_dt = datetime.fromisoformat(end_date)
+        if data_type != 'all' and data_type not in RANGE_TABLES:
+            return jsonify({'error': 'Tipo de datos no válido'}), 400
         
-        # Consultar datos solares
-        solar_query = SolarModuleData.query.filter(
-            SolarModuleData.timestamp >= start_dt,
-            SolarModuleData.timestamp <= end_dt
-        )
-        if module_id:
-            solar_query = solar_query.filter_by(module_id=module_id)
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            return jsonify({'error': f'limit debe estar entre 1 y {MAX_PAGE_SIZE}'}), 400
         
-        solar_data = solar_query.order_by(SolarModuleData.timestamp.asc()).all()
+        if tier != 'auto' and tier not in RETENTION_TIERS:
+            return jsonify({'error': f"tier debe ser auto o uno de: {', '.join(RETENTION_TIERS)}"}), 400
         
-        # Consultar datos ambientales
-        env_query = EnvironmentalData.query.filter(
-            EnvironmentalData.timestamp >= start_dt,
-            EnvironmentalData.timestamp <= end_dt
-        )
-        if location_id:
-            env_query = env_query.filter_by(location_id=location_id)
+        try:
+            positions = decode_cursor(request.args.get('cursor'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        env_data = env_query.order_by(EnvironmentalData.timestamp.asc()).all()
+        start_dt = datetime.fromisoformat(start_date)
+        end_dt = datetime.fromisoformat(end_date)
         
-        return jsonify({
-            'solar_data': [data.to_dict() for data in solar_data],
-            'environmental_data': [data.to_dict() for data in env_data],
-            'period': {
-                'start': start_date,
-                'end': end_date
-            },
+        # Nivel más fino que la retención conserva para el inicio de la ventana;
+        # la paginación continúa en el nivel con el que empezó
+        tier = positions.pop('tier', None) or (
+            retention.choose_tier(start_dt) if tier == 'auto' else tier
+        )
+        
+        data_types = list(RANGE_TABLES) if data_type == 'all' else [data_type]
+        keys = {'solar': module_id, 'environmental': location_id}
+        period = {'start': start_date, 'end': end_date}
+        
+        # Streaming: NDJSON o JSON por fragmentos desde un cursor del servidor
+        if output in ('ndjson', 'stream'):
+            generator = _stream_range(output, data_types, start_dt, end_dt, keys, positions, period, tier)
+            mimetype = 'application/x-ndjson' if output == 'ndjson' else 'application/json'
+            return Response(stream_with_context(generator), mimetype=mimetype)
+        
+        if output != 'json':
+            return jsonify({'error': f'Formato no válido: {output}'}), 400
+        
+        # Paginación por cursor (timestamp, id)
+        response = {}
+        next_positions = {}
+        for dt in list(RANGE_TABLES):
+            response_key = RANGE_TABLES[dt]['response_key']
+            if dt not in data_types or positions.get(dt) is False:
+                response[response_key] = []
+                next_positions[dt] = False
+                continue
+            rows, next_positions[dt] = fetch_page(
+                dt, start_dt, end_dt, keys[dt], after=positions.get(dt), limit=limit, tier=tier
+            )
+            response[response_key] = rows
+        
+        has_more = any(position for position in next_positions.values())
+        
+        response.update({
+            'period': period,
+            'tier': tier,
             'count': {
-                'solar': len(solar_data),
-                'environmental': len(env_data)
-            }
-        }), 200
+                'solar': len(response['solar_data']),
+                'environmental': len(response['environmental_data'])
+            },
+            'has_more': has_more,
+            'next_cursor': encode_cursor({**next_positions, 'tier': tier}) if has_more else None
+        })
+        return jsonify(response), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+def _stream_range(output, data_types, start_dt, end_dt, keys, positions, period, tier='raw'):
+    """Generar el cuerpo de la respuesta en streaming sin acumular filas"""
+    if output == 'stream':
+        yield '{"period": ' + json.dumps(period) + ', "tier": ' + json.dumps(tier)
+    
+    for dt in data_types:
+        if positions.get(dt) is False:
+            continue
+        
+        response_key = RANGE_TABLES[dt]['response_key']
+        if output == 'stream':
+            yield f', "{response_key}": ['
+        
+        first = True
+        for partition in iter_rows(dt, start_dt, end_dt, keys[dt], after=positions.get(dt), tier=tier):
+            if output == 'ndjson':
+                yield ''.join(
+                    json.dumps({'data_type': dt, **row_to_dict(row)}) + '\n'
+                    for row in partition
+                )
+            else:
+                chunk = ', '.join(json.dumps(row_to_dict(row)) for row in partition)
+                yield chunk if first else ', ' + chunk
+                first = False
+        
+        if output == 'stream':
+            yield ']'
+    
+    if output == 'stream':
+        yield '}'
+
+
 @data_bp.route('/upload/csv', methods=['POST'])
 def upload_csv():
     """Cargar datos desde archivo CSV"""
@@ -201,86 +349,37 @@ def upload_csv():
         
         data_type = request.form.get('data_type', 'solar')  # 'solar' o 'environmental'
         
+        # Modo streaming: procesar por bloques con inserciones masivas
+        if request.form.get('mode') == 'stream':
+            return _upload_csv_stream(file, data_type)
+        
+        if data_type not in ('solar', 'environmental'):
+            return jsonify({'error': 'Tipo de datos no válido'}), 400
+        
+        try:
+            on_duplicate = _duplicate_policy(request.form)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         # Leer CSV
         stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
         df = pd.read_csv(stream)
         
-        records_created = 0
-        errors = []
+        # Verificar columnas
+        missing_columns = [col for col in required_columns(data_type) if col not in df.columns]
+        if missing_columns:
+            return jsonify({'error': f'Columnas faltantes: {missing_columns}'}), 400
         
-        if data_type == 'solar':
-            # Procesar datos solares
-            required_columns = [
-                'module_id', 'open_circuit_voltage', 'max_power_voltage',
-                'max_power_current', 'short_circuit_current', 'max_power',
-                'efficiency', 'cell_temperature'
-            ]
-            
-            # Verificar columnas
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            if missing_columns:
-                return jsonify({'error': f'Columnas faltantes: {missing_columns}'}), 400
-            
-            for index, row in df.iterrows():
-                try:
-                    solar_data = SolarModuleData(
-                        module_id=str(row['module_id']),
-                        open_circuit_voltage=float(row['open_circuit_voltage']),
-                        max_power_voltage=float(row['max_power_voltage']),
-                        max_power_current=float(row['max_power_current']),
-                        short_circuit_current=float(row['short_circuit_current']),
-                        max_power=float(row['max_power']),
-                        efficiency=float(row['efficiency']),
-                        cell_temperature=float(row['cell_temperature']),
-                        timestamp=pd.to_datetime(row.get('timestamp', datetime.utcnow())).to_pydatetime()
-                    )
-                    
-                    db.session.add(solar_data)
-                    records_created += 1
-                    
-                except Exception as e:
-                    errors.append(f'Fila {index + 1}: {str(e)}')
-        
-        elif data_type == 'environmental':
-            # Procesar datos ambientales
-            required_columns = [
-                'ambient_temperature', 'irradiance', 'humidity', 'wind_speed'
-            ]
-            
-            # Verificar columnas
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            if missing_columns:
-                return jsonify({'error': f'Columnas faltantes: {missing_columns}'}), 400
-            
-            for index, row in df.iterrows():
-                try:
-                    env_data = EnvironmentalData(
-                        location_id=str(row.get('location_id', 'default')),
-                        ambient_temperature=float(row['ambient_temperature']),
-                        irradiance=float(row['irradiance']),
-                        humidity=float(row['humidity']),
-                        wind_speed=float(row['wind_speed']),
-                        precipitation=float(row.get('precipitation', 0)),
-                        cloudiness=float(row.get('cloudiness', 0)),
-                        timestamp=pd.to_datetime(row.get('timestamp', datetime.utcnow())).to_pydatetime()
-                    )
-                    
-                    db.session.add(env_data)
-                    records_created += 1
-                    
-                except Exception as e:
-                    errors.append(f'Fila {index + 1}: {str(e)}')
-        
-        else:
-            return jsonify({'error': 'Tipo de datos no válido'}), 400
-        
-        db.session.commit()
+        # Inserción masiva omitiendo (o actualizando) las lecturas ya guardadas
+        summary = ingest_frames(data_type, [df], on_duplicate)
         
         return jsonify({
             'message': f'Archivo procesado exitosamente',
-            'records_created': records_created,
-            'errors': errors[:10],  # Mostrar solo los primeros 10 errores
-            'total_errors': len(errors)
+            'records_created': summary['records_created'],
+            'updated': summary['updated'],
+            'skipped': summary['skipped'],
+            'errors': summary['errors'],
+            'total_errors': summary['total_errors']
         }), 201
         
     except Exception as e:
@@ -288,6 +387,35 @@ def upload_csv():
         return jsonify({'error': str(e)}), 500
 
 
+def _upload_csv_stream(file, data_type):
+    """Importar un CSV por bloques de tamaño fijo con memoria constante"""
+    if data_type not in ('solar', 'environmental'):
+        return jsonify({'error': 'Tipo de datos no válido'}), 400
+    
+    chunk_size = int(request.form.get('chunk_size', DEFAULT_CHUNK_SIZE))
+    if chunk_size <= 0:
+        return jsonify({'error': 'chunk_size debe ser positivo'}), 400
+    
+    try:
+        on_duplicate = _duplicate_policy(request.form)
+        frames = read_csv_chunks(file.stream, data_type, chunk_size=chunk_size)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    summary = ingest_frames(data_type, frames, on_duplicate)
+    
+    return jsonify({
+        'message': 'Archivo procesado exitosamente',
+        'mode': 'stream',
+        'records_created': summary['records_created'],
+        'updated': summary['updated'],
+        'skipped': summary['skipped'],
+        'chunks_processed': summary['chunks'],
+        'errors': summary['errors'],
+        'total_errors': summary['total_errors']
+    }), 201
+
+
 @data_bp.route('/upload/xlsx', methods=['POST'])
 def upload_xlsx():
     """Cargar datos desde archivo Excel"""
@@ -302,84 +430,74 @@ def upload_xlsx():
         data_type = request.form.get('data_type', 'solar')
         sheet_name = request.form.get('sheet_name', 0)  # Primera hoja por defecto
         
+        if data_type not in ('solar', 'environmental'):
+            return jsonify({'error': 'Tipo de datos no válido'}), 400
+        
+        try:
+            on_duplicate = _duplicate_policy(request.form)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         # Leer Excel
         df = pd.read_excel(file, sheet_name=sheet_name)
         
-        # Convertir a CSV en memoria y procesar
-        csv_buffer = io.StringIO()
-        df.to_csv(csv_buffer, index=False)
-        csv_buffer.seek(0)
+        missing_columns = [col for col in required_columns(data_type) if col not in df.columns]
+        if missing_columns:
+            return jsonify({'error': f'Columnas faltantes: {missing_columns}'}), 400
         
-        # Simular request de CSV
-        records_created = 0
-        errors = []
+        summary = ingest_frames(data_type, [df], on_duplicate)
         
-        if data_type == 'solar':
-            required_columns = [
-                'module_id', 'open_circuit_voltage', 'max_power_voltage',
-                'max_power_current', 'short_circuit_current', 'max_power',
-                'efficiency', 'cell_temperature'
-            ]
-            
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            if missing_columns:
-                return jsonify({'error': f'Columnas faltantes: {missing_columns}'}), 400
-            
-            for index, row in df.iterrows():
-                try:
-                    solar_data = SolarModuleData(
-                        module_id=str(row['module_id']),
-                        open_circuit_voltage=float(row['open_circuit_voltage']),
-                        max_power_voltage=float(row['max_power_voltage']),
-                        max_power_current=float(row['max_power_current']),
-                        short_circuit_current=float(row['short_circuit_current']),
-                        max_power=float(row['max_power']),
-                        efficiency=float(row['efficiency']),
-                        cell_temperature=float(row['cell_temperature']),
-                        timestamp=pd.to_datetime(row.get('timestamp', datetime.utcnow())).to_pydatetime()
-                    )
-                    
-                    db.session.add(solar_data)
-                    records_created += 1
-                    
-                except Exception as e:
-                    errors.append(f'Fila {index + 1}: {str(e)}')
-        
-        elif data_type == 'environmental':
-            required_columns = [
-                'ambient_temperature', 'irradiance', 'humidity', 'wind_speed'
-            ]
-            
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            if missing_columns:
-                return jsonify({'error': f'Columnas faltantes: {missing_columns}'}), 400
-            
-            for index, row in df.iterrows():
-                try:
-                    env_data = EnvironmentalData(
-                        location_id=str(row.get('location_id', 'default')),
-                        ambient_temperature=float(row['ambient_temperature']),
-                        irradiance=float(row['irradiance']),
-                        humidity=float(row['humidity']),
-                        wind_speed=float(row['wind_speed']),
-                        precipitation=float(row.get('precipitation', 0)),
-                        cloudiness=float(row.get('cloudiness', 0)),
-                        timestamp=pd.to_datetime(row.get('timestamp', datetime.utcnow())).to_pydatetime()
-                    )
-                    
-                    db.session.add(env_data)
-                    records_created += 1
-                    
-                except Exception as e:
-                    errors.append(f'Fila {index + 1}: {str(e)}')
+        return jsonify({
+            'message': f'Archivo Excel procesado exitosamente',
+            'records_created': summary['records_created'],
+            'updated': summary['updated'],
+            'skipped': summary['skipped'],
+            'errors': summary['errors'],
+            'total_errors': summary['total_errors']
+        }), 201
         
-        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@data_bp.route('/upload/parquet', methods=['POST'])
+def upload_columnar():
+    """Cargar datos desde archivo Parquet o Arrow IPC"""
+    try:
+        if 'file' not in request.files:
+            return jsonify({'error': 'No se encontró archivo'}), 400
+        
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'error': 'No se seleccionó archivo'}), 400
+        
+        data_type = request.form.get('data_type', 'solar')
+        if data_type not in ('solar', 'environmental'):
+            return jsonify({'error': 'Tipo de datos no válido'}), 400
+        
+        chunk_size = int(request.form.get('chunk_size', DEFAULT_CHUNK_SIZE))
+        if chunk_size <= 0:
+            return jsonify({'error': 'chunk_size debe ser positivo'}), 400
+        
+        try:
+            on_duplicate = _duplicate_policy(request.form)
+            frames = read_columnar_chunks(file.stream, data_type, file.filename, chunk_size=chunk_size)
+        except RuntimeError as e:
+            return jsonify({'error': str(e)}), 501
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        summary = ingest_frames(data_type, frames, on_duplicate)
         
         return jsonify({
-            'message': f'Archivo Excel procesado exitosamente',
-            'records_created': records_created,
-            'errors': errors[:10],
-            'total_errors': len(errors)
+            'message': 'Archivo columnar procesado exitosamente',
+            'records_created': summary['records_created'],
+            'updated': summary['updated'],
+            'skipped': summary['skipped'],
+            'chunks_processed': summary['chunks'],
+            'errors': summary['errors'],
+            'total_errors': summary['total_errors']
         }), 201
         
     except Exception as e:
@@ -387,88 +505,218 @@ def upload_xlsx():
         return jsonify({'error': str(e)}), 500
 
 
+@data_bp.route('/export/range', methods=['GET'])
+def export_data_range():
+    """Exportar un rango de datos en formato columnar (Arrow IPC o Parquet)"""
+    try:
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        data_type = request.args.get('data_type', 'solar')
+        file_format = request.args.get('format', 'arrow')  # 'arrow' o 'parquet'
+        
+        if not start_date or not end_date:
+            return jsonify({'error': 'start_date y end_date son requeridos'}), 400
+        
+        if data_type not in RANGE_TABLES:
+            return jsonify({'error': 'Tipo de datos no válido'}), 400
+        
+        if file_format not in EXPORT_FORMATS:
+            return jsonify({'error': f'Formato no válido: {file_format}'}), 400
+        
+        try:
+            arrow_schema(data_type)
+        except RuntimeError as e:
+            return jsonify({'error': str(e)}), 501
+        
+        key_value = request.args.get('module_id' if data_type == 'solar' else 'location_id')
+        start_dt = datetime.fromisoformat(start_date)
+        end_dt = datetime.fromisoformat(end_date)
+        
+        generator = stream_export(data_type, start_dt, end_dt, key_value, file_format)
+        filename = f"{data_type}_{start_dt:%Y%m%d}_{end_dt:%Y%m%d}.{EXPORT_FORMATS[file_format]['extension']}"
+        
+        return Response(
+            stream_with_context(generator),
+            mimetype=EXPORT_FORMATS[file_format]['mimetype'],
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@data_bp.route('/import/jobs', methods=['POST'])
+def create_import_job():
+    """Lanzar una importación paralela de un archivo CSV/XLSX grande"""
+    try:
+        if 'file' not in request.files:
+            return jsonify({'error': 'No se encontró archivo'}), 400
+        
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'error': 'No se seleccionó archivo'}), 400
+        
+        data_type = request.form.get('data_type', 'solar')
+        if data_type not in ('solar', 'environmental'):
+            return jsonify({'error': 'Tipo de datos no válido'}), 400
+        
+        filename = secure_filename(file.filename)
+        file_format = 'xlsx' if filename.lower().endswith(('.xlsx', '.xlsm')) else 'csv'
+        
+        try:
+            options = {'on_duplicate': _duplicate_policy(request.form)}
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if request.form.get('workers'):
+            options['workers'] = int(request.form['workers'])
+        if file_format == 'xlsx':
+            sheet_name = request.form.get('sheet_name', '0')
+            options['sheet_name'] = int(sheet_name) if sheet_name.isdigit() else sheet_name
+        
+        # Guardar el archivo para que los procesos del pool lo lean por bloques
+        upload_folder = current_app.config['UPLOAD_FOLDER']
+        os.makedirs(upload_folder, exist_ok=True)
+        path = os.path.join(upload_folder, f'{uuid.uuid4().hex}_{filename}')
+        file.save(path)
+        
+        job_id = start_import_job(
+            current_app._get_current_object(), path, data_type, file_format, **options
+        )
+        
+        return jsonify({
+            'message': 'Importación iniciada',
+            'job_id': job_id,
+            'status_url': f'/api/import/jobs/{job_id}'
+        }), 202
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@data_bp.route('/import/jobs/<job_id>', methods=['GET'])
+def get_import_job_status(job_id):
+    """Consultar progreso y throughput de una importación"""
+    job = get_import_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo de importación no encontrado'}), 404
+    return jsonify(job), 200
+
+
+@data_bp.route('/ingest/metrics', methods=['GET'])
+def get_ingest_metrics():
+    """Escritura diferida, canal de eventos y pool de conexiones"""
+    return jsonify({
+        'write_behind': write_behind.stats(),
+        'event_feed': broker.stats(),
+        'database': pool_monitor.stats()
+    }), 200
+
+
+def _split_param(name):
+    """Lista de valores separados por comas de un parámetro de consulta"""
+    return [value.strip() for value in request.args.get(name, '').split(',') if value.strip()]
+
+
+@data_bp.route('/stream', methods=['GET'])
+def stream_events():
+    """Canal Server-Sent Events con lecturas, anomalías y métricas en vivo"""
+    try:
+        topics = _split_param('topics') or list(EVENT_TOPICS)
+        unknown = sorted(set(topics) - set(EVENT_TOPICS))
+        if unknown:
+            return jsonify({
+                'error': f"Tipos de evento no soportados: {', '.join(unknown)}",
+                'supported': list(EVENT_TOPICS)
+            }), 400
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            last_event_id = None
+
+        initial = current_metrics_message() if 'metrics' in topics and last_event_id is None else None
+        try:
+            subscription = broker.subscribe(
+                topics, module_ids=_split_param('module_id'),
+                location_ids=_split_param('location_id'), last_event_id=last_event_id
+            )
+        except TooManySubscribers as e:
+            response = jsonify({'error': str(e)})
+            response.headers['Retry-After'] = '30'
+            return response, 503
+
+        heartbeat = current_app.config.get('EVENT_FEED_HEARTBEAT_SECONDS', DEFAULT_HEARTBEAT_SECONDS)
+
+        def generate():
+            try:
+                yield 'retry: 3000\n\n'
+                if initial:
+                    yield initial
+                while True:
+                    message = subscription.get(heartbeat)
+                    # Comentario SSE para mantener viva la conexión a través de proxies
+                    yield message if message is not None else ': keepalive\n\n'
+            finally:
+                subscription.close()
+
+        return Response(generate(), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@data_bp.route('/retention', methods=['GET'])
+def get_retention_status():
+    """Política de retención por nivel y resultado de la última purga"""
+    return jsonify(retention.status()), 200
+
+
+@data_bp.route('/partitions', methods=['GET'])
+def get_partitions_status():
+    """Particiones mensuales de la telemetría cruda y último mantenimiento"""
+    try:
+        return jsonify(partitions.status()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @data_bp.route('/dashboard/metrics', methods=['GET'])
 def get_dashboard_metrics():
-    """Obtener métricas para el dashboard"""
+    """Obtener métricas para el dashboard (desde memoria, con ETag/Last-Modified)"""
     try:
-        # Calcular métricas en tiempo real
-        now = datetime.utcnow()
-        last_24h = now - timedelta(hours=24)
-        last_week = now - timedelta(days=7)
-        
-        # Métricas de módulos solares
-        total_modules = db.session.query(SolarModuleData.module_id).distinct().count()
-        
-        # Módulos activos (con datos en las últimas 24h)
-        active_modules = db.session.query(SolarModuleData.module_id).filter(
-            SolarModuleData.timestamp >= last_24h
-        ).distinct().count()
-        
-        # Potencia total generada (últimas 24h)
-        total_power = db.session.query(db.func.sum(SolarModuleData.max_power)).filter(
-            SolarModuleData.timestamp >= last_24h
-        ).scalar() or 0
-        
-        # Eficiencia promedio
-        avg_efficiency = db.session.query(db.func.avg(SolarModuleData.efficiency)).filter(
-            SolarModuleData.timestamp >= last_24h
-        ).scalar() or 0
-        
-        # Anomalías
-        total_anomalies = AnomalyDetection.query.filter(
-            AnomalyDetection.status == 'active'
-        ).count()
-        
-        critical_anomalies = AnomalyDetection.query.filter(
-            AnomalyDetection.status == 'active',
-            AnomalyDetection.severity_level == 'Crítica'
-        ).count()
-        
-        # Condiciones ambientales promedio
-        env_metrics = db.session.query(
-            db.func.avg(EnvironmentalData.ambient_temperature),
-            db.func.avg(EnvironmentalData.irradiance),
-            db.func.avg(EnvironmentalData.humidity)
-        ).filter(EnvironmentalData.timestamp >= last_24h).first()
-        
-        avg_temp = env_metrics[0] or 0
-        avg_irradiance = env_metrics[1] or 0
-        avg_humidity = env_metrics[2] or 0
-        
-        # Crear o actualizar métricas del sistema
-        system_metrics = SystemMetrics(
-            total_modules=total_modules,
-            active_modules=active_modules,
-            total_power_generated=total_power,
-            average_efficiency=avg_efficiency,
-            total_anomalies=total_anomalies,
-            critical_anomalies=critical_anomalies,
-            average_temperature=avg_temp,
-            average_irradiance=avg_irradiance,
-            average_humidity=avg_humidity
-        )
+        current = dashboard_metrics.snapshot()
+        response = jsonify(current['metrics'])
+        response.set_etag(current['etag'])
+        response.last_modified = current['last_modified']
+        response.cache_control.no_cache = True
+        # Responde 304 si If-None-Match o If-Modified-Since coinciden
+        return response.make_conditional(request)
         
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@data_bp.route('/dashboard/metrics/history', methods=['GET'])
+def get_dashboard_metrics_history():
+    """Obtener las instantáneas periódicas de métricas del sistema"""
+    try:
+        try:
+            hours = float(request.args.get('hours', 24))
+            limit = min(int(request.args.get('limit', MAX_HISTORY_SNAPSHOTS)), MAX_HISTORY_SNAPSHOTS)
+        except ValueError:
+            return jsonify({'error': 'Parámetros hours y limit deben ser numéricos'}), 400
+        if hours <= 0 or limit <= 0:
+            return jsonify({'error': 'Parámetros hours y limit deben ser positivos'}), 400
+
+        end = datetime.utcnow()
+        snapshots = metrics_history(end - timedelta(hours=hours), end, limit)
         return jsonify({
-            'modules': {
-                'total': total_modules,
-                'active': active_modules,
-                'inactive': total_modules - active_modules
-            },
-            'power': {
-                'total_generated_24h': round(total_power, 2),
-                'average_efficiency': round(avg_efficiency * 100, 2)
-            },
-            'anomalies': {
-                'total_active': total_anomalies,
-                'critical': critical_anomalies,
-                'medium_high': total_anomalies - critical_anomalies
-            },
-            'environment': {
-                'average_temperature': round(avg_temp, 1),
-                'average_irradiance': round(avg_irradiance, 1),
-                'average_humidity': round(avg_humidity, 1)
-            },
-            'timestamp': now.isoformat()
+            'snapshots': snapshots,
+            'total': len(snapshots),
+            'snapshot_seconds': dashboard_metrics.snapshot_seconds
         }), 200
         
     except Exception as e:
@@ -482,38 +730,43 @@ def get_performance_charts():
         # Parámetros
         days = int(request.args.get('days', 7))
         module_id = request.args.get('module_id')
+        resolution = request.args.get('resolution', 'auto')  # 'auto', 'raw' o una resolución
+        max_points = int(request.args.get('max_points', DEFAULT_MAX_POINTS))
+        bucket = request.args.get('bucket', 'lttb')  # 'lttb' o 'minmax'
+        
+        if not 3 <= max_points <= MAX_POINTS_LIMIT:
+            return jsonify({'error': f'max_points debe estar entre 3 y {MAX_POINTS_LIMIT}'}), 400
+        if bucket not in DOWNSAMPLING_METHODS:
+            return jsonify({'error': f'Método de reducción no válido: {bucket}'}), 400
         
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=days)
         
-        # Consulta base
-        query = db.session.query(
-            SolarModuleData.timestamp,
-            SolarModuleData.max_power,
-            SolarModuleData.efficiency,
-            SolarModuleData.cell_temperature,
-            SolarModuleData.module_id
-        ).filter(
-            SolarModuleData.timestamp >= start_date,
-            SolarModuleData.timestamp <= end_date
-        )
-        
-        if module_id:
-            query = query.filter(SolarModuleData.module_id == module_id)
+        if resolution != 'raw':
+            # Series desde los agregados pre-calculados
+            if resolution == 'auto':
+                resolution = choose_resolution(start_date, end_date)
+            elif resolution not in RESOLUTION_SECONDS:
+                return jsonify({'error': f'Resolución no válida: {resolution}'}), 400
+            
+            frame = series('solar', start_date, end_date, resolution, module_id)
+            modules = window_summary('solar', start_date, end_date, module_id).index.tolist()
         
-        data = query.order_by(SolarModuleData.timestamp.asc()).all()
+        else:
+            # Lecturas crudas de las particiones mensuales de la ventana
+            result = db.session.execute(range_statement('solar', start_date, end_date, module_id))
+            rows = pd.DataFrame(result.all(), columns=list(result.keys()))[
+                ['timestamp', 'max_power', 'efficiency', 'cell_temperature', 'module_id']
+            ]
+            frame = raw_to_series(rows)
+            modules = rows['module_id'].unique().tolist()
         
-        # Formatear datos para gráficos
-        chart_data = {
-            'timestamps': [d.timestamp.isoformat() for d in data],
-            'power': [d.max_power for d in data],
-            'efficiency': [d.efficiency * 100 for d in data],
-            'temperature': [d.cell_temperature for d in data],
-            'modules': list(set([d.module_id for d in data]))
-        }
+        # Formatear datos para gráficos con tamaño acotado
+        chart_data = chart_series(frame, max_points=max_points, method=bucket)
+        chart_data['modules'] = modules
+        chart_data['resolution'] = resolution
         
         return jsonify(chart_data), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-
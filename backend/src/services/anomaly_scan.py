@@ -0,0 +1,321 @@
+"""
+Detección de anomalías sobre la telemetría almacenada - HelioSentinel
+
+Recorre las lecturas de una ventana de tiempo por bloques grandes, evalúa el
+detector (o las reglas de respaldo) sobre cada bloque completo y registra una
+anomalía por módulo y tipo con una inserción masiva.
+"""
+
+from datetime import datetime
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import String, insert, select, type_coerce
+
+from src.models.solar_data import db, AnomalyDetection
+from src.services.dashboard_metrics import record_anomalies
+from src.services.partitions import partitions, union_select
+
+# Lecturas evaluadas por bloque
+SCAN_CHUNK_SIZE = 200000
+
+# Columnas del detector a partir de las columnas almacenadas
+DETECTOR_COLUMNS = {
+    'voltage_oc': 'open_circuit_voltage',
+    'voltage_mp': 'max_power_voltage',
+    'current_mp': 'max_power_current',
+    'current_sc': 'short_circuit_current',
+    'power_max': 'max_power',
+    'efficiency': 'efficiency',
+    'cell_temp': 'cell_temperature'
+}
+
+# Condiciones no almacenadas por lectura (mismos valores por defecto que /predict/anomalies)
+DETECTOR_DEFAULTS = {
+    'ambient_temp': 25.0, 'irradiance': 1000.0, 'humidity': 50.0,
+    'wind_speed': 2.0, 'age_days': 365.0
+}
+
+RULE_COLUMNS = ['efficiency', 'max_power', 'cell_temperature']
+
+# Reglas de respaldo en orden de prioridad: (tipo, descripción, severidad)
+RULES = [
+    (1, 'Degradación Gradual', 'Media'),
+    (2, 'Falla de Celda', 'Alta'),
+    (4, 'Sobrecalentamiento', 'Alta')
+]
+
+RECOMMENDATIONS = {
+    1: {'action': 'Monitoreo continuo y planificación de reemplazo', 'priority': 'Media', 'timeframe': '3-6 meses'},
+    2: {'action': 'Inspección visual y reemplazo de módulo', 'priority': 'Alta', 'timeframe': '1-2 semanas'},
+    4: {'action': 'Mejorar ventilación y verificar montaje', 'priority': 'Alta', 'timeframe': '1 semana'}
+}
+DEFAULT_RECOMMENDATION = {
+    'action': 'Inspección general recomendada', 'priority': 'Media', 'timeframe': '1 mes'
+}
+
+# Trabajos de escaneo en segundo plano por identificador
+scan_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def classify_frame(frame, detector=None):
+    """
+    Evaluar el detector o las reglas sobre un bloque completo de lecturas.
+
+    Args:
+        frame (pd.DataFrame): Lecturas con las columnas de solar_modules_data
+
+    Returns:
+        pd.DataFrame: anomaly_type, anomaly_description, severity, confidence,
+                      isolation_score y reconstruction_error por lectura
+    """
+    if detector is not None and hasattr(detector, 'detect_anomalies'):
+        features = pd.DataFrame({
+            name: frame[column].to_numpy(dtype=float) for name, column in DETECTOR_COLUMNS.items()
+        })
+        for name, default in DETECTOR_DEFAULTS.items():
+            features[name] = default
+        results = pd.DataFrame(detector.detect_anomalies(features), index=frame.index)
+        results = results[results['is_anomaly'].astype(bool)]
+        return results.reindex(columns=[
+            'anomaly_type', 'anomaly_description', 'severity', 'confidence',
+            'isolation_score', 'reconstruction_error'
+        ])
+
+    conditions = [
+        frame['efficiency'].to_numpy(dtype=float) < 0.12,
+        frame['max_power'].to_numpy(dtype=float) < 200,
+        frame['cell_temperature'].to_numpy(dtype=float) > 80
+    ]
+    codes = np.select(conditions, [code for code, _, _ in RULES], 0)
+    anomalous = codes > 0
+    codes = codes[anomalous]
+
+    descriptions = {code: description for code, description, _ in RULES}
+    severities = {code: severity for code, _, severity in RULES}
+    return pd.DataFrame({
+        'anomaly_type': codes,
+        'anomaly_description': pd.Series(codes).map(descriptions).to_numpy(),
+        'severity': pd.Series(codes).map(severities).to_numpy(),
+        'confidence': 'Alta',
+        'isolation_score': 0.0,
+        'reconstruction_error': 0.0
+    }, index=frame.index[anomalous])
+
+
+def _summarize(frame, results):
+    """Agregar las lecturas anómalas de un bloque por módulo y tipo"""
+    events = results.assign(
+        module_id=frame.loc[results.index, 'module_id'].to_numpy(),
+        timestamp=frame.loc[results.index, 'timestamp'].to_numpy()
+    )
+    return events.groupby(['module_id', 'anomaly_description'], sort=False).agg(
+        anomaly_type=('anomaly_type', 'first'),
+        severity=('severity', 'first'),
+        confidence=('confidence', 'first'),
+        readings=('timestamp', 'size'),
+        first_seen=('timestamp', 'min'),
+        last_seen=('timestamp', 'max'),
+        isolation_score=('isolation_score', 'max'),
+        reconstruction_error=('reconstruction_error', 'max')
+    )
+
+
+def _merge_summaries(summaries):
+    """Combinar los agregados parciales de todos los bloques"""
+    combined = pd.concat(summaries)
+    return combined.groupby(level=[0, 1], sort=False).agg({
+        'anomaly_type': 'first',
+        'severity': 'first',
+        'confidence': 'first',
+        'readings': 'sum',
+        'first_seen': 'min',
+        'last_seen': 'max',
+        'isolation_score': 'max',
+        'reconstruction_error': 'max'
+    })
+
+
+def active_anomalies_statement(severity=None, module_id=None, limit=50):
+    """Anomalías activas más recientes (GET /api/anomalies/active)"""
+    stmt = select(AnomalyDetection).where(AnomalyDetection.status == 'active')
+    if severity:
+        stmt = stmt.where(AnomalyDetection.severity_level == severity)
+    if module_id:
+        stmt = stmt.where(AnomalyDetection.module_id == module_id)
+    return stmt.order_by(AnomalyDetection.timestamp.desc()).limit(limit)
+
+
+def existing_anomalies(start, end):
+    """Pares (módulo, tipo) con anomalías activas ya registradas en la ventana"""
+    rows = db.session.execute(
+        select(AnomalyDetection.module_id, AnomalyDetection.anomaly_type).where(
+            AnomalyDetection.status == 'active',
+            AnomalyDetection.timestamp >= start,
+            AnomalyDetection.timestamp <= end
+        )
+    ).all()
+    return set(rows)
+
+
+def scan_window(start, end, module_ids=None, detector=None, min_readings=1,
+                chunk_size=SCAN_CHUNK_SIZE, on_progress=None):
+    """
+    Detectar anomalías en todas las lecturas de una ventana.
+
+    Args:
+        start, end (datetime): Ventana a recorrer
+        module_ids (list): Limitar el escaneo a estos módulos
+        detector: Detector cargado o None para usar las reglas
+        min_readings (int): Lecturas anómalas necesarias para registrar una anomalía
+        on_progress (callable): Recibe un dict de progreso tras cada bloque
+
+    Returns:
+        dict: Resumen del escaneo
+    """
+    started = time.monotonic()
+    # Las reglas de respaldo solo necesitan tres columnas
+    uses_detector = detector is not None and hasattr(detector, 'detect_anomalies')
+    metrics = list(DETECTOR_COLUMNS.values()) if uses_detector else RULE_COLUMNS
+    columns = ['module_id', 'timestamp'] + metrics
+
+    def build(table):
+        # El timestamp se lee sin conversión por fila y se convierte por bloque
+        selected = [type_coerce(table.c.timestamp, String).label('timestamp') if column == 'timestamp'
+                    else table.c[column] for column in columns]
+        stmt = select(*selected).where(table.c.timestamp >= start, table.c.timestamp <= end)
+        if module_ids:
+            stmt = stmt.where(table.c.module_id.in_(module_ids))
+        return stmt
+
+    # Las lecturas de meses archivados siguen en sus propias tablas
+    stmt = union_select(partitions.sources('solar', start, end), build)
+    stmt = stmt.order_by(stmt.selected_columns.timestamp.asc()).execution_options(
+        stream_results=True, yield_per=chunk_size
+    )
+
+    progress = {'readings_scanned': 0, 'anomalous_readings': 0, 'percent': 0.0}
+    summaries = []
+    modules = set()
+    window_seconds = max((end - start).total_seconds(), 1)
+
+    for partition in db.session.execute(stmt).partitions():
+        frame = pd.DataFrame(partition, columns=columns)
+        frame['timestamp'] = pd.to_datetime(frame['timestamp'], format='ISO8601')
+        results = classify_frame(frame, detector)
+        if len(results):
+            summaries.append(_summarize(frame, results))
+        modules.update(frame['module_id'].unique())
+
+        progress['readings_scanned'] += len(frame)
+        progress['anomalous_readings'] += len(results)
+        elapsed = (frame['timestamp'].iloc[-1] - start).total_seconds()
+        progress['percent'] = round(min(elapsed / window_seconds, 1.0) * 100, 1)
+        if on_progress:
+            on_progress(dict(progress))
+
+    events = _merge_summaries(summaries) if summaries else pd.DataFrame()
+    if len(events):
+        events = events[events['readings'] >= min_readings]
+
+    # No duplicar anomalías activas de un escaneo anterior de la misma ventana
+    existing = existing_anomalies(start, end) if len(events) else set()
+    now = datetime.utcnow()
+    records = []
+    skipped = 0
+    for (module_id, description), event in events.iterrows():
+        if (module_id, description) in existing:
+            skipped += 1
+            continue
+        rec = RECOMMENDATIONS.get(event['anomaly_type'], DEFAULT_RECOMMENDATION)
+        first_seen = pd.Timestamp(event['first_seen']).to_pydatetime()
+        last_seen = pd.Timestamp(event['last_seen']).to_pydatetime()
+        records.append({
+            'timestamp': last_seen,
+            'module_id': module_id,
+            'anomaly_type': description,
+            'severity_level': event['severity'],
+            'confidence': event['confidence'],
+            'description': (
+                f'Anomalía detectada en módulo {module_id}: {description} '
+                f"({int(event['readings'])} lecturas entre {first_seen.isoformat()} "
+                f'y {last_seen.isoformat()})'
+            ),
+            'recommended_action': rec['action'],
+            'priority': rec['priority'],
+            'timeframe': rec['timeframe'],
+            'isolation_score': float(event['isolation_score'] or 0),
+            'reconstruction_error': float(event['reconstruction_error'] or 0),
+            'status': 'active',
+            'created_at': now
+        })
+
+    if records:
+        db.session.execute(insert(AnomalyDetection.__table__), records)
+        record_anomalies(records)
+    db.session.commit()
+
+    elapsed = time.monotonic() - started
+    by_type = {}
+    for record in records:
+        by_type[record['anomaly_type']] = by_type.get(record['anomaly_type'], 0) + 1
+
+    progress.update({
+        'status': 'completed',
+        'percent': 100.0,
+        'modules_scanned': len(modules),
+        'anomalies_created': len(records),
+        'skipped_existing': skipped,
+        'by_type': by_type,
+        'elapsed_seconds': round(elapsed, 3),
+        'readings_per_second': round(progress['readings_scanned'] / elapsed, 1) if elapsed else None
+    })
+    return progress
+
+
+def start_scan_job(app, start, end, detector=None, **options):
+    """
+    Lanzar un escaneo en un hilo de fondo y registrar su progreso.
+
+    Returns:
+        str: Identificador del trabajo
+    """
+    job_id = uuid.uuid4().hex
+    job = {
+        'job_id': job_id,
+        'status': 'queued',
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'created_at': datetime.utcnow().isoformat()
+    }
+    with _jobs_lock:
+        scan_jobs[job_id] = job
+
+    def update(progress):
+        with _jobs_lock:
+            job.update(progress)
+
+    def run():
+        with app.app_context():
+            try:
+                update({'status': 'running'})
+                update(scan_window(start, end, detector=detector, on_progress=update, **options))
+            except Exception as e:
+                db.session.rollback()
+                update({'status': 'failed', 'error': str(e)})
+            finally:
+                update({'finished_at': datetime.utcnow().isoformat()})
+
+    threading.Thread(target=run, name=f'scan-{job_id[:8]}', daemon=True).start()
+    return job_id
+
+
+def get_scan_job(job_id):
+    """Obtener una copia del estado de un trabajo de escaneo"""
+    with _jobs_lock:
+        job = scan_jobs.get(job_id)
+        return dict(job) if job else None
@@ -0,0 +1,166 @@
+"""
+Exportación e importación en formatos columnares (Arrow IPC / Parquet) - HelioSentinel
+
+Las exportaciones se construyen por lotes directamente desde el cursor de la
+base de datos: cada lote se transpone a columnas y se escribe como un
+RecordBatch, sin crear diccionarios por fila.
+"""
+
+import io
+
+import pandas as pd
+
+from src.models.solar_data import db
+from src.services.ingestion import DEFAULT_CHUNK_SIZE, required_columns
+from src.services.range_reader import RANGE_TABLES, STREAM_BATCH_SIZE, range_statement
+
+EXPORT_FORMATS = {
+    'arrow': {'mimetype': 'application/vnd.apache.arrow.stream', 'extension': 'arrows'},
+    'parquet': {'mimetype': 'application/vnd.apache.parquet', 'extension': 'parquet'}
+}
+
+
+def _require_pyarrow():
+    """
+    Importar pyarrow bajo demanda.
+
+    Raises:
+        RuntimeError: Si pyarrow no está instalado
+    """
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError('pyarrow no está instalado; los formatos columnares no están disponibles')
+    return pyarrow
+
+
+class _ChunkSink(io.RawIOBase):
+    """Destino de escritura que acumula bytes para enviarlos en streaming"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        """Devolver y vaciar los bytes acumulados"""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def arrow_schema(data_type):
+    """Esquema Arrow de una tabla de telemetría"""
+    pa = _require_pyarrow()
+    model = RANGE_TABLES[data_type]['model']
+    fields = []
+    for column in model.__table__.columns:
+        python_type = column.type.python_type
+        if column.name == 'id':
+            arrow_type = pa.int64()
+        elif python_type is float:
+            arrow_type = pa.float64()
+        elif python_type is str:
+            arrow_type = pa.string()
+        else:
+            arrow_type = pa.timestamp('us')
+        fields.append(pa.field(column.name, arrow_type, nullable=column.nullable))
+    return pa.schema(fields)
+
+
+def iter_record_batches(data_type, start, end, key_value=None):
+    """Leer un rango como RecordBatches de Arrow, un lote del cursor a la vez"""
+    pa = _require_pyarrow()
+    schema = arrow_schema(data_type)
+    stmt = range_statement(data_type, start, end, key_value).execution_options(
+        stream_results=True, yield_per=STREAM_BATCH_SIZE
+    )
+    result = db.session.execute(stmt)
+    for partition in result.partitions():
+        columns = list(zip(*partition))
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+            schema=schema
+        )
+
+
+def stream_export(data_type, start, end, key_value=None, file_format='arrow'):
+    """
+    Generar el archivo exportado en fragmentos de bytes.
+
+    Args:
+        file_format (str): 'arrow' (IPC stream) o 'parquet'
+    """
+    pa = _require_pyarrow()
+    schema = arrow_schema(data_type)
+    sink = _ChunkSink()
+
+    if file_format == 'parquet':
+        writer = pa.parquet.ParquetWriter(sink, schema, compression='zstd')
+        write = writer.write_batch
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+        write = writer.write_batch
+
+    for batch in iter_record_batches(data_type, start, end, key_value):
+        write(batch)
+        chunk = sink.drain()
+        if chunk:
+            yield chunk
+
+    writer.close()
+    yield sink.drain()
+
+
+def read_columnar_chunks(stream, data_type, filename, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Leer un archivo Parquet o Arrow (IPC archivo o stream) por bloques.
+
+    Raises:
+        ValueError: Si faltan columnas requeridas o el formato no es reconocido
+    """
+    pa = _require_pyarrow()
+    name = filename.lower()
+
+    if name.endswith('.parquet'):
+        parquet_file = pa.parquet.ParquetFile(stream)
+        columns = parquet_file.schema_arrow.names
+        batches = parquet_file.iter_batches(batch_size=chunk_size)
+    elif name.endswith(('.arrow', '.arrows', '.feather', '.ipc')):
+        try:
+            reader = pa.ipc.open_file(stream)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        except pa.ArrowInvalid:
+            stream.seek(0)
+            reader = pa.ipc.open_stream(stream)
+            batches = iter(reader)
+        columns = reader.schema.names
+    else:
+        raise ValueError('Formato no reconocido: se espera .parquet, .arrow, .arrows o .feather')
+
+    missing_columns = [col for col in required_columns(data_type) if col not in columns]
+    if missing_columns:
+        raise ValueError(f'Columnas faltantes: {missing_columns}')
+
+    def frames():
+        offset = 0
+        for batch in batches:
+            df = batch.to_pandas()
+            df.index = pd.RangeIndex(offset, offset + len(df))
+            offset += len(df)
+            yield df
+
+    return frames()
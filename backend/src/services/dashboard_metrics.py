@@ -0,0 +1,485 @@
+"""
+Métricas del dashboard en memoria - HelioSentinel
+
+Los contadores de /api/dashboard/metrics (módulos conocidos y activos,
+potencia y eficiencia de las últimas 24h, anomalías activas y críticas,
+condiciones ambientales) se mantienen por minuto en memoria y se actualizan
+al confirmar cada ingesta o cambio de anomalías, sin consultar la base de
+datos por petición. La respuesta lleva ETag y Last-Modified para que los
+sondeos sin cambios reciban 304.
+
+Un hilo en segundo plano reconcilia periódicamente los contadores con los
+agregados por intervalo (incorpora lo escrito por otros procesos y las
+lecturas sobrescritas) y guarda instantáneas en SystemMetrics.
+"""
+
+from datetime import datetime, timedelta
+import hashlib
+import json
+import threading
+import time
+
+import pandas as pd
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from src.models.solar_data import db, AnomalyDetection, SystemMetrics, SolarRollup
+from src.services.ingestion import register_ingest_listener, register_update_listener
+from src.services.rollups import RESOLUTIONS, ROLLUP_SPECS, _floor, series
+
+DEFAULT_WINDOW_HOURS = 24
+DEFAULT_RECONCILE_SECONDS = 60
+DEFAULT_SNAPSHOT_SECONDS = 300
+
+# Instantáneas devueltas como máximo por /api/dashboard/metrics/history
+MAX_HISTORY_SNAPSHOTS = 2000
+
+CRITICAL_SEVERITY = 'Crítica'
+
+_PENDING_KEY = 'dashboard_metrics_pending'
+
+# Columnas acumuladas por minuto para cada tipo de datos
+_BUCKET_FIELDS = {
+    'solar': ('power', 'efficiency'),
+    'environmental': ('temperature', 'irradiance', 'humidity')
+}
+
+
+class DashboardMetrics:
+    """Contadores del dashboard por minuto con versión para peticiones condicionales"""
+
+    def __init__(self, window_hours=DEFAULT_WINDOW_HOURS):
+        self.window = timedelta(hours=window_hours)
+        self.reconcile_seconds = DEFAULT_RECONCILE_SECONDS
+        self.snapshot_seconds = DEFAULT_SNAPSHOT_SECONDS
+        self._lock = threading.Lock()
+        self._buckets = {data_type: {} for data_type in _BUCKET_FIELDS}
+        self._modules = set()
+        self._last_seen = {}
+        self._anomalies = {'active': 0, 'critical': 0, 'resolved': 0}
+        self._stale = True
+        self._version = 0
+        self._computed = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._listeners = []
+        self._published = None
+        self._stats = {'reconciles': 0, 'snapshots': 0, 'applied_batches': 0,
+                       'last_reconcile_at': None, 'last_snapshot_at': None, 'last_error': None}
+
+    def configure(self, reconcile_seconds=None, snapshot_seconds=None):
+        if reconcile_seconds is not None:
+            self.reconcile_seconds = max(1, reconcile_seconds)
+        if snapshot_seconds is not None:
+            self.snapshot_seconds = max(0, snapshot_seconds)
+
+    # --- Carga desde la base de datos ---
+
+    def _reconcile_window(self, now):
+        start = _floor(now - self.window, RESOLUTIONS[0][1])
+        # Incluir lecturas con marca de tiempo ligeramente adelantada
+        return start, now + timedelta(hours=1)
+
+    def reconcile_statements(self, now=None):
+        """
+        Sentencias de reconcile, además de una serie 1min por tipo de datos.
+
+        Returns:
+            dict: Sentencias por nombre (modules, last_seen, by_status, critical)
+        """
+        start, _ = self._reconcile_window(now or datetime.utcnow())
+        module_column = SolarRollup.module_id
+        return {
+            'modules': select(module_column)
+            .where(SolarRollup.resolution == RESOLUTIONS[-1][0]).distinct(),
+            'last_seen': select(module_column, func.max(SolarRollup.bucket_start))
+            .where(SolarRollup.resolution == RESOLUTIONS[0][0], SolarRollup.bucket_start >= start)
+            .group_by(module_column),
+            'by_status': select(AnomalyDetection.status, func.count())
+            .where(AnomalyDetection.status.in_(('active', 'resolved')))
+            .group_by(AnomalyDetection.status),
+            'critical': select(func.count()).select_from(AnomalyDetection).where(
+                AnomalyDetection.status == 'active',
+                AnomalyDetection.severity_level == CRITICAL_SEVERITY
+            )
+        }
+
+    def reconcile(self, now=None):
+        """
+        Recalcular los contadores desde los agregados 1min y la tabla de anomalías.
+
+        Usa una consulta por serie (a lo sumo un punto por minuto de la ventana)
+        en lugar de recorrer las lecturas crudas.
+        """
+        now = now or datetime.utcnow()
+        start, end = self._reconcile_window(now)
+
+        buckets = {}
+        for data_type, fields in _BUCKET_FIELDS.items():
+            frame = series(data_type, start, end, RESOLUTIONS[0][0])
+            columns = ['count'] + [f'{name}_sum' for name in fields]
+            buckets[data_type] = {
+                pd.Timestamp(bucket).to_pydatetime(): [float(value) for value in values]
+                for bucket, *values in zip(frame['bucket_start'], *(frame[c] for c in columns))
+            }
+
+        statements = self.reconcile_statements(now)
+        modules = set(db.session.execute(statements['modules']).scalars())
+        last_seen = dict(db.session.execute(statements['last_seen']).all())
+        by_status = dict(db.session.execute(statements['by_status']).all())
+        critical = db.session.execute(statements['critical']).scalar() or 0
+
+        with self._lock:
+            self._buckets = buckets
+            self._modules = modules
+            self._last_seen = last_seen
+            self._anomalies = {'active': by_status.get('active', 0), 'critical': critical,
+                               'resolved': by_status.get('resolved', 0)}
+            self._stale = False
+            self._version += 1
+            self._stats['reconciles'] += 1
+            self._stats['last_reconcile_at'] = now.isoformat()
+
+    # --- Actualización incremental ---
+
+    def apply_readings(self, data_type, records):
+        """Acumular lecturas confirmadas en los minutos correspondientes"""
+        spec = ROLLUP_SPECS[data_type]
+        key = spec['key']
+        sources = [spec['metrics'][name] for name in _BUCKET_FIELDS[data_type]]
+        with self._lock:
+            buckets = self._buckets[data_type]
+            for record in records:
+                minute = _floor(record['timestamp'], RESOLUTIONS[0][1])
+                bucket = buckets.setdefault(minute, [0.0] * (len(sources) + 1))
+                bucket[0] += 1
+                for position, source in enumerate(sources, start=1):
+                    bucket[position] += float(record.get(source) or 0)
+                if data_type == 'solar':
+                    module_id = record[key]
+                    self._modules.add(module_id)
+                    if minute > self._last_seen.get(module_id, datetime.min):
+                        self._last_seen[module_id] = minute
+            self._version += 1
+            self._stats['applied_batches'] += 1
+
+    def apply_anomalies(self, changes):
+        """Aplicar variaciones de anomalías confirmadas: [(estado_anterior, estado_nuevo, severidad, fila)]"""
+        with self._lock:
+            counts = self._anomalies
+            for old, new, severity, _ in changes:
+                critical = severity == CRITICAL_SEVERITY
+                if old == 'active':
+                    counts['active'] -= 1
+                    counts['critical'] -= critical
+                elif old == 'resolved':
+                    counts['resolved'] -= 1
+                if new == 'active':
+                    counts['active'] += 1
+                    counts['critical'] += critical
+                elif new == 'resolved':
+                    counts['resolved'] += 1
+            self._version += 1
+
+    def mark_stale(self):
+        """Forzar una reconciliación antes de la siguiente respuesta"""
+        with self._lock:
+            self._stale = True
+
+    def add_listener(self, listener):
+        """Registrar una función que recibe (métricas, campos cambiados) cuando cambian"""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def notify(self):
+        """
+        Publicar las métricas si cambiaron desde la última publicación.
+
+        Con los contadores pendientes de reconciliar no se publica (requeriría
+        consultar la base de datos); lo hará el hilo de reconciliación.
+        """
+        if not self._listeners or self._stale:
+            return
+        current = self.snapshot()
+        with self._lock:
+            previous = self._published
+            if previous is not None and previous['etag'] == current['etag']:
+                return
+            self._published = current
+        metrics = current['metrics']
+        changed = {
+            section: {
+                name: value for name, value in values.items()
+                if previous is None or previous['metrics'][section].get(name) != value
+            }
+            for section, values in metrics.items() if isinstance(values, dict)
+        }
+        changed = {section: values for section, values in changed.items() if values}
+        for listener in self._listeners:
+            listener(metrics, changed)
+
+    # --- Lectura ---
+
+    def snapshot(self, now=None):
+        """
+        Métricas actuales con su ETag y fecha de última modificación.
+
+        El resultado se recalcula solo si cambió la versión o avanzó el minuto
+        de la ventana; en otro caso se devuelve el mismo objeto.
+
+        Returns:
+            dict: metrics, values (sin redondear), etag y last_modified
+        """
+        now = now or datetime.utcnow()
+        if self._stale:
+            self.reconcile(now)
+
+        minute = _floor(now, RESOLUTIONS[0][1])
+        with self._lock:
+            computed = self._computed
+            if computed is not None and computed['version'] == self._version and computed['minute'] == minute:
+                return computed
+            values = self._compute(now, minute)
+            version = self._version
+
+        payload = self._payload(values)
+        etag = hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:20]
+        with self._lock:
+            previous = self._computed
+            if previous is not None and previous['etag'] == etag:
+                last_modified = previous['last_modified']
+            else:
+                # Last-Modified se expresa en segundos enteros: debe avanzar
+                # aunque el cambio ocurra en el mismo segundo que el anterior
+                last_modified = now.replace(microsecond=0)
+                if previous is not None and last_modified <= previous['last_modified']:
+                    last_modified = previous['last_modified'] + timedelta(seconds=1)
+            self._computed = computed = {
+                'version': version, 'minute': minute, 'values': values, 'etag': etag,
+                'last_modified': last_modified,
+                'metrics': {**payload, 'timestamp': last_modified.isoformat()}
+            }
+        return computed
+
+    def _compute(self, now, minute):
+        """Sumar los minutos dentro de la ventana (llamar con el lock tomado)"""
+        start = _floor(now - self.window, RESOLUTIONS[0][1])
+        end = minute + timedelta(minutes=1)
+
+        # Descartar minutos que salieron de la ventana
+        for buckets in self._buckets.values():
+            for bucket in [bucket for bucket in buckets if bucket < start]:
+                del buckets[bucket]
+        for module_id in [m for m, seen in self._last_seen.items() if seen < start]:
+            del self._last_seen[module_id]
+
+        totals = {}
+        for data_type, buckets in self._buckets.items():
+            sums = [0.0] * (len(_BUCKET_FIELDS[data_type]) + 1)
+            for bucket, values in buckets.items():
+                if bucket < end:
+                    for position, value in enumerate(values):
+                        sums[position] += value
+            totals[data_type] = sums
+
+        solar_count, power, efficiency = totals['solar']
+        env_count, temperature, irradiance, humidity = totals['environmental']
+        return {
+            'total_modules': len(self._modules),
+            'active_modules': sum(1 for seen in self._last_seen.values() if seen < end),
+            'total_power_generated': power,
+            'average_efficiency': efficiency / solar_count if solar_count else 0,
+            'total_anomalies': self._anomalies['active'],
+            'critical_anomalies': self._anomalies['critical'],
+            'resolved_anomalies': self._anomalies['resolved'],
+            'average_temperature': temperature / env_count if env_count else 0,
+            'average_irradiance': irradiance / env_count if env_count else 0,
+            'average_humidity': humidity / env_count if env_count else 0
+        }
+
+    @staticmethod
+    def _payload(values):
+        return {
+            'modules': {
+                'total': values['total_modules'],
+                'active': values['active_modules'],
+                'inactive': values['total_modules'] - values['active_modules']
+            },
+            'power': {
+                'total_generated_24h': round(values['total_power_generated'], 2),
+                'average_efficiency': round(values['average_efficiency'] * 100, 2)
+            },
+            'anomalies': {
+                'total_active': values['total_anomalies'],
+                'critical': values['critical_anomalies'],
+                'medium_high': values['total_anomalies'] - values['critical_anomalies'],
+                'resolved': values['resolved_anomalies']
+            },
+            'environment': {
+                'average_temperature': round(values['average_temperature'], 1),
+                'average_irradiance': round(values['average_irradiance'], 1),
+                'average_humidity': round(values['average_humidity'], 1)
+            }
+        }
+
+    # --- Instantáneas y reconciliación periódica ---
+
+    def save_snapshot(self, now=None):
+        """
+        Guardar las métricas actuales en SystemMetrics.
+
+        Se omite si otro proceso ya guardó una instantánea en la mitad del
+        intervalo, para no duplicar el histórico con varios workers.
+
+        Returns:
+            SystemMetrics: La fila creada o None si se omitió
+        """
+        now = now or datetime.utcnow()
+        if self.snapshot_seconds:
+            latest = db.session.execute(select(func.max(SystemMetrics.timestamp))).scalar()
+            if latest is not None and latest > now - timedelta(seconds=self.snapshot_seconds / 2):
+                return None
+        row = SystemMetrics(timestamp=now, created_at=now, **self.snapshot(now)['values'])
+        db.session.add(row)
+        db.session.commit()
+        with self._lock:
+            self._stats['snapshots'] += 1
+            self._stats['last_snapshot_at'] = now.isoformat()
+        return row
+
+    def start(self, app):
+        """Iniciar el hilo de reconciliación e instantáneas"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(app,),
+                                        name='dashboard-metrics', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, app):
+        next_snapshot = time.monotonic() + self.snapshot_seconds
+        while not self._stop.wait(self.reconcile_seconds):
+            with app.app_context():
+                try:
+                    self.reconcile()
+                    self.notify()
+                    if self.snapshot_seconds and time.monotonic() >= next_snapshot:
+                        self.save_snapshot()
+                        next_snapshot = time.monotonic() + self.snapshot_seconds
+                except Exception as e:
+                    db.session.rollback()
+                    with self._lock:
+                        self._stats['last_error'] = str(e)
+                finally:
+                    db.session.remove()
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                'version': self._version,
+                'stale': self._stale,
+                'reconcile_seconds': self.reconcile_seconds,
+                'snapshot_seconds': self.snapshot_seconds
+            }
+
+
+dashboard_metrics = DashboardMetrics()
+
+
+def history(start, end, limit):
+    """Instantáneas guardadas en [start, end), de la más antigua a la más reciente"""
+    rows = db.session.execute(
+        select(SystemMetrics).where(SystemMetrics.timestamp >= start, SystemMetrics.timestamp < end)
+        .order_by(SystemMetrics.timestamp.desc()).limit(limit)
+    ).scalars().all()
+    return [row.to_dict() for row in reversed(rows)]
+
+
+_anomaly_listeners = []
+
+
+def register_anomaly_listener(listener):
+    """Registrar una función que recibe las anomalías creadas o cambiadas de estado (tras confirmar)"""
+    if listener not in _anomaly_listeners:
+        _anomaly_listeners.append(listener)
+
+
+def _anomaly_record(obj):
+    return {column.name: getattr(obj, column.key) for column in AnomalyDetection.__mapper__.columns}
+
+
+def record_anomalies(records, session=None):
+    """Registrar anomalías insertadas con sentencias Core (se aplican al confirmar session)"""
+    changes = [(None, record.get('status', 'active'), record.get('severity_level'), record)
+               for record in records]
+    if changes:
+        (session or db.session).info.setdefault(_PENDING_KEY, []).append(('anomalies', changes))
+
+
+def _stage_readings(data_type, records):
+    """Listener de ingesta: aplazar la actualización hasta la confirmación"""
+    db.session.info.setdefault(_PENDING_KEY, []).append((data_type, records))
+
+
+def _stage_overwritten(data_type, records):
+    """Listener de actualización: los valores anteriores no se conocen, reconciliar"""
+    db.session.info.setdefault(_PENDING_KEY, []).append(('stale', None))
+
+
+@event.listens_for(Session, 'after_flush')
+def _stage_orm_anomalies(session, flush_context):
+    """Detectar anomalías creadas, resueltas o eliminadas como objetos ORM"""
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, AnomalyDetection):
+            changes.append((None, obj.status or 'active', obj.severity_level, _anomaly_record(obj)))
+    for obj in session.dirty:
+        if isinstance(obj, AnomalyDetection):
+            history = inspect(obj).attrs.status.history
+            if history.added and history.deleted and history.added[0] != history.deleted[0]:
+                changes.append((history.deleted[0], history.added[0], obj.severity_level,
+                                _anomaly_record(obj)))
+    for obj in session.deleted:
+        if isinstance(obj, AnomalyDetection):
+            changes.append((obj.status, None, obj.severity_level, None))
+    if changes:
+        session.info.setdefault(_PENDING_KEY, []).append(('anomalies', changes))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_committed(session):
+    pending = session.info.pop(_PENDING_KEY, [])
+    for kind, payload in pending:
+        if kind == 'anomalies':
+            dashboard_metrics.apply_anomalies(payload)
+            records = [record for _, _, _, record in payload if record is not None]
+            for listener in _anomaly_listeners:
+                listener(records)
+        elif kind == 'stale':
+            dashboard_metrics.mark_stale()
+        else:
+            dashboard_metrics.apply_readings(kind, payload)
+    if pending:
+        dashboard_metrics.notify()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def init_dashboard_metrics(app):
+    """Registrar los listeners, cargar los contadores e iniciar la reconciliación"""
+    dashboard_metrics.configure(
+        reconcile_seconds=app.config.get('DASHBOARD_RECONCILE_SECONDS', DEFAULT_RECONCILE_SECONDS),
+        snapshot_seconds=app.config.get('DASHBOARD_SNAPSHOT_SECONDS', DEFAULT_SNAPSHOT_SECONDS)
+    )
+    register_ingest_listener(_stage_readings)
+    register_update_listener(_stage_overwritten)
+    with app.app_context():
+        dashboard_metrics.reconcile()
+    dashboard_metrics.start(app)
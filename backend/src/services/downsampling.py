@@ -0,0 +1,133 @@
+"""
+Reducción de series temporales para gráficos - HelioSentinel
+
+Las series se reciben como DataFrames con columnas bucket_start, count y
+{métrica}_sum/_min/_max (una lectura cruda equivale a count=1 y sum=min=max).
+"""
+
+import numpy as np
+import pandas as pd
+
+METRICS = ['power', 'efficiency', 'temperature']
+
+# Métrica que se muestra en porcentaje
+PERCENT_METRICS = {'efficiency'}
+
+DEFAULT_MAX_POINTS = 1000
+MAX_POINTS_LIMIT = 20000
+METHODS = ('lttb', 'minmax')
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Índices seleccionados por Largest-Triangle-Three-Buckets.
+
+    Variante vectorizada: el vértice anterior de cada triángulo es el
+    promedio del intervalo previo en lugar del punto ya elegido, lo que
+    permite evaluar todos los intervalos a la vez sin bucles en Python.
+
+    Args:
+        x (np.ndarray): Eje x ordenado (float)
+        y (np.ndarray): Valores
+        n_out (int): Puntos de salida (incluye el primero y el último)
+
+    Returns:
+        np.ndarray: Índices ordenados de los puntos conservados
+    """
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+
+    # Intervalos para los puntos interiores [1, n-1)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    counts = np.diff(edges)
+    starts = edges[:-1] - 1
+    bucket = np.repeat(np.arange(n_out - 2), counts)
+
+    px, py = x[1:-1], y[1:-1]
+    avg_x = np.add.reduceat(px, starts) / counts
+    avg_y = np.add.reduceat(py, starts) / counts
+
+    # Vértices A (intervalo previo) y C (intervalo siguiente) de cada punto
+    ax, ay = np.r_[x[0], avg_x[:-1]][bucket], np.r_[y[0], avg_y[:-1]][bucket]
+    cx, cy = np.r_[avg_x[1:], x[-1]][bucket], np.r_[avg_y[1:], y[-1]][bucket]
+    areas = np.abs((ax - cx) * (py - ay) - (ax - px) * (cy - ay))
+
+    # El último elemento de cada intervalo tras ordenar por área es el máximo
+    order = np.lexsort((areas, bucket))
+    selected = order[np.cumsum(counts) - 1] + 1
+    return np.r_[0, selected, n - 1]
+
+
+def minmax_buckets(frame, n_out):
+    """
+    Reagrupar la serie en n_out intervalos con mínimo, máximo y promedio.
+
+    Returns:
+        pd.DataFrame: Serie con las mismas columnas que la entrada
+    """
+    n = len(frame)
+    if n <= n_out:
+        return frame
+
+    starts = np.flatnonzero(np.diff(np.r_[-1, np.arange(n) * n_out // n]))
+    result = {'bucket_start': frame['bucket_start'].to_numpy()[starts]}
+    result['count'] = np.add.reduceat(frame['count'].to_numpy(dtype=float), starts)
+    for metric in METRICS:
+        result[f'{metric}_sum'] = np.add.reduceat(frame[f'{metric}_sum'].to_numpy(dtype=float), starts)
+        result[f'{metric}_min'] = np.minimum.reduceat(frame[f'{metric}_min'].to_numpy(dtype=float), starts)
+        result[f'{metric}_max'] = np.maximum.reduceat(frame[f'{metric}_max'].to_numpy(dtype=float), starts)
+    return pd.DataFrame(result)
+
+
+def raw_to_series(frame):
+    """Adaptar lecturas crudas (timestamp, max_power, efficiency, cell_temperature)"""
+    columns = {'power': 'max_power', 'efficiency': 'efficiency', 'temperature': 'cell_temperature'}
+    series = pd.DataFrame({'bucket_start': frame['timestamp'], 'count': 1})
+    for metric, source in columns.items():
+        values = frame[source].to_numpy(dtype=float)
+        series[f'{metric}_sum'] = values
+        series[f'{metric}_min'] = values
+        series[f'{metric}_max'] = values
+    return series
+
+
+def chart_series(frame, max_points=DEFAULT_MAX_POINTS, method='lttb'):
+    """
+    Reducir una serie a max_points puntos y formatearla para el gráfico.
+
+    Args:
+        frame (pd.DataFrame): Serie ordenada por bucket_start
+        max_points (int): Máximo de puntos devueltos
+        method (str): 'lttb' (forma de la curva) o 'minmax' (envolventes)
+
+    Returns:
+        dict: Listas paralelas de timestamps y métricas
+    """
+    original_points = len(frame)
+
+    if original_points > max_points:
+        if method == 'lttb':
+            x = frame['bucket_start'].to_numpy(dtype='datetime64[ns]').astype(np.int64).astype(float)
+            y = (frame['power_sum'] / frame['count']).to_numpy(dtype=float)
+            frame = frame.iloc[lttb_indices(x, y, max_points)]
+        else:
+            frame = minmax_buckets(frame, max_points)
+
+    counts = frame['count'].to_numpy(dtype=float)
+    data = {
+        'timestamps': [pd.Timestamp(ts).isoformat() for ts in frame['bucket_start']]
+    }
+    for metric in METRICS:
+        scale = 100 if metric in PERCENT_METRICS else 1
+        data[metric] = (frame[f'{metric}_sum'].to_numpy(dtype=float) / counts * scale).tolist()
+        if method == 'minmax':
+            data[f'{metric}_min'] = (frame[f'{metric}_min'].to_numpy(dtype=float) * scale).tolist()
+            data[f'{metric}_max'] = (frame[f'{metric}_max'].to_numpy(dtype=float) * scale).tolist()
+
+    data['downsampling'] = {
+        'method': method if original_points > max_points else None,
+        'points': len(frame),
+        'original_points': original_points
+    }
+    return data
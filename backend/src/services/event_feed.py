@@ -0,0 +1,290 @@
+"""
+Canal de eventos en vivo (Server-Sent Events) - HelioSentinel
+
+Las lecturas confirmadas, las anomalías creadas o resueltas y los cambios de
+las métricas del dashboard se publican en un broker local. Cada suscriptor
+tiene su propia cola acotada y sus filtros (tipo de evento, module_id,
+location_id): una ingesta se reparte en memoria a todos los suscriptores sin
+consultar la base de datos por cada uno.
+
+El broker es local al proceso. Con varios workers cada suscriptor recibe las
+lecturas y anomalías escritas por su worker (y las métricas reconciliadas);
+un broker compartido (p. ej. pub/sub de Redis) puede reemplazar a LocalBroker
+implementando publish/subscribe.
+"""
+
+from collections import deque
+from datetime import date, datetime
+import json
+import queue
+import threading
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from src.models.solar_data import db
+from src.services.dashboard_metrics import dashboard_metrics, register_anomaly_listener
+from src.services.ingestion import INGEST_SCHEMAS, register_ingest_listener, register_update_listener
+
+TOPICS = ('readings', 'anomalies', 'metrics')
+
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_REPLAY_SIZE = 1000
+DEFAULT_MAX_SUBSCRIBERS = 200
+DEFAULT_HEARTBEAT_SECONDS = 15
+
+# Lecturas por evento; los lotes grandes se reparten en varios eventos
+MAX_EVENT_READINGS = 500
+
+_PENDING_KEY = 'event_feed_pending'
+
+
+class TooManySubscribers(Exception):
+    """Se alcanzó el máximo de suscriptores del proceso"""
+
+
+class Event:
+    """Evento publicado; el cuerpo se serializa una sola vez para todos los suscriptores"""
+
+    __slots__ = ('id', 'topic', 'data_type', 'keys', 'payload', '_encoded')
+
+    def __init__(self, topic, payload, data_type=None, keys=None):
+        self.id = None
+        self.topic = topic
+        self.data_type = data_type
+        self.keys = keys
+        self.payload = payload
+        self._encoded = None
+
+    def encode(self, payload=None):
+        """Mensaje SSE (id, event, data) listo para enviar"""
+        if payload is not None:
+            return _sse(self.id, self.topic, payload)
+        if self._encoded is None:
+            self._encoded = _sse(self.id, self.topic, self.payload)
+        return self._encoded
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'Tipo no serializable: {type(value).__name__}')
+
+
+def _sse(event_id, topic, payload):
+    data = json.dumps(payload, default=_json_default, ensure_ascii=False)
+    return f'id: {event_id}\nevent: {topic}\ndata: {data}\n\n'
+
+
+class Subscription:
+    """Cola acotada de eventos de un cliente con sus filtros"""
+
+    def __init__(self, broker, topics, module_ids=None, location_ids=None, max_queue=DEFAULT_QUEUE_SIZE):
+        self.broker = broker
+        self.topics = set(topics)
+        self.module_ids = set(module_ids) if module_ids else None
+        self.location_ids = set(location_ids) if location_ids else None
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+
+    def _keys_filter(self, data_type):
+        """Claves aceptadas para el tipo de datos (None = todas)"""
+        return self.location_ids if data_type == 'environmental' else self.module_ids
+
+    def message(self, event):
+        """
+        Mensaje SSE del evento para este suscriptor o None si no le corresponde.
+
+        Los eventos de lecturas se recortan a las claves filtradas; los de
+        métricas no se filtran.
+        """
+        if event.topic not in self.topics:
+            return None
+        if event.keys is None:
+            return event.encode()
+        accepted = self._keys_filter(event.data_type)
+        if accepted is None:
+            return event.encode()
+        if accepted.isdisjoint(event.keys):
+            return None
+        if event.topic != 'readings':
+            return event.encode()
+        key_field = INGEST_SCHEMAS[event.data_type]['id_field']
+        readings = [r for r in event.payload['readings'] if r[key_field] in accepted]
+        return event.encode({**event.payload, 'readings': readings, 'count': len(readings)})
+
+    def offer(self, message):
+        """Encolar sin bloquear; si la cola está llena se vacía y se pide resincronizar"""
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.dropped += self._queue.qsize()
+            with self._queue.mutex:
+                self._queue.queue.clear()
+            self._queue.put_nowait(_sse('', 'resync', {'reason': 'queue_full'}))
+
+    def get(self, timeout):
+        """Siguiente mensaje o None si no llega en timeout segundos"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """Publicación y suscripción en memoria del proceso"""
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE, replay_size=DEFAULT_REPLAY_SIZE,
+                 max_subscribers=DEFAULT_MAX_SUBSCRIBERS):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._replay = deque(maxlen=replay_size)
+        self._next_id = 1
+        self._stats = {'published': 0, 'delivered': 0, 'dropped': 0}
+
+    def configure(self, queue_size=None, replay_size=None, max_subscribers=None):
+        if queue_size is not None:
+            self.queue_size = max(1, queue_size)
+        if replay_size is not None:
+            with self._lock:
+                self._replay = deque(self._replay, maxlen=max(0, replay_size))
+        if max_subscribers is not None:
+            self.max_subscribers = max(1, max_subscribers)
+
+    def subscribe(self, topics=TOPICS, module_ids=None, location_ids=None, last_event_id=None):
+        """
+        Crear una suscripción; con last_event_id se reenvían los eventos
+        posteriores que sigan en el búfer de repetición.
+
+        Raises:
+            TooManySubscribers: Si se alcanzó max_subscribers
+        """
+        subscription = Subscription(self, topics, module_ids, location_ids, self.queue_size)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribers(
+                    f'Se alcanzó el máximo de {self.max_subscribers} suscriptores'
+                )
+            if last_event_id is not None:
+                if self._replay and self._replay[0].id > last_event_id + 1:
+                    # Parte de los eventos ya salió del búfer de repetición
+                    subscription.offer(_sse('', 'resync', {'reason': 'replay_expired'}))
+                for past in self._replay:
+                    if past.id > last_event_id:
+                        message = subscription.message(past)
+                        if message is not None:
+                            subscription.offer(message)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+                self._stats['dropped'] += subscription.dropped
+
+    def publish(self, event):
+        """Asignar id al evento y repartirlo a los suscriptores que lo aceptan"""
+        with self._lock:
+            event.id = self._next_id
+            self._next_id += 1
+            self._replay.append(event)
+            subscribers = list(self._subscribers)
+            self._stats['published'] += 1
+        delivered = 0
+        for subscription in subscribers:
+            message = subscription.message(event)
+            if message is not None:
+                subscription.offer(message)
+                delivered += 1
+        with self._lock:
+            self._stats['delivered'] += delivered
+
+    @property
+    def last_event_id(self):
+        return self._next_id - 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                'subscribers': len(self._subscribers),
+                'dropped': self._stats['dropped'] + sum(s.dropped for s in self._subscribers),
+                'last_event_id': self._next_id - 1,
+                'max_subscribers': self.max_subscribers,
+                'queue_size': self.queue_size
+            }
+
+
+broker = LocalBroker()
+
+
+def publish_readings(data_type, records, status='inserted'):
+    """Publicar lecturas confirmadas en eventos de hasta MAX_EVENT_READINGS"""
+    key_field = INGEST_SCHEMAS[data_type]['id_field']
+    for start in range(0, len(records), MAX_EVENT_READINGS):
+        chunk = records[start:start + MAX_EVENT_READINGS]
+        broker.publish(Event('readings', {
+            'data_type': data_type,
+            'status': status,
+            'count': len(chunk),
+            'readings': chunk
+        }, data_type=data_type, keys={record[key_field] for record in chunk}))
+
+
+def publish_anomalies(records):
+    """Listener de anomalías: un evento por anomalía creada o cambiada de estado"""
+    for record in records:
+        broker.publish(Event('anomalies', record, data_type='solar', keys={record['module_id']}))
+
+
+def publish_metrics(metrics, changed):
+    """Listener de métricas: valores completos y campos que cambiaron"""
+    broker.publish(Event('metrics', {'metrics': metrics, 'changed': changed}))
+
+
+def current_metrics_message():
+    """Mensaje inicial con las métricas actuales para un suscriptor nuevo"""
+    metrics = dashboard_metrics.snapshot()['metrics']
+    changed = {section: values for section, values in metrics.items() if isinstance(values, dict)}
+    return _sse(broker.last_event_id, 'metrics', {'metrics': metrics, 'changed': changed})
+
+
+def _stage_inserted(data_type, records):
+    db.session.info.setdefault(_PENDING_KEY, []).append((data_type, records, 'inserted'))
+
+
+def _stage_updated(data_type, records):
+    db.session.info.setdefault(_PENDING_KEY, []).append((data_type, records, 'updated'))
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_committed(session):
+    for data_type, records, status in session.info.pop(_PENDING_KEY, []):
+        publish_readings(data_type, records, status)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def init_event_feed(app):
+    """Configurar el broker y registrar los listeners de lecturas, anomalías y métricas"""
+    broker.configure(
+        queue_size=app.config.get('EVENT_FEED_QUEUE_SIZE', DEFAULT_QUEUE_SIZE),
+        replay_size=app.config.get('EVENT_FEED_REPLAY_SIZE', DEFAULT_REPLAY_SIZE),
+        max_subscribers=app.config.get('EVENT_FEED_MAX_SUBSCRIBERS', DEFAULT_MAX_SUBSCRIBERS)
+    )
+    register_ingest_listener(_stage_inserted)
+    register_update_listener(_stage_updated)
+    register_anomaly_listener(publish_anomalies)
+    dashboard_metrics.add_listener(publish_metrics)
@@ -0,0 +1,407 @@
+"""
+Almacén en memoria de las lecturas más recientes - HelioSentinel
+
+Mantiene por módulo (o ubicación) un búfer acotado con sus últimas lecturas
+en arreglos NumPy ordenados por (timestamp, id), más un búfer global con las
+más recientes de toda la flota. /api/data/latest se responde desde memoria;
+la base de datos solo se consulta al arrancar o cuando el búfer no cubre la
+petición (más historia de la que cabe o un módulo que aún no está cargado).
+
+Las lecturas ingeridas se aplican al confirmar la transacción. Las escritas
+por otros procesos del servidor se incorporan desde un hilo de fondo cada
+HOT_STORE_SYNC_SECONDS, leyendo por id las filas posteriores a la última
+vista (las peticiones no consultan la base de datos para ello).
+"""
+
+from collections import OrderedDict
+from datetime import timedelta
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from src.models.solar_data import db
+from src.services.ingestion import INGEST_SCHEMAS, register_ingest_listener, register_update_listener
+from src.services.range_reader import row_to_dict
+
+# Lecturas conservadas por módulo/ubicación y en el búfer global
+DEFAULT_CAPACITY = 32
+DEFAULT_GLOBAL_CAPACITY = 1000
+
+# Módulos/ubicaciones en memoria; los menos consultados se descartan primero
+DEFAULT_MAX_KEYS = 10000
+
+# Ventana de lecturas cargadas por módulo al arrancar
+DEFAULT_WARMUP_HOURS = 48
+
+# Filas nuevas de otros procesos por encima de las cuales se recarga todo
+MAX_SYNC_ROWS = 50000
+
+# Segundos entre lecturas de las filas de otros procesos (0 = desactivado)
+DEFAULT_SYNC_SECONDS = 1.0
+
+# Ids ya vistos que se releen en cada sincronización: en PostgreSQL una
+# transacción puede confirmar ids menores después que otra los mayores
+DEFAULT_SYNC_OVERLAP = 200
+
+_PENDING_KEY = 'hot_store_pending'
+
+# Almacenes activos por tipo de datos (vacío hasta init_hot_stores)
+hot_stores = {}
+
+
+class _Buffer:
+    """
+    Últimas lecturas de un módulo o de la flota, ordenadas por (timestamp, id).
+
+    valid_from indica desde qué instante el búfer contiene todas las lecturas
+    existentes (None: contiene todas).
+    """
+
+    def __init__(self, capacity, n_values, valid_from=None):
+        self.capacity = capacity
+        self.valid_from = valid_from
+        self.columns = {
+            'id': np.empty(0, dtype=np.int64),
+            'timestamp': np.empty(0, dtype='datetime64[us]'),
+            'created_at': np.empty(0, dtype='datetime64[us]'),
+            'key': np.empty(0, dtype=object),
+            'values': np.empty((0, n_values))
+        }
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def merge(self, rows):
+        """Incorporar lecturas conservando las `capacity` más recientes"""
+        if not len(rows['id']):
+            return
+        current = self.columns
+        if len(self):
+            # Las lecturas con un id ya presente reemplazan a la versión anterior
+            kept = ~np.isin(current['id'], rows['id'])
+            if not kept.all():
+                current = {name: values[kept] for name, values in current.items()}
+
+        combined = {
+            name: np.concatenate((current[name], rows[name]))
+            for name in self.columns
+        }
+        order = np.lexsort((combined['id'], combined['timestamp']))
+        if len(order) > self.capacity:
+            order = order[-self.capacity:]
+            oldest = combined['timestamp'][order[0]]
+            if self.valid_from is None or oldest > self.valid_from:
+                self.valid_from = oldest
+        self.columns = {name: values[order] for name, values in combined.items()}
+
+    def covers(self, limit):
+        """Indicar si las `limit` lecturas más recientes están en memoria"""
+        if len(self) >= limit:
+            return self.valid_from is None or self.columns['timestamp'][-limit] >= self.valid_from
+        return self.valid_from is None
+
+    def latest(self, limit):
+        """Columnas de las `limit` lecturas más recientes, de la más nueva a la más antigua"""
+        selected = np.arange(len(self) - 1, max(len(self) - limit, 0) - 1, -1)
+        return {name: values[selected] for name, values in self.columns.items()}
+
+
+class HotStore:
+    """Lecturas más recientes de un tipo de datos (solar o ambiental)"""
+
+    def __init__(self, data_type, capacity=DEFAULT_CAPACITY,
+                 global_capacity=DEFAULT_GLOBAL_CAPACITY, max_keys=DEFAULT_MAX_KEYS,
+                 sync_overlap=DEFAULT_SYNC_OVERLAP):
+        schema = INGEST_SCHEMAS[data_type]
+        self.data_type = data_type
+        self.model = schema['model']
+        self.key_field = schema['id_field']
+        self.value_fields = schema['numeric_fields'] + list(schema['optional_fields'])
+        self.capacity = capacity
+        self.global_capacity = global_capacity
+        self.max_keys = max_keys
+        self.sync_overlap = sync_overlap
+
+        self._lock = threading.RLock()
+        self._buffers = OrderedDict()
+        self._global = self._new_buffer(global_capacity)
+        self.warm = False
+        self.last_seen_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.sync_error = None
+
+    def _new_buffer(self, capacity, valid_from=None):
+        return _Buffer(capacity, len(self.value_fields), valid_from)
+
+    def _to_columns(self, rows):
+        """Transponer lecturas (diccionarios o filas mapping) a arreglos"""
+        n = len(rows)
+        return {
+            'id': np.fromiter((row['id'] for row in rows), dtype=np.int64, count=n),
+            'timestamp': np.array([row['timestamp'] for row in rows], dtype='datetime64[us]'),
+            'created_at': np.array([row.get('created_at') for row in rows], dtype='datetime64[us]'),
+            'key': np.array([row[self.key_field] for row in rows], dtype=object),
+            'values': np.array(
+                [[row[field] for field in self.value_fields] for row in rows], dtype=float
+            ).reshape(n, len(self.value_fields))
+        }
+
+    def _to_dicts(self, columns):
+        """Serializar columnas con el mismo formato que to_dict()"""
+        timestamps = columns['timestamp'].astype(object)
+        created = columns['created_at'].astype(object)
+        values = np.where(np.isnan(columns['values']), None, columns['values'])
+        rows = []
+        for i in range(len(columns['id'])):
+            row = {
+                'id': int(columns['id'][i]),
+                'timestamp': timestamps[i].isoformat(),
+                self.key_field: columns['key'][i]
+            }
+            row.update(zip(self.value_fields, values[i].tolist()))
+            row['created_at'] = created[i].isoformat() if created[i] is not None else None
+            rows.append(row)
+        return rows
+
+    def _split_by_key(self, columns):
+        """Agrupar columnas por módulo/ubicación: genera (clave, columnas)"""
+        codes, keys = pd.factorize(columns['key'])
+        order = np.argsort(codes, kind='stable')
+        bounds = np.cumsum(np.bincount(codes, minlength=len(keys)))[:-1]
+        for key, positions in zip(keys, np.split(order, bounds)):
+            yield key, {name: values[positions] for name, values in columns.items()}
+
+    def _select(self):
+        return select(*self.model.__table__.columns)
+
+    def apply(self, rows):
+        """Incorporar lecturas confirmadas a los búferes ya cargados"""
+        if not rows:
+            return
+        columns = self._to_columns(rows)
+
+        with self._lock:
+            self._global.merge(columns)
+            for key, key_columns in self._split_by_key(columns):
+                # Los módulos aún no cargados se leen de la base de datos al pedirlos
+                buffer = self._buffers.get(key)
+                if buffer is not None:
+                    buffer.merge(key_columns)
+
+            # Avanzar la última posición vista si no quedan huecos de otros procesos
+            ids = columns['id']
+            if ids.min() == self.last_seen_id + 1 and ids.max() - ids.min() + 1 == len(ids):
+                self.last_seen_id = int(ids.max())
+
+    def _put_buffer(self, key, buffer):
+        self._buffers[key] = buffer
+        self._buffers.move_to_end(key)
+        while len(self._buffers) > self.max_keys:
+            self._buffers.popitem(last=False)
+
+    def warm_up(self, hours=DEFAULT_WARMUP_HOURS):
+        """
+        Cargar las lecturas más recientes de cada módulo desde la base de datos.
+
+        Returns:
+            int: Módulos/ubicaciones cargados
+        """
+        model = self.model
+        key_column = getattr(model, self.key_field)
+        last_id = db.session.execute(select(func.max(model.id))).scalar() or 0
+        newest = db.session.execute(select(func.max(model.timestamp))).scalar()
+
+        global_buffer = self._new_buffer(self.global_capacity)
+        buffers = OrderedDict()
+        if newest is not None:
+            latest = db.session.execute(
+                self._select().order_by(model.timestamp.desc(), model.id.desc())
+                .limit(self.global_capacity)
+            ).mappings().all()
+            global_buffer.merge(self._to_columns(latest))
+            if len(latest) == self.global_capacity:
+                global_buffer.valid_from = global_buffer.columns['timestamp'][0]
+
+            since = newest - timedelta(hours=hours)
+            rank = func.row_number().over(
+                partition_by=key_column,
+                order_by=(model.timestamp.desc(), model.id.desc())
+            ).label('rank')
+            ranked = self._select().add_columns(rank).where(model.timestamp >= since).subquery()
+            rows = db.session.execute(
+                select(*[ranked.c[column.name] for column in model.__table__.columns])
+                .where(ranked.c.rank <= self.capacity)
+            ).mappings().all()
+
+            if rows:
+                for key, key_columns in self._split_by_key(self._to_columns(rows)):
+                    buffer = self._new_buffer(self.capacity, np.datetime64(since, 'us'))
+                    buffer.merge(key_columns)
+                    buffers[key] = buffer
+
+        with self._lock:
+            self._global = global_buffer
+            self._buffers = OrderedDict()
+            for key, buffer in buffers.items():
+                self._put_buffer(key, buffer)
+            self.last_seen_id = last_id
+            self.warm = True
+        return len(buffers)
+
+    def sync(self):
+        """
+        Incorporar las lecturas confirmadas por otros procesos desde la última vista.
+
+        Se releen además los últimos sync_overlap ids ya vistos para recoger
+        las filas confirmadas fuera de orden; una lectura con un id presente
+        reemplaza a la anterior, por lo que releerlas no duplica nada.
+        """
+        model = self.model
+        since = max(0, self.last_seen_id - self.sync_overlap)
+        rows = db.session.execute(
+            self._select().where(model.id > since)
+            .order_by(model.id.asc()).limit(MAX_SYNC_ROWS + 1)
+        ).mappings().all()
+        if len(rows) > MAX_SYNC_ROWS:
+            self.warm_up()
+            return
+        self.apply(rows)
+        if rows:
+            with self._lock:
+                self.last_seen_id = max(self.last_seen_id, rows[-1]['id'])
+
+    def latest(self, key=None, limit=10):
+        """
+        Últimas lecturas desde memoria.
+
+        Returns:
+            list: Lecturas serializadas o None si el búfer no cubre la petición
+        """
+        with self._lock:
+            buffer = self._global if key is None else self._buffers.get(key)
+            if not self.warm or buffer is None or not buffer.covers(limit):
+                self.misses += 1
+                return None
+            if key is not None:
+                self._buffers.move_to_end(key)
+            self.hits += 1
+            columns = buffer.latest(limit)
+        return self._to_dicts(columns)
+
+    def fill(self, key, rows, limit):
+        """Cargar en memoria el resultado de una consulta tras un fallo"""
+        buffer = self._new_buffer(self.capacity if key is not None else self.global_capacity)
+        if rows:
+            buffer.merge(self._to_columns(rows))
+            if len(rows) >= limit:
+                oldest = buffer.columns['timestamp'][0]
+                if buffer.valid_from is None or oldest > buffer.valid_from:
+                    buffer.valid_from = oldest
+        with self._lock:
+            if key is None:
+                self._global = buffer
+            else:
+                self._put_buffer(key, buffer)
+
+    def stats(self):
+        """Tamaño y aciertos del almacén"""
+        with self._lock:
+            return {
+                'warm': self.warm,
+                'keys': len(self._buffers),
+                'readings': len(self._global) + sum(len(b) for b in self._buffers.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'last_seen_id': self.last_seen_id,
+                'sync_error': self.sync_error
+            }
+
+
+def latest_statement(data_type, key_value=None, limit=10):
+    """Últimas lecturas en la base de datos, de la más nueva a la más antigua"""
+    model = INGEST_SCHEMAS[data_type]['model']
+    stmt = select(*model.__table__.columns)
+    if key_value:
+        stmt = stmt.where(getattr(model, INGEST_SCHEMAS[data_type]['id_field']) == key_value)
+    return stmt.order_by(model.timestamp.desc(), model.id.desc()).limit(limit)
+
+
+def latest_readings(data_type, key_value=None, limit=10):
+    """
+    Últimas lecturas de un tipo de datos, desde memoria o desde la base de datos.
+
+    Returns:
+        list: Lecturas con el mismo formato que to_dict()
+    """
+    key_value = key_value or None
+    store = hot_stores.get(data_type)
+    if store is not None and store.warm:
+        rows = store.latest(key_value, limit)
+        if rows is not None:
+            return rows
+
+    rows = db.session.execute(latest_statement(data_type, key_value, limit)).mappings().all()
+
+    if store is not None and store.warm:
+        store.fill(key_value, rows, limit)
+    return [row_to_dict(row) for row in rows]
+
+
+def _stage_readings(data_type, records):
+    """Listener de ingesta: aplazar la actualización hasta la confirmación"""
+    if data_type in hot_stores:
+        db.session.info.setdefault(_PENDING_KEY, []).append((data_type, records))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_committed(session):
+    for data_type, records in session.info.pop(_PENDING_KEY, []):
+        hot_stores[data_type].apply(records)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def _sync_loop(app, interval):
+    """Incorporar periódicamente las lecturas de otros procesos"""
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            for store in hot_stores.values():
+                try:
+                    store.sync()
+                    store.sync_error = None
+                except Exception as e:
+                    db.session.rollback()
+                    store.sync_error = str(e)
+            db.session.remove()
+
+
+def init_hot_stores(app):
+    """Crear los almacenes, registrar el listener de ingesta, cargarlos e iniciar la sincronización"""
+    for data_type in INGEST_SCHEMAS:
+        hot_stores[data_type] = HotStore(
+            data_type,
+            capacity=app.config.get('HOT_STORE_CAPACITY', DEFAULT_CAPACITY),
+            global_capacity=app.config.get('HOT_STORE_GLOBAL_CAPACITY', DEFAULT_GLOBAL_CAPACITY),
+            max_keys=app.config.get('HOT_STORE_MAX_KEYS', DEFAULT_MAX_KEYS),
+            sync_overlap=app.config.get('HOT_STORE_SYNC_OVERLAP', DEFAULT_SYNC_OVERLAP)
+        )
+    register_ingest_listener(_stage_readings)
+    register_update_listener(_stage_readings)
+    with app.app_context():
+        for store in hot_stores.values():
+            store.warm_up(app.config.get('HOT_STORE_WARMUP_HOURS', DEFAULT_WARMUP_HOURS))
+
+    interval = app.config.get('HOT_STORE_SYNC_SECONDS', DEFAULT_SYNC_SECONDS)
+    if interval > 0:
+        threading.Thread(
+            target=_sync_loop, args=(app, interval), name='hot-store-sync', daemon=True
+        ).start()
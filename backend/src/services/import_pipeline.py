@@ -0,0 +1,325 @@
+"""
+Pipeline de importación paralela para cargas históricas masivas - HelioSentinel
+
+Los archivos se dividen en bloques que se analizan y validan en un pool de
+procesos; un único escritor (el proceso que ejecuta el pipeline) inserta cada
+bloque validado con una sola sentencia masiva.
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import csv
+import io
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+
+import click
+import numpy as np
+import pandas as pd
+from flask.cli import with_appcontext
+
+from src.models.solar_data import db
+from src.services.ingestion import (
+    MAX_REPORTED_ERRORS, get_schema, required_columns, validate_frame,
+    frame_to_records, upsert_records
+)
+
+# Tamaño por defecto de los bloques de CSV (bytes) y de XLSX (filas)
+DEFAULT_CHUNK_BYTES = 8 * 1024 * 1024
+DEFAULT_CHUNK_ROWS = 50000
+
+# Trabajos de importación lanzados desde la API
+import_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def _parse_csv_block(path, start, end, columns, data_type, now):
+    """Analizar y validar un rango de bytes de un CSV (se ejecuta en el pool)"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        buffer = f.read(end - start)
+
+    id_field = get_schema(data_type)['id_field']
+    df = pd.read_csv(
+        io.BytesIO(buffer), header=None, names=columns, encoding='utf-8',
+        dtype={id_field: str, 'timestamp': str}, low_memory=False
+    )
+    return _validate_block(df, data_type, now)
+
+
+def _parse_row_block(rows, columns, data_type, now):
+    """Validar un bloque de filas leídas de una hoja Excel (se ejecuta en el pool)"""
+    df = pd.DataFrame.from_records(rows, columns=columns)
+    return _validate_block(df, data_type, now)
+
+
+def _validate_block(df, data_type, now):
+    """Devolver las filas válidas, los errores por posición y el total de filas"""
+    clean, row_errors = validate_frame(df, data_type, now=now)
+    rejected = np.flatnonzero(~pd.isna(row_errors))
+    errors = [(int(pos), row_errors[pos]) for pos in rejected]
+    return clean, errors, len(df)
+
+
+def _check_columns(columns, data_type):
+    """Verificar que la cabecera contenga las columnas requeridas"""
+    missing_columns = [col for col in required_columns(data_type) if col not in columns]
+    if missing_columns:
+        raise ValueError(f'Columnas faltantes: {missing_columns}')
+
+
+def _csv_tasks(path, data_type, now, chunk_bytes):
+    """
+    Preparar las tareas de un CSV como rangos de bytes alineados a fin de línea.
+
+    Los rangos se calculan sin analizar el contenido, por lo que el archivo no
+    debe contener saltos de línea dentro de campos entrecomillados.
+    """
+    with open(path, 'rb') as f:
+        header = f.readline()
+        data_start = f.tell()
+
+    columns = [col.strip() for col in next(csv.reader([header.decode('utf-8-sig')]), [])]
+    _check_columns(columns, data_type)
+    size = os.path.getsize(path)
+
+    def tasks():
+        with open(path, 'rb') as f:
+            start = data_start
+            while start < size:
+                f.seek(min(start + chunk_bytes, size))
+                f.readline()
+                end = f.tell()
+                yield _parse_csv_block, (path, start, end, columns, data_type, now), end
+                start = end
+
+    return tasks(), size
+
+
+def _xlsx_tasks(path, data_type, now, chunk_rows, sheet_name=0):
+    """Preparar las tareas de una hoja Excel como bloques de filas (lectura read-only)"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    sheet = workbook.worksheets[sheet_name] if isinstance(sheet_name, int) else workbook[sheet_name]
+    rows = sheet.iter_rows(values_only=True)
+
+    header = next(rows, None) or ()
+    columns = [str(col).strip() if col is not None else '' for col in header]
+    try:
+        _check_columns(columns, data_type)
+    except ValueError:
+        workbook.close()
+        raise
+
+    def tasks():
+        try:
+            block = []
+            for row in rows:
+                block.append(row)
+                if len(block) >= chunk_rows:
+                    yield _parse_row_block, (block, columns, data_type, now), None
+                    block = []
+            if block:
+                yield _parse_row_block, (block, columns, data_type, now), None
+        finally:
+            workbook.close()
+
+    return tasks(), None
+
+
+def run_import(path, data_type, file_format='csv', workers=None,
+               chunk_bytes=DEFAULT_CHUNK_BYTES, chunk_rows=DEFAULT_CHUNK_ROWS,
+               sheet_name=0, on_progress=None, on_duplicate='skip'):
+    """
+    Importar un archivo CSV/XLSX analizando bloques en paralelo.
+
+    Debe ejecutarse dentro de un contexto de aplicación Flask: el proceso que
+    llama es el único escritor y confirma cada bloque por separado.
+
+    Args:
+        path (str): Ruta del archivo a importar
+        data_type (str): 'solar' o 'environmental'
+        file_format (str): 'csv' o 'xlsx'
+        workers (int): Procesos de análisis (por defecto, núcleos disponibles)
+        chunk_bytes (int): Tamaño de bloque para CSV
+        chunk_rows (int): Tamaño de bloque para XLSX
+        sheet_name (int|str): Hoja a importar en XLSX
+        on_progress (callable): Función que recibe el progreso tras cada bloque
+        on_duplicate (str): 'skip' u 'update' para lecturas ya guardadas
+
+    Returns:
+        dict: Progreso final con filas procesadas, errores y throughput
+
+    Raises:
+        ValueError: Si el formato, el tipo de datos o las columnas no son válidos
+    """
+    get_schema(data_type)
+    workers = workers or os.cpu_count() or 1
+    now = datetime.utcnow()
+
+    if file_format == 'csv':
+        tasks, total_bytes = _csv_tasks(path, data_type, now, chunk_bytes)
+    elif file_format == 'xlsx':
+        tasks, total_bytes = _xlsx_tasks(path, data_type, now, chunk_rows, sheet_name)
+    else:
+        raise ValueError(f'Formato no soportado: {file_format}')
+
+    progress = {
+        'status': 'running',
+        'data_type': data_type,
+        'format': file_format,
+        'workers': workers,
+        'rows_processed': 0,
+        'records_created': 0,
+        'records_updated': 0,
+        'records_skipped': 0,
+        'chunks': 0,
+        'errors': [],
+        'total_errors': 0,
+        'bytes_processed': 0,
+        'bytes_total': total_bytes,
+        'percent': 0.0 if total_bytes else None,
+        'elapsed_seconds': 0.0,
+        'rows_per_second': 0.0
+    }
+    started = time.perf_counter()
+
+    def write_block(result, position):
+        clean, errors, n_rows = result
+        records = frame_to_records(clean, data_type, now=now)
+        counts = upsert_records(data_type, records, on_duplicate)
+        db.session.commit()
+
+        offset = progress['rows_processed']
+        for pos, message in errors[:MAX_REPORTED_ERRORS - len(progress['errors'])]:
+            progress['errors'].append(f'Fila {offset + pos + 1}: {message}')
+
+        elapsed = time.perf_counter() - started
+        progress['rows_processed'] += n_rows
+        progress['records_created'] += counts['inserted']
+        progress['records_updated'] += counts['updated']
+        progress['records_skipped'] += counts['skipped']
+        progress['total_errors'] += len(errors)
+        progress['chunks'] += 1
+        progress['elapsed_seconds'] = round(elapsed, 3)
+        progress['rows_per_second'] = round(progress['rows_processed'] / elapsed, 1) if elapsed else 0.0
+        if total_bytes and position is not None:
+            progress['bytes_processed'] = position
+            progress['percent'] = round(100.0 * position / total_bytes, 2)
+        if on_progress:
+            on_progress(dict(progress))
+
+    # Se usa 'spawn' para no heredar conexiones ni hilos del proceso web
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        pending = deque()
+        for func, args, position in tasks:
+            pending.append((executor.submit(func, *args), position))
+            # Limitar los bloques en vuelo para mantener la memoria acotada
+            if len(pending) >= workers * 2:
+                future, pos = pending.popleft()
+                write_block(future.result(), pos)
+        while pending:
+            future, pos = pending.popleft()
+            write_block(future.result(), pos)
+
+    progress['status'] = 'completed'
+    if total_bytes:
+        progress['percent'] = 100.0
+    return progress
+
+
+def start_import_job(app, path, data_type, file_format, remove_file=True, **options):
+    """
+    Lanzar una importación en un hilo de fondo y registrar su progreso.
+
+    Returns:
+        str: Identificador del trabajo
+    """
+    job_id = uuid.uuid4().hex
+    job = {
+        'job_id': job_id,
+        'status': 'queued',
+        'data_type': data_type,
+        'format': file_format,
+        'created_at': datetime.utcnow().isoformat()
+    }
+    with _jobs_lock:
+        import_jobs[job_id] = job
+
+    def update(progress):
+        with _jobs_lock:
+            job.update(progress)
+
+    def run():
+        with app.app_context():
+            try:
+                update({'status': 'running'})
+                update(run_import(path, data_type, file_format, on_progress=update, **options))
+            except Exception as e:
+                db.session.rollback()
+                update({'status': 'failed', 'error': str(e)})
+            finally:
+                update({'finished_at': datetime.utcnow().isoformat()})
+                if remove_file and os.path.exists(path):
+                    os.remove(path)
+
+    threading.Thread(target=run, name=f'import-{job_id[:8]}', daemon=True).start()
+    return job_id
+
+
+def get_import_job(job_id):
+    """Obtener una copia del estado de un trabajo de importación"""
+    with _jobs_lock:
+        job = import_jobs.get(job_id)
+        return dict(job) if job else None
+
+
+@click.command('import-data')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--data-type', type=click.Choice(['solar', 'environmental']), default='solar')
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'xlsx']), default=None,
+              help='Formato del archivo (por defecto se deduce de la extensión)')
+@click.option('--workers', type=int, default=None, help='Procesos de análisis')
+@click.option('--chunk-mb', type=int, default=DEFAULT_CHUNK_BYTES // (1024 * 1024),
+              help='Tamaño de bloque para CSV en MB')
+@click.option('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS,
+              help='Tamaño de bloque para XLSX en filas')
+@click.option('--sheet', default='0', help='Hoja de Excel (índice o nombre)')
+@click.option('--on-duplicate', type=click.Choice(['skip', 'update']), default='skip',
+              help='Omitir o sobrescribir lecturas ya guardadas (módulo/ubicación y timestamp)')
+@with_appcontext
+def import_data_command(path, data_type, file_format, workers, chunk_mb, chunk_rows, sheet,
+                        on_duplicate):
+    """Importar un archivo histórico CSV/XLSX con el pipeline paralelo."""
+    file_format = file_format or ('xlsx' if path.lower().endswith(('.xlsx', '.xlsm')) else 'csv')
+    sheet_name = int(sheet) if sheet.isdigit() else sheet
+
+    def report(progress):
+        percent = f"{progress['percent']:.1f}% " if progress['percent'] is not None else ''
+        click.echo(
+            f"{percent}{progress['rows_processed']} filas, "
+            f"{progress['records_created']} insertadas, "
+            f"{progress['records_skipped']} omitidas, "
+            f"{progress['total_errors']} errores, "
+            f"{progress['rows_per_second']:.0f} filas/s"
+        )
+
+    result = run_import(
+        path, data_type, file_format, workers=workers,
+        chunk_bytes=chunk_mb * 1024 * 1024, chunk_rows=chunk_rows,
+        sheet_name=sheet_name, on_progress=report, on_duplicate=on_duplicate
+    )
+
+    for message in result['errors']:
+        click.echo(message, err=True)
+    click.echo(
+        f"Importación completada: {result['records_created']} registros "
+        f"({result['records_updated']} actualizados, {result['records_skipped']} omitidos) en "
+        f"{result['elapsed_seconds']:.1f}s ({result['rows_per_second']:.0f} filas/s)"
+    )
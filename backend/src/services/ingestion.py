@@ -0,0 +1,556 @@
+"""
+Servicios de ingesta masiva de datos solares y ambientales - HelioSentinel
+"""
+
+from datetime import datetime, timezone
+import json
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, insert, select, tuple_, update
+
+from src.models.solar_data import db, SolarModuleData, EnvironmentalData
+from src.services.partitions import partitions
+from src.services.upsert import dialect_insert
+
+# Límite de lecturas aceptadas en un solo lote
+MAX_BATCH_READINGS = 50000
+
+# Tamaño por defecto de los bloques en la importación por streaming
+DEFAULT_CHUNK_SIZE = 50000
+
+# Número de errores por fila incluidos en las respuestas
+MAX_REPORTED_ERRORS = 10
+
+# Tratamiento de lecturas cuya clave natural (módulo/ubicación, timestamp) ya existe
+DUPLICATE_POLICIES = ('skip', 'update')
+
+# Claves naturales por consulta al buscar lecturas existentes
+DEDUP_LOOKUP_CHUNK = 500
+
+# Esquemas de ingesta por tipo de datos
+INGEST_SCHEMAS = {
+    'solar': {
+        'model': SolarModuleData,
+        'id_field': 'module_id',
+        'id_default': None,
+        'numeric_fields': [
+            'open_circuit_voltage', 'max_power_voltage', 'max_power_current',
+            'short_circuit_current', 'max_power', 'efficiency',
+            'cell_temperature'
+        ],
+        'optional_fields': {}
+    },
+    'environmental': {
+        'model': EnvironmentalData,
+        'id_field': 'location_id',
+        'id_default': 'default',
+        'numeric_fields': [
+            'ambient_temperature', 'irradiance', 'humidity', 'wind_speed'
+        ],
+        'optional_fields': {'precipitation': 0.0, 'cloudiness': 0.0}
+    }
+}
+
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+# Funciones notificadas con cada lote insertado: listener(data_type, records)
+_ingest_listeners = []
+
+# Funciones notificadas con las lecturas existentes sobrescritas: listener(data_type, records)
+_update_listeners = []
+
+# Tablas crudas aún sin el índice único de su clave natural (base sin migrar):
+# sin él no se puede usar ON CONFLICT
+_missing_natural_keys = set()
+
+
+def set_missing_natural_keys(table_names):
+    """Registrar las tablas crudas cuyo índice único está pendiente de `flask upgrade-db`"""
+    _missing_natural_keys.clear()
+    _missing_natural_keys.update(table_names)
+
+
+def register_ingest_listener(listener):
+    """Registrar una función que se ejecuta tras cada inserción de lecturas"""
+    if listener not in _ingest_listeners:
+        _ingest_listeners.append(listener)
+
+
+def notify_ingested(data_type, records):
+    """Notificar a los listeners dentro de la misma transacción de la inserción"""
+    if not records:
+        return
+    for listener in _ingest_listeners:
+        listener(data_type, records)
+
+
+def register_update_listener(listener):
+    """Registrar una función que se ejecuta tras sobrescribir lecturas existentes"""
+    if listener not in _update_listeners:
+        _update_listeners.append(listener)
+
+
+def notify_updated(data_type, records):
+    """Notificar las lecturas actualizadas (con su id) dentro de la misma transacción"""
+    if not records:
+        return
+    for listener in _update_listeners:
+        listener(data_type, records)
+
+
+def get_schema(data_type):
+    """Obtener el esquema de ingesta para un tipo de datos"""
+    if data_type not in INGEST_SCHEMAS:
+        raise ValueError('Tipo de datos no válido')
+    return INGEST_SCHEMAS[data_type]
+
+
+def required_columns(data_type):
+    """Columnas obligatorias para un tipo de datos"""
+    schema = get_schema(data_type)
+    columns = list(schema['numeric_fields'])
+    if schema['id_default'] is None:
+        columns.insert(0, schema['id_field'])
+    return columns
+
+
+def parse_batch_payload(req):
+    """
+    Extraer las lecturas de una petición de lote.
+
+    Acepta un arreglo JSON, un objeto JSON con la clave 'readings' o un
+    cuerpo NDJSON (una lectura por línea).
+
+    Returns:
+        tuple: (lista de lecturas, dict {índice: error} de lecturas ilegibles)
+    """
+    readings = []
+    parse_errors = {}
+
+    if req.mimetype in NDJSON_MIMETYPES:
+        lines = req.get_data(as_text=True).splitlines()
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                readings.append(json.loads(line))
+            except ValueError as e:
+                parse_errors[len(readings)] = f'JSON inválido: {str(e)}'
+                readings.append({})
+    else:
+        payload = req.get_json()
+        if isinstance(payload, dict):
+            payload = payload.get('readings')
+        if not isinstance(payload, list):
+            raise ValueError('Se esperaba un arreglo de lecturas o NDJSON')
+        readings = payload
+
+    for index, reading in enumerate(readings):
+        if not isinstance(reading, dict):
+            parse_errors.setdefault(index, 'La lectura debe ser un objeto JSON')
+            readings[index] = {}
+
+    return readings, parse_errors
+
+
+def validate_frame(df, data_type, now=None, known_errors=None):
+    """
+    Validar y convertir las columnas de un DataFrame de forma vectorizada.
+
+    Args:
+        df (pd.DataFrame): Lecturas crudas
+        data_type (str): 'solar' o 'environmental'
+        now (datetime): Marca de tiempo por defecto para lecturas sin timestamp
+        known_errors (dict): Errores previos por posición de fila
+
+    Returns:
+        tuple: (DataFrame con las filas válidas ya convertidas,
+                np.ndarray con el primer error de cada fila o None)
+    """
+    schema = get_schema(data_type)
+    now = now or datetime.utcnow()
+    n = len(df)
+    row_errors = np.full(n, None, dtype=object)
+    for position, message in (known_errors or {}).items():
+        row_errors[position] = message
+    clean = pd.DataFrame(index=df.index)
+
+    def flag(mask, message):
+        mask = np.asarray(mask, dtype=bool)
+        pending = mask & pd.isna(row_errors)
+        row_errors[pending] = message
+
+    # Identificador del módulo o ubicación
+    id_field = schema['id_field']
+    if id_field in df.columns:
+        raw_ids = df[id_field]
+        missing = raw_ids.isna().to_numpy()
+        ids = raw_ids.astype(str).str.strip()
+        missing |= (ids == '').to_numpy()
+        if schema['id_default'] is None:
+            flag(missing, f'Campo requerido faltante: {id_field}')
+        else:
+            ids = ids.where(~missing, schema['id_default'])
+        clean[id_field] = ids
+    elif schema['id_default'] is None:
+        flag(np.ones(n, dtype=bool), f'Campo requerido faltante: {id_field}')
+        clean[id_field] = ''
+    else:
+        clean[id_field] = schema['id_default']
+
+    # Campos numéricos obligatorios y opcionales
+    fields = [(field, None) for field in schema['numeric_fields']]
+    fields += list(schema['optional_fields'].items())
+    for field, default in fields:
+        if field not in df.columns:
+            if default is None:
+                flag(np.ones(n, dtype=bool), f'Campo requerido faltante: {field}')
+                clean[field] = np.nan
+            else:
+                clean[field] = float(default)
+            continue
+
+        raw = df[field]
+        missing = raw.isna().to_numpy()
+        values = pd.to_numeric(raw, errors='coerce').astype(float)
+        if default is None:
+            flag(missing, f'Campo requerido faltante: {field}')
+        else:
+            values = values.where(~missing, float(default))
+        invalid = ~np.isfinite(values.to_numpy()) & ~missing
+        flag(invalid, f'Valor numérico inválido en {field}')
+        clean[field] = values
+
+    # Marca de tiempo
+    if 'timestamp' in df.columns:
+        raw = df['timestamp']
+        missing = raw.isna()
+        parsed = pd.to_datetime(raw, errors='coerce', utc=True, format='ISO8601')
+        retry = parsed.isna() & ~missing
+        if retry.any():
+            parsed[retry] = pd.to_datetime(
+                raw[retry], errors='coerce', utc=True, format='mixed'
+            )
+        parsed = parsed.dt.tz_localize(None)
+        flag((parsed.isna() & ~missing).to_numpy(), 'Timestamp inválido')
+        clean['timestamp'] = parsed.fillna(pd.Timestamp(now))
+    else:
+        clean['timestamp'] = pd.Timestamp(now)
+
+    valid = pd.isna(row_errors)
+    return clean[valid], row_errors
+
+
+def frame_to_records(clean, data_type, now=None):
+    """Convertir un DataFrame validado en diccionarios listos para inserción masiva"""
+    schema = get_schema(data_type)
+    now = now or datetime.utcnow()
+    fields = [schema['id_field']] + schema['numeric_fields'] + list(schema['optional_fields'])
+
+    columns = [clean[field].tolist() for field in fields]
+    columns.append(clean['timestamp'].to_numpy(dtype='datetime64[us]').astype(object).tolist())
+    keys = fields + ['timestamp']
+
+    records = [dict(zip(keys, values)) for values in zip(*columns)]
+    for record in records:
+        record['created_at'] = now
+    return records
+
+
+def reading_to_record(data_type, reading, now=None):
+    """
+    Convertir una lectura individual en un registro para inserción masiva.
+
+    Raises:
+        KeyError: Si falta un campo requerido
+        ValueError: Si un valor numérico o el timestamp no son válidos
+    """
+    schema = get_schema(data_type)
+    now = now or datetime.utcnow()
+    key_value = reading.get(schema['id_field'], schema['id_default'])
+    if key_value is None:
+        raise KeyError(schema['id_field'])
+    record = {schema['id_field']: str(key_value).strip()}
+    for field in schema['numeric_fields']:
+        record[field] = float(reading[field])
+    for field, default in schema['optional_fields'].items():
+        record[field] = float(reading.get(field, default))
+    timestamp = datetime.fromisoformat(reading.get('timestamp', now.isoformat()))
+    if timestamp.tzinfo is not None:
+        # Igual que validate_frame: UTC sin zona horaria
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    record['timestamp'] = timestamp
+    record['created_at'] = now
+    return record
+
+
+def natural_key(data_type, record):
+    """Clave natural de una lectura: (módulo o ubicación, timestamp)"""
+    return record[get_schema(data_type)['id_field']], record['timestamp']
+
+
+def unique_records(data_type, records, keep='first'):
+    """Conservar una lectura por clave natural (la primera o la última del lote)"""
+    unique = {}
+    for record in records:
+        key = natural_key(data_type, record)
+        if keep == 'last' or key not in unique:
+            unique[key] = record
+    return list(unique.values())
+
+
+def existing_readings(data_type, records, columns=None, tables=None):
+    """
+    Lecturas guardadas con la misma clave natural, con una consulta por bloque de claves.
+
+    Se buscan en la tabla principal y en los meses archivados que cubren los
+    timestamps del lote.
+
+    Args:
+        columns (list): Nombres de las columnas a leer (todas por defecto)
+        tables (list): Tablas donde buscar (por defecto, las del rango del lote)
+
+    Returns:
+        dict: Fila por clave natural, con la tabla que la contiene en '_table'
+    """
+    schema = get_schema(data_type)
+    keys = list({natural_key(data_type, record) for record in records})
+    if not keys:
+        return {}
+    if tables is None:
+        timestamps = [timestamp for _, timestamp in keys]
+        tables = partitions.sources(data_type, min(timestamps), max(timestamps))
+
+    found = {}
+    for table in tables:
+        key_columns = (table.c[schema['id_field']], table.c.timestamp)
+        selected = [table.c[name] for name in columns] if columns is not None else list(table.c)
+        for start in range(0, len(keys), DEDUP_LOOKUP_CHUNK):
+            rows = db.session.execute(
+                select(*selected).where(tuple_(*key_columns).in_(keys[start:start + DEDUP_LOOKUP_CHUNK]))
+            ).mappings().all()
+            for row in rows:
+                found[(row[schema['id_field']], row['timestamp'])] = {**row, '_table': table}
+    return found
+
+
+def bulk_insert(data_type, records):
+    """
+    Insertar registros en una sola sentencia masiva (sin confirmar la transacción).
+
+    Las lecturas cuya clave natural ya existe se omiten (ON CONFLICT DO
+    NOTHING); solo las insertadas reciben 'id' y se notifican a los listeners.
+
+    Returns:
+        int: Registros insertados
+    """
+    if not records:
+        return 0
+    schema = get_schema(data_type)
+    table = schema['model'].__table__
+    id_field = schema['id_field']
+    records = unique_records(data_type, records)
+
+    stmt = dialect_insert(table) if table.name not in _missing_natural_keys else None
+    if stmt is not None:
+        stmt = stmt.on_conflict_do_nothing(index_elements=[id_field, 'timestamp'])
+        # ON CONFLICT solo cubre la tabla principal: los meses archivados se revisan aparte
+        timestamps = [record['timestamp'] for record in records]
+        lookup = partitions.sources(data_type, min(timestamps), max(timestamps))[:-1]
+    else:
+        # Dialectos sin ON CONFLICT o tabla sin índice único: descartar antes las claves existentes
+        stmt, lookup = insert(table), None
+    if lookup is None or lookup:
+        existing = existing_readings(data_type, records, columns=[id_field, 'timestamp'], tables=lookup)
+        records = [record for record in records if natural_key(data_type, record) not in existing]
+        if not records:
+            return 0
+
+    rows = db.session.execute(
+        stmt.returning(table.c.id, table.c[id_field], table.c.timestamp), records
+    ).all()
+    by_key = {natural_key(data_type, record): record for record in records}
+    inserted = []
+    for record_id, key_value, timestamp in rows:
+        record = by_key[(key_value, timestamp)]
+        record['id'] = record_id
+        inserted.append(record)
+    notify_ingested(data_type, inserted)
+    return len(inserted)
+
+
+def upsert_records(data_type, records, on_duplicate='skip'):
+    """
+    Insertar registros sin duplicar su clave natural (sin confirmar la transacción).
+
+    Con 'skip' las lecturas existentes se omiten; con 'update' se sobrescriben
+    sus valores (dentro del lote prevalece la última lectura de cada clave).
+    Las existentes se buscan por lotes, nunca fila por fila.
+
+    Returns:
+        dict: Lecturas insertadas, actualizadas y omitidas
+
+    Raises:
+        ValueError: Si on_duplicate no es una política válida
+    """
+    if on_duplicate not in DUPLICATE_POLICIES:
+        raise ValueError(
+            f'on_duplicate inválido: {on_duplicate} (opciones: {", ".join(DUPLICATE_POLICIES)})'
+        )
+    total = len(records)
+    if on_duplicate == 'skip':
+        inserted = bulk_insert(data_type, records)
+        return {'inserted': inserted, 'updated': 0, 'skipped': total - inserted}
+
+    schema = get_schema(data_type)
+    value_fields = schema['numeric_fields'] + list(schema['optional_fields'])
+    records = unique_records(data_type, records, keep='last')
+    existing = existing_readings(data_type, records)
+
+    new, changed = [], []
+    for record in records:
+        current = existing.get(natural_key(data_type, record))
+        if current is None:
+            new.append(record)
+        elif any(current[field] != record[field] for field in value_fields):
+            record['id'] = current['id']
+            record['created_at'] = current['created_at']
+            changed.append(record)
+
+    if changed:
+        by_table = {}
+        for record in changed:
+            by_table.setdefault(existing[natural_key(data_type, record)]['_table'], []).append(record)
+        for source, group in by_table.items():
+            db.session.execute(
+                # El timestamp permite descartar las demás particiones mensuales
+                update(source).where(
+                    source.c.id == bindparam('_id'), source.c.timestamp == bindparam('_timestamp')
+                ),
+                [{'_id': record['id'], '_timestamp': record['timestamp'],
+                  **{field: record[field] for field in value_fields}}
+                 for record in group]
+            )
+        notify_updated(data_type, changed)
+    inserted = bulk_insert(data_type, new)
+    return {'inserted': inserted, 'updated': len(changed), 'skipped': total - inserted - len(changed)}
+
+
+def ingest_batch(data_type, readings, parse_errors=None, on_duplicate='skip'):
+    """
+    Validar e insertar un lote de lecturas en una sola transacción.
+
+    Args:
+        data_type (str): 'solar' o 'environmental'
+        readings (list): Lecturas como diccionarios
+        parse_errors (dict): Errores previos de decodificación por índice
+        on_duplicate (str): 'skip' o 'update' para claves naturales existentes
+
+    Returns:
+        dict: Resumen con lecturas aceptadas, rechazadas, insertadas,
+              actualizadas y omitidas, y resultado por fila
+    """
+    now = datetime.utcnow()
+
+    df = pd.DataFrame.from_records(readings) if readings else pd.DataFrame()
+    clean, row_errors = validate_frame(df, data_type, now=now, known_errors=parse_errors)
+
+    records = frame_to_records(clean, data_type, now=now)
+    counts = upsert_records(data_type, records, on_duplicate)
+    db.session.commit()
+
+    results = [
+        {'index': index, 'status': 'accepted'} if error is None
+        else {'index': index, 'status': 'rejected', 'error': error}
+        for index, error in enumerate(row_errors.tolist())
+    ]
+
+    return {
+        'accepted': len(records),
+        'rejected': len(readings) - len(records),
+        **counts,
+        'results': results
+    }
+
+
+def ingest_chunk(df, data_type, now=None, on_duplicate='skip'):
+    """
+    Validar e insertar un bloque de filas de un archivo (sin confirmar).
+
+    Returns:
+        tuple: (dict con lecturas insertadas, actualizadas y omitidas,
+                lista de mensajes 'Fila N: error')
+    """
+    now = now or datetime.utcnow()
+    clean, row_errors = validate_frame(df, data_type, now=now)
+    records = frame_to_records(clean, data_type, now=now)
+    counts = upsert_records(data_type, records, on_duplicate)
+
+    rejected = np.flatnonzero(~pd.isna(row_errors))
+    messages = [f'Fila {df.index[pos] + 1}: {row_errors[pos]}' for pos in rejected]
+    return counts, messages
+
+
+def ingest_frames(data_type, frames, on_duplicate='skip'):
+    """
+    Importar una secuencia de DataFrames confirmando cada bloque por separado.
+
+    La memoria usada depende solo del tamaño del bloque, no del archivo.
+
+    Returns:
+        dict: Registros creados (insertados), actualizados y omitidos,
+              bloques procesados y errores por fila
+    """
+    totals = {'inserted': 0, 'updated': 0, 'skipped': 0}
+    chunks = 0
+    errors = []
+    total_errors = 0
+
+    for df in frames:
+        counts, messages = ingest_chunk(df, data_type, on_duplicate=on_duplicate)
+        db.session.commit()
+
+        for name in totals:
+            totals[name] += counts[name]
+        chunks += 1
+        total_errors += len(messages)
+        errors.extend(messages[:MAX_REPORTED_ERRORS - len(errors)])
+
+    return {
+        'records_created': totals['inserted'],
+        **totals,
+        'chunks': chunks,
+        'errors': errors,
+        'total_errors': total_errors
+    }
+
+
+def read_csv_chunks(stream, data_type, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Leer un CSV por bloques verificando las columnas requeridas.
+
+    Raises:
+        ValueError: Si faltan columnas requeridas
+    """
+    id_field = get_schema(data_type)['id_field']
+    reader = pd.read_csv(
+        stream, chunksize=chunk_size, encoding='utf-8',
+        dtype={id_field: str, 'timestamp': str}
+    )
+
+    first = next(reader, None)
+    if first is None:
+        return iter(())
+
+    missing_columns = [col for col in required_columns(data_type) if col not in first.columns]
+    if missing_columns:
+        reader.close()
+        raise ValueError(f'Columnas faltantes: {missing_columns}')
+
+    def chunks():
+        with reader:
+            yield first
+            yield from reader
+
+    return chunks()
@@ -0,0 +1,162 @@
+"""
+Agrupación dinámica de inferencias concurrentes - HelioSentinel
+
+Las peticiones que llegan casi al mismo tiempo se agrupan en una sola llamada
+al modelo y cada una recibe su propio resultado. Sin carga la petición se
+atiende de inmediato; cuando el lote anterior tuvo más de una petición el
+planificador espera hasta max_wait_ms (o max_batch_size) para llenar el
+siguiente, de modo que la latencia adicional queda acotada por la ventana.
+"""
+
+from concurrent.futures import Future
+import queue
+import threading
+import time
+
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_MAX_WAIT_MS = 2.0
+DEFAULT_TIMEOUT_SECONDS = 30
+
+
+class MicroBatcher:
+    """Cola de inferencias atendida por un hilo que invoca batch_fn por lotes"""
+
+    def __init__(self, name, batch_fn, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms=DEFAULT_MAX_WAIT_MS, timeout_seconds=DEFAULT_TIMEOUT_SECONDS):
+        """
+        Args:
+            batch_fn (callable): Recibe una lista de entradas y devuelve una
+                                 lista de resultados en el mismo orden; un
+                                 resultado que es una excepción falla solo
+                                 su entrada
+        """
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.timeout_seconds = timeout_seconds
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self._last_batch_size = 0
+        self._stats = {'requests': 0, 'batches': 0, 'max_batch_size_seen': 0,
+                       'errors': 0, 'wait_ms_total': 0.0, 'inference_ms_total': 0.0}
+
+    def configure(self, max_batch_size=None, max_wait_ms=None, timeout_seconds=None):
+        """Ajustar el tamaño máximo de lote, la ventana y el tiempo de espera"""
+        if max_batch_size is not None:
+            self.max_batch_size = max(1, max_batch_size)
+        if max_wait_ms is not None:
+            self.max_wait_ms = max(0.0, max_wait_ms)
+        if timeout_seconds is not None:
+            self.timeout_seconds = timeout_seconds
+
+    def submit(self, item):
+        """
+        Encolar una entrada y esperar su resultado.
+
+        Raises:
+            Exception: La excepción de batch_fn para esta entrada
+            TimeoutError: Si el resultado no llega en timeout_seconds
+        """
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future.result(timeout=self.timeout_seconds)
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name=f'batch-{self.name}', daemon=True
+                )
+                self._worker.start()
+
+    def _collect(self):
+        """Tomar el siguiente lote de la cola"""
+        batch = [self._queue.get()]
+        # Sin carga reciente no se espera: se despacha lo que ya está en cola
+        deadline = batch[0][2] + self.max_wait_ms / 1000 if self._last_batch_size > 1 else 0.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            self._last_batch_size = len(batch)
+            started = time.perf_counter()
+            items = [item for item, _, _ in batch]
+            try:
+                results = list(self.batch_fn(items))
+            except Exception as e:
+                if len(items) == 1:
+                    results = [e]
+                else:
+                    # Repetir entrada por entrada para que solo falle la afectada
+                    results = [self._call_single(item) for item in items]
+            finished = time.perf_counter()
+
+            errors = 0
+            for index, (_, future, _) in enumerate(batch):
+                result = results[index] if index < len(results) else RuntimeError(
+                    f'El modelo devolvió {len(results)} resultados para {len(items)} entradas'
+                )
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                    errors += 1
+                else:
+                    future.set_result(result)
+            with self._lock:
+                stats = self._stats
+                stats['errors'] += errors
+                stats['requests'] += len(batch)
+                stats['batches'] += 1
+                stats['max_batch_size_seen'] = max(stats['max_batch_size_seen'], len(batch))
+                stats['wait_ms_total'] += sum((started - queued) * 1000 for _, _, queued in batch)
+                stats['inference_ms_total'] += (finished - started) * 1000
+
+    def _call_single(self, item):
+        """Resultado de una sola entrada, o la excepción que produjo"""
+        try:
+            results = self.batch_fn([item])
+            return results[0] if len(results) else RuntimeError('El modelo no devolvió resultado')
+        except Exception as e:
+            return e
+
+    def stats(self):
+        """Contadores y promedios del planificador"""
+        with self._lock:
+            stats = dict(self._stats)
+        batches = stats.pop('batches')
+        requests = stats['requests']
+        wait_total = stats.pop('wait_ms_total')
+        inference_total = stats.pop('inference_ms_total')
+        return {
+            **stats,
+            'batches': batches,
+            'mean_batch_size': round(requests / batches, 2) if batches else None,
+            'mean_wait_ms': round(wait_total / requests, 3) if requests else None,
+            'mean_inference_ms': round(inference_total / batches, 3) if batches else None,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait_ms,
+            'queue_depth': self._queue.qsize()
+        }
+
+
+def init_micro_batching(app, *batchers):
+    """Aplicar la configuración de la aplicación a los planificadores"""
+    for batcher in batchers:
+        batcher.configure(
+            max_batch_size=app.config.get('INFERENCE_MAX_BATCH_SIZE', DEFAULT_MAX_BATCH_SIZE),
+            max_wait_ms=app.config.get('INFERENCE_BATCH_WINDOW_MS', DEFAULT_MAX_WAIT_MS)
+        )
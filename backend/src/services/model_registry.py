@@ -0,0 +1,233 @@
+"""
+Registro de modelos de IA - HelioSentinel
+
+Carga cada modelo una sola vez bajo un lock (las primeras peticiones
+concurrentes esperan la misma carga), lo calienta con una inferencia de
+prueba y lo publica con un intercambio atómico de referencia. Al recargar, el
+modelo anterior sigue atendiendo peticiones hasta que el nuevo está listo.
+
+Los modelos se precargan al arrancar; con gunicorn --preload los workers
+heredan la copia del proceso maestro (copy-on-write) y gc.freeze() evita que
+el recolector la duplique. Los artefactos cuyo load_model acepta mmap_mode se
+cargan mapeados en memoria.
+"""
+
+from datetime import datetime
+import gc
+import glob
+import inspect
+import os
+import threading
+import time
+
+DEFAULT_RELOAD_CHECK_SECONDS = 30
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def process_memory():
+    """
+    Memoria residente y compartida del proceso en bytes.
+
+    Returns:
+        dict: rss y shared (None si el sistema no expone /proc)
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            _, resident, shared = (int(value) for value in statm.read().split()[:3])
+        return {'rss': resident * _PAGE_SIZE, 'shared': shared * _PAGE_SIZE}
+    except OSError:
+        try:
+            import resource
+            # Pico de memoria residente (KB en Linux)
+            return {'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, 'shared': None}
+        except ImportError:
+            return {'rss': None, 'shared': None}
+
+
+def load_artifact(model, path):
+    """Cargar un artefacto con mmap_mode='r' si el modelo lo admite"""
+    if 'mmap_mode' in inspect.signature(model.load_model).parameters:
+        return model.load_model(path, mmap_mode='r')
+    return model.load_model(path)
+
+
+def _megabytes(value):
+    return round(value / 1024 / 1024, 2) if value is not None else None
+
+
+class _ModelSlot:
+    """Estado de un modelo registrado"""
+
+    def __init__(self, name, loader, artifact, warmup, model_type, description):
+        self.name = name
+        self.loader = loader
+        self.artifact = artifact
+        self.warmup = warmup
+        self.model_type = model_type
+        self.description = description
+        self.model = None
+        self.attempted = False
+        self.reloading = False
+        self.version = 0
+        self.artifact_mtime = None
+        self.checked_at = 0.0
+        self.info = {}
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    """Modelos cargados por nombre con carga protegida y recarga atómica"""
+
+    def __init__(self, models_path=None, reload_check_seconds=DEFAULT_RELOAD_CHECK_SECONDS):
+        self.models_path = models_path
+        self.reload_check_seconds = reload_check_seconds
+        self._slots = {}
+
+    def register(self, name, loader, artifact=None, warmup=None, model_type=None, description=None):
+        """
+        Registrar un modelo.
+
+        Args:
+            loader (callable): Recibe la ruta del artefacto (o None) y devuelve el modelo
+            artifact (str): Nombre base del artefacto dentro de models_path
+            warmup (callable): Recibe el modelo y ejecuta una inferencia de prueba
+        """
+        self._slots[name] = _ModelSlot(name, loader, artifact, warmup, model_type, description)
+
+    def _artifact_path(self, slot):
+        if slot.artifact is None or self.models_path is None:
+            return None
+        return os.path.join(self.models_path, slot.artifact)
+
+    def _artifact_mtime(self, slot):
+        """Última modificación de los archivos del artefacto (ruta base y sufijos)"""
+        path = self._artifact_path(slot)
+        if path is None:
+            return None
+        mtimes = [os.path.getmtime(match) for match in glob.glob(glob.escape(path) + '*')]
+        return max(mtimes) if mtimes else None
+
+    def _load_slot(self, slot):
+        """Cargar, calentar y publicar un modelo (llamar con slot.lock tomado)"""
+        path = self._artifact_path(slot)
+        mtime = self._artifact_mtime(slot)
+        memory_before = process_memory()['rss']
+        started = time.perf_counter()
+        try:
+            model = slot.loader(path)
+            loaded = time.perf_counter()
+            if model is not None and slot.warmup is not None:
+                slot.warmup(model)
+            warmed = time.perf_counter()
+        except Exception as e:
+            # Conservar el modelo anterior si la recarga falla
+            print(f"Error cargando modelo {slot.name}: {e}")
+            slot.info['error'] = str(e)
+            slot.info['failed_at'] = datetime.utcnow().isoformat()
+            slot.attempted = True
+            return slot.model
+
+        memory_after = process_memory()['rss']
+        slot.model = model
+        slot.attempted = True
+        slot.version += 1
+        slot.artifact_mtime = mtime
+        slot.info = {
+            'load_seconds': round(loaded - started, 4),
+            'warmup_seconds': round(warmed - loaded, 4) if slot.warmup and model is not None else None,
+            'memory_delta_mb': (
+                _megabytes(memory_after - memory_before)
+                if memory_before is not None and memory_after is not None else None
+            ),
+            'loaded_at': datetime.utcnow().isoformat(),
+            'artifact_modified_at': datetime.utcfromtimestamp(mtime).isoformat() if mtime else None
+        }
+        return model
+
+    def get(self, name):
+        """Modelo publicado (cargándolo la primera vez); None si no está disponible"""
+        slot = self._slots[name]
+        if not slot.attempted:
+            with slot.lock:
+                if not slot.attempted:
+                    self._load_slot(slot)
+        self._check_artifact(slot)
+        return slot.model
+
+    def _check_artifact(self, slot):
+        """Recargar en segundo plano si el artefacto cambió en disco"""
+        if self.reload_check_seconds <= 0:
+            return
+        now = time.monotonic()
+        if now - slot.checked_at < self.reload_check_seconds or slot.reloading:
+            return
+        slot.checked_at = now
+        mtime = self._artifact_mtime(slot)
+        if mtime is None or mtime == slot.artifact_mtime:
+            return
+        slot.reloading = True
+        threading.Thread(target=self._reload_slot, args=(slot,), daemon=True,
+                         name=f'reload-{slot.name}').start()
+
+    def _reload_slot(self, slot):
+        slot.reloading = True
+        try:
+            with slot.lock:
+                self._load_slot(slot)
+        finally:
+            slot.reloading = False
+
+    def reload(self, names=None):
+        """
+        Recargar modelos de forma atómica; las peticiones en curso usan el anterior.
+
+        Raises:
+            KeyError: Si algún nombre no está registrado
+        """
+        for name in names or list(self._slots):
+            self._reload_slot(self._slots[name])
+
+    def load_all(self):
+        """Precargar y calentar todos los modelos registrados"""
+        for name in self._slots:
+            self.get(name)
+
+    def status(self):
+        """Estado, versión, tiempos de carga y memoria de cada modelo"""
+        models = {}
+        for name, slot in self._slots.items():
+            models[name] = {
+                'loaded': slot.model is not None,
+                'type': slot.model_type,
+                'description': slot.description,
+                'implementation': type(slot.model).__name__ if slot.model is not None else None,
+                'version': slot.version,
+                'reloading': slot.reloading,
+                **slot.info
+            }
+        return models
+
+    def memory(self):
+        """Memoria del proceso en MB"""
+        memory = process_memory()
+        return {'rss_mb': _megabytes(memory['rss']), 'shared_mb': _megabytes(memory['shared'])}
+
+
+model_registry = ModelRegistry()
+
+
+def init_model_registry(app):
+    """
+    Configurar el registro y precargar los modelos al arrancar.
+
+    Tras la precarga se congela el recolector de basura para que los workers
+    creados por fork compartan las páginas de los modelos.
+    """
+    model_registry.reload_check_seconds = app.config.get(
+        'MODEL_RELOAD_CHECK_SECONDS', DEFAULT_RELOAD_CHECK_SECONDS
+    )
+    if app.config.get('MODEL_PRELOAD', True):
+        model_registry.load_all()
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
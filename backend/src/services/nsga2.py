@@ -0,0 +1,432 @@
+"""
+Motor NSGA-II vectorizado para la optimización multiobjetivo - HelioSentinel
+
+Cada generación evalúa la población completa de una sola vez: eficiencia,
+vida útil, costo y CO2 evitado se calculan con NumPy sobre la matriz
+población × condiciones ambientales (por bloques de condiciones para acotar
+la memoria). Con un grupo de procesos la población se reparte entre núcleos.
+
+Los individuos son las 7 variables de CONFIG_NAMES en src.services.optimization:
+tilt_angle, azimuth_angle, tracking_mode, cleaning_frequency, cooling_system,
+mppt_voltage e inverter_efficiency. Todos los objetivos se maximizan
+[eficiencia, vida útil, -costo, CO2 evitado].
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import atexit
+import multiprocessing
+
+import numpy as np
+
+# Límites por variable (inferior, superior) en el orden de CONFIG_NAMES
+PARAMETER_BOUNDS = np.array([
+    [0.0, 60.0],      # tilt_angle (°)
+    [90.0, 270.0],    # azimuth_angle (°)
+    [0.0, 2.0],       # tracking_mode (0 fijo, 1 un eje, 2 dos ejes)
+    [7.0, 90.0],      # cleaning_frequency (días)
+    [0.0, 1.0],       # cooling_system (0/1)
+    [24.0, 48.0],     # mppt_voltage (V)
+    [0.94, 0.99]      # inverter_efficiency
+])
+INTEGER_PARAMETERS = np.array([False, False, True, False, True, False, False])
+
+TECHNOLOGIES = {
+    'monocrystalline': {'efficiency': 0.21, 'temperature_coefficient': 0.0035, 'vmp': 34.0,
+                        'lifespan': 30.0, 'degradation': 0.005, 'cost_per_kw': 900.0},
+    'polycrystalline': {'efficiency': 0.18, 'temperature_coefficient': 0.0040, 'vmp': 32.0,
+                        'lifespan': 27.0, 'degradation': 0.006, 'cost_per_kw': 750.0},
+    'thin_film': {'efficiency': 0.13, 'temperature_coefficient': 0.0025, 'vmp': 44.0,
+                  'lifespan': 25.0, 'degradation': 0.007, 'cost_per_kw': 650.0},
+    'bifacial': {'efficiency': 0.22, 'temperature_coefficient': 0.0034, 'vmp': 36.0,
+                 'lifespan': 32.0, 'degradation': 0.0045, 'cost_per_kw': 1000.0}
+}
+# Fragmentos reconocidos en el nombre de la tecnología, en orden de prioridad
+TECHNOLOGY_ALIASES = [
+    ('bifacial', 'bifacial'), ('thin', 'thin_film'), ('film', 'thin_film'),
+    ('cdte', 'thin_film'), ('cigs', 'thin_film'), ('amorph', 'thin_film'),
+    ('poly', 'polycrystalline'), ('multi', 'polycrystalline'),
+    ('mono', 'monocrystalline')
+]
+DEFAULT_TECHNOLOGY = 'monocrystalline'
+
+# Condiciones opcionales en environmental_data
+DEFAULT_HUMIDITY = 70.0
+DEFAULT_WIND_SPEED = 2.0
+
+# Modelo energético
+OPTIMAL_TILT = 10.0              # Inclinación óptima en latitudes tropicales (°)
+AZIMUTH_LOSS = 0.15              # Pérdida máxima por orientación opuesta al ecuador
+TRACKING_GAIN = np.array([1.0, 1.18, 1.28])
+NOCT_RISE = 25.0                 # Elevación de temperatura de celda a 800 W/m² (°C)
+WIND_COOLING = 0.05              # Reducción de la elevación por m/s de viento
+COOLING_TEMPERATURE_REDUCTION = 0.3
+COOLING_PARASITIC = 0.02         # Consumo del enfriamiento activo
+VOLTAGE_COEFFICIENT = 0.0045     # Caída relativa de Vmp por °C
+MPPT_MISMATCH = 0.6              # Pérdida por desajuste relativo de la tensión MPPT
+HUMIDITY_LOSS = 0.05             # Atenuación por bruma a 100% de humedad
+SOILING_RATE = 0.0015            # Pérdida diaria por suciedad
+MAX_SOILING_LOSS = 0.25
+
+# Vida útil
+REFERENCE_CELL_TEMPERATURE = 45.0
+ARRHENIUS_STEP = 20.0            # °C que reducen la vida útil a la mitad
+DAMP_HEAT = 0.3                  # Reducción por humedad media sobre 60%
+TRACKER_LIFESPAN = 25.0
+MIN_LIFESPAN, MAX_LIFESPAN = 5.0, 40.0
+
+# Costos (USD por kW instalado) y emisiones
+SYSTEM_SIZE_KW = 5.0
+TRACKING_COST = np.array([0.0, 150.0, 300.0])
+TRACKING_MAINTENANCE = np.array([0.0, 12.0, 20.0])   # Por año
+COOLING_COST = 80.0
+COOLING_MAINTENANCE = 6.0                            # Por año
+CLEANING_COST = 1.5                                  # Por limpieza
+INVERTER_BASE_COST = 100.0
+INVERTER_PREMIUM = 4000.0        # Por unidad de eficiencia sobre 0.94
+HOURS_PER_YEAR = 8760
+GRID_EMISSION_FACTOR = 0.45      # kg CO2 por kWh
+
+# Celdas población × condiciones evaluadas por bloque; los temporales de
+# ~256 KB permanecen en caché (bloques mayores quedan limitados por memoria)
+EVAL_BLOCK_CELLS = 32768
+# Tamaño mínimo del problema para repartir la evaluación entre procesos
+PARALLEL_MIN_CELLS = 500000
+
+# Operadores genéticos
+CROSSOVER_PROBABILITY = 0.9
+CROSSOVER_ETA = 15.0
+MUTATION_ETA = 20.0
+
+# Parada anticipada: cambio relativo máximo del punto ideal del frente por generación
+CONVERGENCE_TOLERANCE = 1e-4
+STALL_GENERATIONS = 15
+
+_evaluation_pool = None
+
+
+def technology_profile(technology):
+    """Parámetros de la tecnología a partir de su nombre (monocristalino por defecto)"""
+    name = str(technology or '').lower()
+    for fragment, key in TECHNOLOGY_ALIASES:
+        if fragment in name:
+            return TECHNOLOGIES[key]
+    return TECHNOLOGIES.get(name, TECHNOLOGIES[DEFAULT_TECHNOLOGY])
+
+
+def environment_matrix(env_data):
+    """
+    Convertir las condiciones ambientales en una matriz 4 × T.
+
+    Filas: ambient_temperature, irradiance, humidity, wind_speed. Las filas
+    con temperatura o irradiancia faltantes se descartan.
+
+    Raises:
+        ValueError: Si faltan columnas requeridas o no quedan condiciones válidas
+    """
+    for column in ('ambient_temperature', 'irradiance'):
+        if column not in env_data.columns:
+            raise ValueError(f'Campo requerido faltante en environmental_data: {column}')
+
+    def column(name, default):
+        if name not in env_data.columns:
+            return np.full(len(env_data), default)
+        values = env_data[name].to_numpy(dtype=float)
+        return np.where(np.isfinite(values), values, default)
+
+    environment = np.vstack([
+        env_data['ambient_temperature'].to_numpy(dtype=float),
+        np.clip(env_data['irradiance'].to_numpy(dtype=float), 0, None),
+        column('humidity', DEFAULT_HUMIDITY),
+        column('wind_speed', DEFAULT_WIND_SPEED)
+    ])
+    environment = environment[:, np.isfinite(environment).all(axis=0)]
+    if environment.shape[1] == 0:
+        raise ValueError('environmental_data no contiene condiciones válidas')
+    return environment
+
+
+def evaluate_population(population, environment, technology):
+    """
+    Evaluar todos los objetivos para una población completa.
+
+    Args:
+        population (np.ndarray): P × 7 configuraciones
+        environment (np.ndarray): 4 × T condiciones (ver environment_matrix)
+
+    Returns:
+        np.ndarray: P × 4 [eficiencia, vida útil (años), -costo total (USD),
+                    CO2 evitado (kg)]
+    """
+    profile = technology_profile(technology)
+    tilt, azimuth, tracking, cleaning, cooling, mppt, inverter = population.T
+    tracking = np.clip(np.rint(tracking), 0, 2).astype(int)
+    cooling = np.clip(np.rint(cooling), 0, 1)
+
+    # Factores que solo dependen de la configuración (P)
+    orientation = np.cos(np.radians(tilt - OPTIMAL_TILT)) * (
+        1 - AZIMUTH_LOSS * (1 - np.cos(np.radians(azimuth - 180))) / 2 * np.sin(np.radians(tilt))
+    )
+    orientation = np.where(tracking > 0, 1.0, orientation) * TRACKING_GAIN[tracking]
+    # Inclinaciones bajas acumulan más suciedad entre limpiezas
+    soiling_rate = SOILING_RATE * (1 + np.clip(15 - tilt, 0, 15) / 15)
+    soiling = np.minimum(soiling_rate * cleaning / 2, MAX_SOILING_LOSS)
+    rise = NOCT_RISE / 800 * (1 - COOLING_TEMPERATURE_REDUCTION * cooling)
+
+    ambient, irradiance, humidity, wind = environment
+    coefficient = profile['temperature_coefficient']
+    vmp = profile['vmp']
+
+    # Potencia en plano y temperatura de celda por bloques de condiciones (P × B)
+    n = len(population)
+    energy = np.zeros(n)
+    cell_load = np.zeros(n)
+    block = max(1, EVAL_BLOCK_CELLS // max(n, 1))
+    for start in range(0, environment.shape[1], block):
+        window = slice(start, start + block)
+        poa = orientation[:, None] * irradiance[None, window]
+        cell = ambient[None, window] + poa * rise[:, None] / (1 + WIND_COOLING * wind[None, window])
+        temperature_factor = 1 - coefficient * (cell - 25)
+        mismatch = np.abs(mppt[:, None] - vmp * (1 - VOLTAGE_COEFFICIENT * (cell - 25))) / vmp
+        haze = 1 - HUMIDITY_LOSS * humidity[window] / 100
+        energy += np.einsum('pt,pt,t->p', poa * temperature_factor, 1 - MPPT_MISMATCH * mismatch, haze)
+        cell_load += cell @ irradiance[window]
+
+    total_irradiance = max(irradiance.sum(), 1e-9)
+    energy *= (1 - soiling) * inverter * (1 - COOLING_PARASITIC * cooling)
+
+    efficiency = profile['efficiency'] * energy / total_irradiance
+    # kWh por kWp instalado al año (cada condición representa una hora típica)
+    annual_yield = energy / 1000 / environment.shape[1] * HOURS_PER_YEAR
+
+    mean_cell = cell_load / total_irradiance
+    lifespan = profile['lifespan'] * 2 ** (-(mean_cell - REFERENCE_CELL_TEMPERATURE) / ARRHENIUS_STEP)
+    lifespan /= 1 + DAMP_HEAT * max(humidity.mean() - 60, 0) / 40
+    lifespan = np.where(tracking > 0, np.minimum(lifespan, TRACKER_LIFESPAN), lifespan)
+    lifespan = np.clip(lifespan, MIN_LIFESPAN, MAX_LIFESPAN)
+
+    capital = (profile['cost_per_kw'] + TRACKING_COST[tracking] + COOLING_COST * cooling
+               + INVERTER_BASE_COST + INVERTER_PREMIUM * (inverter - 0.94))
+    maintenance = 365 / cleaning * CLEANING_COST + TRACKING_MAINTENANCE[tracking] + COOLING_MAINTENANCE * cooling
+    total_cost = SYSTEM_SIZE_KW * (capital + maintenance * lifespan)
+
+    lifetime_energy = annual_yield * SYSTEM_SIZE_KW * lifespan * (1 - profile['degradation'] * lifespan / 2)
+    co2_avoided = lifetime_energy * GRID_EMISSION_FACTOR
+
+    return np.column_stack([efficiency, lifespan, -total_cost, co2_avoided])
+
+
+def non_dominated_ranks(objectives):
+    """Rango de Pareto de cada individuo (0 = frente no dominado), maximizando"""
+    n = len(objectives)
+    at_least = np.ones((n, n), dtype=bool)
+    better = np.zeros((n, n), dtype=bool)
+    for column in objectives.T:
+        at_least &= column[:, None] >= column[None, :]
+        better |= column[:, None] > column[None, :]
+    # dominates[i, j]: i domina a j
+    dominates = at_least & better
+    counts = dominates.sum(axis=0)
+
+    ranks = np.full(n, -1)
+    remaining = np.ones(n, dtype=bool)
+    rank = 0
+    while remaining.any():
+        front = remaining & (counts == 0)
+        ranks[front] = rank
+        remaining &= ~front
+        counts = counts - dominates[front].sum(axis=0)
+        rank += 1
+    return ranks
+
+
+def crowding_distance(objectives, ranks):
+    """Distancia de aglomeración dentro de cada frente"""
+    distance = np.zeros(len(objectives))
+    for rank in np.unique(ranks):
+        members = np.flatnonzero(ranks == rank)
+        if len(members) <= 2:
+            distance[members] = np.inf
+            continue
+        values = objectives[members]
+        order = np.argsort(values, axis=0)
+        ordered = np.take_along_axis(values, order, axis=0)
+        span = ordered[-1] - ordered[0]
+        span[span == 0] = 1.0
+        gaps = np.empty_like(values)
+        gaps[1:-1] = (ordered[2:] - ordered[:-2]) / span
+        gaps[[0, -1]] = np.inf
+        contribution = np.empty_like(values)
+        np.put_along_axis(contribution, order, gaps, axis=0)
+        distance[members] = contribution.sum(axis=1)
+    return distance
+
+
+def random_population(size, rng):
+    """Población uniforme dentro de los límites"""
+    low, high = PARAMETER_BOUNDS.T
+    return repair(low + rng.random((size, len(low))) * (high - low))
+
+
+def repair(population):
+    """Recortar a los límites y redondear las variables discretas"""
+    low, high = PARAMETER_BOUNDS.T
+    population = np.clip(population, low, high)
+    population[:, INTEGER_PARAMETERS] = np.rint(population[:, INTEGER_PARAMETERS])
+    return population
+
+
+def _tournament(ranks, distance, size, rng):
+    """Selección por torneo binario (rango menor, luego mayor aglomeración)"""
+    first, second = rng.integers(0, len(ranks), size=(2, size))
+    first_wins = (ranks[first] < ranks[second]) | (
+        (ranks[first] == ranks[second]) & (distance[first] >= distance[second])
+    )
+    return np.where(first_wins, first, second)
+
+
+def _offspring(parents, rng):
+    """Cruce SBX y mutación polinomial sobre toda la población"""
+    low, high = PARAMETER_BOUNDS.T
+    span = high - low
+    n, dimensions = parents.shape
+    if n % 2:
+        parents = np.vstack([parents, parents[:1]])
+    first, second = parents[0::2], parents[1::2]
+    half = len(first)
+
+    u = rng.random((half, dimensions))
+    beta = np.where(u <= 0.5, (2 * u) ** (1 / (CROSSOVER_ETA + 1)),
+                    (1 / (2 * (1 - u))) ** (1 / (CROSSOVER_ETA + 1)))
+    crossover = (rng.random((half, 1)) < CROSSOVER_PROBABILITY) & (rng.random((half, dimensions)) < 0.5)
+    beta = np.where(crossover, beta, 1.0)
+    children = np.vstack([
+        0.5 * ((1 + beta) * first + (1 - beta) * second),
+        0.5 * ((1 - beta) * first + (1 + beta) * second)
+    ])[:n]
+
+    u = rng.random(children.shape)
+    delta = np.where(u < 0.5, (2 * u) ** (1 / (MUTATION_ETA + 1)) - 1,
+                     1 - (2 * (1 - u)) ** (1 / (MUTATION_ETA + 1)))
+    mutate = rng.random(children.shape) < 1 / dimensions
+    children = children + np.where(mutate, delta * span, 0.0)
+    return repair(children)
+
+
+def _ideal_point(objectives, ranks):
+    """Mejor valor de cada objetivo en el primer frente"""
+    return objectives[ranks == 0].max(axis=0)
+
+
+def init_evaluation_pool(processes):
+    """
+    Crear el grupo de procesos para repartir la evaluación de poblaciones.
+
+    Se llama al arrancar, antes de que existan hilos, y los procesos se
+    inician de inmediato para que el fork no herede locks tomados.
+    """
+    global _evaluation_pool
+    if processes <= 0 or _evaluation_pool is not None:
+        return _evaluation_pool
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+    _evaluation_pool = ProcessPoolExecutor(max_workers=processes, mp_context=context)
+    list(_evaluation_pool.map(abs, range(processes)))
+    atexit.register(_evaluation_pool.shutdown, wait=False, cancel_futures=True)
+    return _evaluation_pool
+
+
+class PopulationOptimizer:
+    """Optimizador NSGA-II con evaluación vectorizada de la población"""
+
+    def __init__(self, executor=None, seed=None):
+        self.executor = executor
+        self.seed = seed
+
+    def evaluate(self, population, environment, technology):
+        """Evaluar la población, repartiéndola entre procesos si el problema es grande"""
+        executor = self.executor or _evaluation_pool
+        workers = getattr(executor, '_max_workers', 1)
+        if executor is None or workers < 2 or len(population) * environment.shape[1] < PARALLEL_MIN_CELLS:
+            return evaluate_population(population, environment, technology)
+        chunks = np.array_split(population, min(workers, len(population)))
+        return np.vstack(list(executor.map(
+            evaluate_population, chunks, repeat(environment), repeat(technology)
+        )))
+
+    def optimize_configuration(self, env_data, technology, population_size=100, generations=100,
+                               on_progress=None, initial_population=None):
+        """
+        Ejecutar NSGA-II y devolver el frente de Pareto.
+
+        La búsqueda se detiene antes del presupuesto cuando el punto ideal del
+        frente deja de mejorar durante STALL_GENERATIONS generaciones.
+
+        Args:
+            env_data (pd.DataFrame): Condiciones ambientales del sitio
+            on_progress (callable): Recibe un dict de progreso tras cada generación
+            initial_population (np.ndarray): Configuraciones de arranque (por
+                                             ejemplo un frente anterior); el
+                                             resto se completa al azar
+
+        Returns:
+            list: [{'parameters': [...], 'objectives': [...]}, ...] del primer frente
+        """
+        rng = np.random.default_rng(self.seed)
+        environment = environment_matrix(env_data)
+
+        population = random_population(population_size, rng)
+        if initial_population is not None and len(initial_population):
+            seeds = repair(np.asarray(initial_population, dtype=float)[:population_size])
+            population[:len(seeds)] = seeds
+        objectives = self.evaluate(population, environment, technology)
+        ranks = non_dominated_ranks(objectives)
+        distance = crowding_distance(objectives, ranks)
+        reference = _ideal_point(objectives, ranks)
+        stalled = 0
+
+        for generation in range(1, generations + 1):
+            parents = population[_tournament(ranks, distance, population_size, rng)]
+            children = _offspring(parents, rng)
+            combined = np.vstack([population, children])
+            combined_objectives = np.vstack([objectives, self.evaluate(children, environment, technology)])
+
+            combined_ranks = non_dominated_ranks(combined_objectives)
+            combined_distance = crowding_distance(combined_objectives, combined_ranks)
+            survivors = np.lexsort((-combined_distance, combined_ranks))[:population_size]
+
+            population = combined[survivors]
+            objectives = combined_objectives[survivors]
+            ranks = combined_ranks[survivors]
+            distance = combined_distance[survivors]
+
+            ideal = _ideal_point(objectives, ranks)
+            change = np.max(np.abs(ideal - reference) / np.maximum(np.abs(reference), 1e-9))
+            stalled = stalled + 1 if change < CONVERGENCE_TOLERANCE else 0
+            reference = ideal
+            converged = stalled >= STALL_GENERATIONS
+
+            if on_progress:
+                on_progress({
+                    'generation': generation,
+                    'percent': 100.0 if converged else round(generation / generations * 100, 1),
+                    'pareto_size': int((ranks == 0).sum()),
+                    'converged': converged
+                })
+            if converged:
+                break
+
+        front = np.flatnonzero(ranks == 0)
+        _, unique = np.unique(population[front], axis=0, return_index=True)
+        front = front[np.sort(unique)]
+        return [
+            {'parameters': population[index].tolist(), 'objectives': objectives[index].tolist()}
+            for index in front
+        ]
+
+    def select_solution(self, pareto_front):
+        """Solución de compromiso: mayor suma de objetivos normalizados en el frente"""
+        values = np.array([solution['objectives'] for solution in pareto_front], dtype=float)
+        span = values.max(axis=0) - values.min(axis=0)
+        normalized = (values - values.min(axis=0)) / np.where(span > 0, span, 1.0)
+        return pareto_front[int(np.argmax(normalized.sum(axis=1)))]
@@ -0,0 +1,317 @@
+"""
+Optimización multiobjetivo en segundo plano - HelioSentinel
+
+Las optimizaciones con presupuestos realistas de NSGA-II (cientos de
+individuos × cientos de generaciones) se encolan como trabajos y se ejecutan
+en un grupo local de hilos; la petición HTTP solo recibe el identificador y
+consulta después el progreso y el resultado.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import atexit
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+from src.models.solar_data import db, OptimizationResult
+from src.services.nsga2 import PopulationOptimizer
+from src.services.optimization_cache import optimization_cache, input_hash, environment_signature
+
+CONFIG_NAMES = [
+    'tilt_angle', 'azimuth_angle', 'tracking_mode',
+    'cleaning_frequency', 'cooling_system', 'mppt_voltage',
+    'inverter_efficiency'
+]
+
+# Presupuesto de la optimización síncrona (/optimize/multiobj)
+SYNC_POPULATION_SIZE = 20
+SYNC_GENERATIONS = 10
+
+# Presupuesto por defecto y máximo de los trabajos en segundo plano
+DEFAULT_POPULATION_SIZE = 200
+DEFAULT_GENERATIONS = 200
+MAX_POPULATION_SIZE = 2000
+MAX_GENERATIONS = 2000
+
+DEFAULT_WORKERS = 2
+MAX_PENDING_JOBS = 100       # Trabajos en cola o en ejecución
+MAX_FINISHED_JOBS = 500      # Trabajos terminados que se conservan para consulta
+
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+# Trabajos de optimización por identificador
+optimization_jobs = {}
+_jobs_lock = threading.Lock()
+_executor = None
+
+
+class OptimizationCancelled(Exception):
+    """Trabajo cancelado mientras se ejecutaba"""
+
+
+def run_optimization(optimizer, env_data, technology, population_size=SYNC_POPULATION_SIZE,
+                     generations=SYNC_GENERATIONS, on_progress=None, initial_population=None):
+    """
+    Ejecutar el optimizador cargado (o la optimización simplificada).
+
+    Args:
+        env_data (pd.DataFrame): Condiciones ambientales del sitio
+        on_progress (callable): Recibe un dict de progreso
+        initial_population (np.ndarray): Población de arranque (solo el motor vectorizado)
+
+    Returns:
+        tuple: (configuración óptima como dict, objetivos
+                [eficiencia, vida útil, -costo, CO2 evitado],
+                parámetros del frente de Pareto o None)
+    """
+    front_parameters = None
+    if hasattr(optimizer, 'optimize_configuration'):
+        # Optimización completa; el motor vectorizado informa cada generación
+        options = {}
+        if isinstance(optimizer, PopulationOptimizer):
+            options = {'on_progress': on_progress, 'initial_population': initial_population}
+        pareto_front = optimizer.optimize_configuration(
+            env_data, technology=technology,
+            population_size=population_size, generations=generations, **options
+        )
+
+        if pareto_front:
+            if hasattr(optimizer, 'select_solution'):
+                best_solution = optimizer.select_solution(pareto_front)
+            else:
+                best_solution = max(pareto_front, key=lambda x: sum(x['objectives']))
+            optimal_config = best_solution['parameters']
+            objectives = best_solution['objectives']
+            front_parameters = [solution['parameters'] for solution in pareto_front]
+        else:
+            raise Exception("No se encontraron soluciones óptimas")
+
+    else:
+        # Optimización simplificada
+        avg_temp = env_data['ambient_temperature'].mean()
+        avg_humidity = env_data['humidity'].mean()
+
+        # Configuración óptima simplificada
+        optimal_config = [
+            avg_temp * 0.5 + 10,  # tilt_angle
+            180,                   # azimuth_angle
+            1,                     # tracking_mode
+            max(7, 30 - avg_humidity / 10),  # cleaning_frequency
+            1 if avg_temp > 30 else 0,       # cooling_system
+            32,                    # mppt_voltage
+            0.95                   # inverter_efficiency
+        ]
+
+        objectives = [0.18, 25, -15000, 50000]  # Valores ejemplo
+
+    if on_progress and not isinstance(optimizer, PopulationOptimizer):
+        on_progress({'generation': generations, 'percent': 100.0})
+
+    return dict(zip(CONFIG_NAMES, optimal_config)), objectives, front_parameters
+
+
+def save_optimization(location_id, technology, config, objectives):
+    """Guardar el resultado de una optimización y confirmar"""
+    optimization_result = OptimizationResult(
+        location_id=location_id,
+        technology=technology,
+        energy_efficiency=objectives[0],
+        expected_lifespan=objectives[1],
+        total_cost=abs(objectives[2]),
+        co2_avoided=objectives[3]
+    )
+    optimization_result.set_optimal_config(config)
+
+    db.session.add(optimization_result)
+    db.session.commit()
+    return optimization_result
+
+
+def optimize_and_save(optimizer, env_data, technology, location_id='default',
+                      population_size=SYNC_POPULATION_SIZE, generations=SYNC_GENERATIONS,
+                      on_progress=None, use_cache=True):
+    """
+    Devolver el resultado guardado para entradas idénticas u optimizar y guardar.
+
+    Para condiciones casi idénticas de la misma ubicación y tecnología, el
+    frente de Pareto anterior se usa como población inicial.
+
+    Returns:
+        tuple: (OptimizationResult, dict con 'cached' y 'warm_start')
+    """
+    key = input_hash(location_id, technology, env_data)
+    evaluations = population_size * generations
+    if use_cache:
+        optimization_id = optimization_cache.get(key, evaluations)
+        if optimization_id is not None:
+            optimization_result = db.session.get(OptimizationResult, optimization_id)
+            if optimization_result is not None:
+                return optimization_result, {'cached': True, 'warm_start': False}
+            optimization_cache.discard(key)
+
+    signature = environment_signature(env_data)
+    initial_population = (
+        optimization_cache.warm_start(location_id, technology, signature)
+        if use_cache and isinstance(optimizer, PopulationOptimizer) else None
+    )
+    config, objectives, front = run_optimization(
+        optimizer, env_data, technology, population_size, generations,
+        on_progress=on_progress, initial_population=initial_population
+    )
+    optimization_result = save_optimization(location_id, technology, config, objectives)
+    optimization_cache.put(
+        key, optimization_result.id, evaluations, location_id, technology, signature, front
+    )
+    return optimization_result, {'cached': False, 'warm_start': initial_population is not None}
+
+
+def format_optimization(optimization_result):
+    """Respuesta de /optimize/multiobj a partir de un resultado guardado"""
+    result = optimization_result.to_dict()
+    config = result['optimal_config']
+    return {
+        'optimization_result': {
+            'optimal_configuration': config,
+            'objectives': {
+                'energy_efficiency': round(result['energy_efficiency'], 4),
+                'expected_lifespan': round(result['expected_lifespan'], 1),
+                'total_cost': round(result['total_cost'], 2),
+                'co2_avoided': round(result['co2_avoided'], 2)
+            },
+            'technology': result['technology'],
+            'location_id': result['location_id']
+        },
+        'recommendations': {
+            'tilt_angle': f"Configurar inclinación a {config['tilt_angle']:.1f}°",
+            'tracking': "Sistema de seguimiento recomendado" if config['tracking_mode'] > 0 else "Sistema fijo recomendado",
+            'maintenance': f"Limpieza cada {config['cleaning_frequency']:.0f} días",
+            'cooling': "Sistema de enfriamiento recomendado" if config['cooling_system'] else "Enfriamiento pasivo suficiente"
+        },
+        'optimization_id': result['id'],
+        'timestamp': result['timestamp']
+    }
+
+
+def _prune_finished_jobs():
+    """Descartar los trabajos terminados más antiguos (llamar con el lock tomado)"""
+    finished = [job_id for job_id, job in optimization_jobs.items()
+                if job['status'] in FINISHED_STATUSES]
+    for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+        del optimization_jobs[job_id]
+
+
+def submit_optimization_job(app, optimizer, environmental_data, technology,
+                            location_id='default', population_size=DEFAULT_POPULATION_SIZE,
+                            generations=DEFAULT_GENERATIONS, use_cache=True):
+    """
+    Encolar una optimización en el grupo de trabajadores.
+
+    Raises:
+        RuntimeError: Si la cola de trabajos está llena
+
+    Returns:
+        str: Identificador del trabajo
+    """
+    job_id = uuid.uuid4().hex
+    job = {
+        'job_id': job_id,
+        'status': 'queued',
+        'technology': technology,
+        'location_id': location_id,
+        'population_size': population_size,
+        'generations': generations,
+        'generation': 0,
+        'percent': 0.0,
+        'created_at': datetime.utcnow().isoformat()
+    }
+    with _jobs_lock:
+        pending = sum(1 for entry in optimization_jobs.values()
+                      if entry['status'] not in FINISHED_STATUSES)
+        if pending >= MAX_PENDING_JOBS:
+            raise RuntimeError('Cola de optimización llena, intente más tarde')
+        _prune_finished_jobs()
+        optimization_jobs[job_id] = job
+
+    def update(progress):
+        with _jobs_lock:
+            if job.get('cancel_requested'):
+                raise OptimizationCancelled()
+            job.update(progress)
+
+    def run():
+        with app.app_context():
+            started = time.monotonic()
+            try:
+                update({'status': 'running', 'started_at': datetime.utcnow().isoformat()})
+                env_data = pd.DataFrame(environmental_data)
+                optimization_result, origin = optimize_and_save(
+                    optimizer, env_data, technology, location_id, population_size, generations,
+                    on_progress=update, use_cache=use_cache
+                )
+                with _jobs_lock:
+                    job.update({
+                        'status': 'completed',
+                        'percent': 100.0,
+                        'optimization_id': optimization_result.id,
+                        **origin
+                    })
+            except OptimizationCancelled:
+                with _jobs_lock:
+                    job['status'] = 'cancelled'
+            except Exception as e:
+                db.session.rollback()
+                with _jobs_lock:
+                    job.update({'status': 'failed', 'error': f'Error en optimización: {str(e)}'})
+            finally:
+                with _jobs_lock:
+                    job.update({
+                        'finished_at': datetime.utcnow().isoformat(),
+                        'elapsed_seconds': round(time.monotonic() - started, 3)
+                    })
+
+    job['future'] = _get_executor(app).submit(run)
+    return job_id
+
+
+def get_optimization_job(job_id):
+    """Obtener una copia del estado de un trabajo de optimización"""
+    with _jobs_lock:
+        job = optimization_jobs.get(job_id)
+        if job is None:
+            return None
+        return {key: value for key, value in job.items()
+                if key not in ('future', 'cancel_requested')}
+
+
+def cancel_optimization_job(job_id):
+    """
+    Cancelar un trabajo en cola o solicitar la detención de uno en ejecución.
+
+    Returns:
+        dict: Estado del trabajo o None si no existe
+    """
+    with _jobs_lock:
+        job = optimization_jobs.get(job_id)
+        if job is None:
+            return None
+        if job['status'] == 'queued' and job['future'].cancel():
+            job.update({'status': 'cancelled', 'finished_at': datetime.utcnow().isoformat()})
+        elif job['status'] not in FINISHED_STATUSES:
+            job['cancel_requested'] = True
+    return get_optimization_job(job_id)
+
+
+def _get_executor(app):
+    """Crear bajo demanda el grupo de trabajadores"""
+    global _executor
+    with _jobs_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config.get('OPTIMIZATION_WORKERS', DEFAULT_WORKERS),
+                thread_name_prefix='optimize'
+            )
+            atexit.register(_executor.shutdown, wait=False, cancel_futures=True)
+        return _executor
@@ -0,0 +1,171 @@
+"""
+Caché de resultados de optimización - HelioSentinel
+
+Los resultados se indexan por un hash canónico de location_id, technology y
+environmental_data: una petición idéntica (por ejemplo, al refrescar el
+dashboard) devuelve el OptimizationResult guardado sin volver a optimizar.
+Para condiciones casi idénticas el frente de Pareto anterior sirve de
+población inicial de NSGA-II. Las entradas se descartan por LRU y por TTL.
+"""
+
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_TTL_SECONDS = 6 * 3600
+DEFAULT_WARM_START_TOLERANCE = 0.05   # Diferencia relativa máxima entre resúmenes ambientales
+
+# Decimales conservados al normalizar las condiciones ambientales
+ENV_DECIMALS = 2
+
+
+def canonical_frame(env_data):
+    """Columnas ordenadas y valores numéricos como float redondeado"""
+    frame = env_data.reindex(sorted(env_data.columns, key=str), axis=1)
+    numeric = frame.select_dtypes('number').columns
+    frame[numeric] = frame[numeric].astype(float).round(ENV_DECIMALS)
+    return frame
+
+
+def input_hash(location_id, technology, env_data):
+    """Hash SHA-256 de las entradas normalizadas de una optimización"""
+    frame = canonical_frame(env_data)
+    digest = hashlib.sha256()
+    header = [str(location_id), str(technology).strip().lower()] + [str(column) for column in frame.columns]
+    digest.update('\x1f'.join(header).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def environment_signature(env_data):
+    """Resumen ambiental (media y desviación por columna numérica) para comparar entradas"""
+    frame = canonical_frame(env_data).select_dtypes('number')
+    return tuple(frame.columns), np.concatenate([
+        frame.mean().to_numpy(), frame.std(ddof=0).to_numpy()
+    ])
+
+
+class OptimizationCache:
+    """Índice LRU con TTL de resultados y frentes de Pareto por hash de entradas"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 warm_start_tolerance=DEFAULT_WARM_START_TOLERANCE):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.warm_start_tolerance = warm_start_tolerance
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'warm_starts': 0, 'evictions': 0}
+
+    def configure(self, max_entries=None, ttl_seconds=None, warm_start_tolerance=None):
+        """Ajustar los límites y descartar lo que ya no cabe"""
+        with self._lock:
+            if max_entries is not None:
+                self.max_entries = max_entries
+            if ttl_seconds is not None:
+                self.ttl_seconds = ttl_seconds
+            if warm_start_tolerance is not None:
+                self.warm_start_tolerance = warm_start_tolerance
+            self._evict()
+
+    def _evict(self):
+        """Descartar entradas vencidas y las menos usadas (llamar con el lock tomado)"""
+        deadline = time.monotonic() - self.ttl_seconds
+        for key in [key for key, entry in self._entries.items() if entry['stored_at'] < deadline]:
+            del self._entries[key]
+            self._counters['evictions'] += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters['evictions'] += 1
+
+    def get(self, key, evaluations=0):
+        """
+        Id del OptimizationResult guardado para estas entradas.
+
+        Solo se reutilizan resultados obtenidos con al menos el mismo
+        presupuesto (población × generaciones).
+
+        Returns:
+            int: Id del resultado o None
+        """
+        with self._lock:
+            self._evict()
+            entry = self._entries.get(key)
+            if entry is None or entry['evaluations'] < evaluations:
+                self._counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters['hits'] += 1
+            return entry['optimization_id']
+
+    def put(self, key, optimization_id, evaluations, location_id, technology, signature, front=None):
+        """Registrar un resultado y, si existe, su frente de Pareto"""
+        with self._lock:
+            self._entries[key] = {
+                'optimization_id': optimization_id,
+                'evaluations': evaluations,
+                'location_id': str(location_id),
+                'technology': str(technology).strip().lower(),
+                'signature': signature,
+                'front': None if front is None else np.asarray(front, dtype=float),
+                'stored_at': time.monotonic()
+            }
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def discard(self, key):
+        """Olvidar una entrada cuyo resultado ya no existe"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def warm_start(self, location_id, technology, signature):
+        """
+        Frente de Pareto de la entrada más parecida de la misma ubicación y tecnología.
+
+        Returns:
+            np.ndarray: Configuraciones del frente o None si ninguna entrada está
+                        dentro de la tolerancia
+        """
+        columns, values = signature
+        technology = str(technology).strip().lower()
+        best, best_distance = None, None
+        with self._lock:
+            self._evict()
+            for entry in self._entries.values():
+                entry_columns, entry_values = entry['signature']
+                if (entry['front'] is None or entry['location_id'] != str(location_id)
+                        or entry['technology'] != technology or entry_columns != columns):
+                    continue
+                distance = np.max(np.abs(values - entry_values) / np.maximum(np.abs(entry_values), 1.0))
+                if distance <= self.warm_start_tolerance and (best_distance is None or distance < best_distance):
+                    best, best_distance = entry['front'], distance
+            if best is not None:
+                self._counters['warm_starts'] += 1
+        return best
+
+    def stats(self):
+        """Tamaño, límites y contadores de la caché"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                **self._counters
+            }
+
+
+optimization_cache = OptimizationCache()
+
+
+def init_optimization_cache(app):
+    """Aplicar los límites configurados en la aplicación"""
+    optimization_cache.configure(
+        max_entries=app.config.get('OPTIMIZATION_CACHE_SIZE', DEFAULT_MAX_ENTRIES),
+        ttl_seconds=app.config.get('OPTIMIZATION_CACHE_TTL', DEFAULT_TTL_SECONDS),
+        warm_start_tolerance=app.config.get('OPTIMIZATION_WARM_START_TOLERANCE', DEFAULT_WARM_START_TOLERANCE)
+    )
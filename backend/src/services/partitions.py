@@ -0,0 +1,524 @@
+"""
+Particionado mensual de la telemetría cruda - HelioSentinel
+
+En PostgreSQL solar_modules_data y environmental_data son tablas con
+particionado declarativo nativo (PARTITION BY RANGE (timestamp)): una
+partición por mes creada por adelantado y una partición DEFAULT para lecturas
+fuera de los meses creados. El planificador descarta las particiones que no
+solapan el rango consultado y borrar un mes es DETACH + DROP TABLE.
+
+SQLite no tiene particionado nativo: la tabla principal conserva los meses
+recientes y el mantenimiento mueve cada mes cerrado a su propia tabla
+(<tabla>_pAAAAMM) por lotes atómicos. Las lecturas de rangos unen solo las
+tablas de los meses que solapan la ventana y borrar un mes es DROP TABLE.
+Las lecturas tardías de un mes ya archivado se guardan en la tabla principal;
+la ingesta verifica su clave natural también contra el mes archivado.
+"""
+
+from datetime import datetime
+import re
+import threading
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import Column, Index, MetaData, Table, delete, func, insert, select, text, union_all
+
+from src.models.solar_data import db, SolarModuleData, EnvironmentalData
+
+PARTITIONED_MODELS = {
+    'solar': SolarModuleData,
+    'environmental': EnvironmentalData
+}
+
+DEFAULT_PREMAKE_MONTHS = 3
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_MAINTENANCE_SECONDS = 3600
+
+# Espera máxima de un bloqueo exclusivo al crear o separar particiones
+DDL_LOCK_TIMEOUT_MS = 5000
+
+# Meses que conserva la tabla principal en SQLite (el actual incluido). El
+# almacén en memoria, los detectores y el dashboard leen el último día de
+# lecturas directamente de ella
+DEFAULT_LIVE_MONTHS = 2
+MIN_LIVE_MONTHS = 2
+
+_archive_metadata = MetaData()
+
+
+def month_start(dt):
+    """Primer instante del mes que contiene dt"""
+    return datetime(dt.year, dt.month, 1)
+
+
+def add_months(month, months):
+    """Inicio del mes desplazado months meses"""
+    year, index = divmod(month.month - 1 + months, 12)
+    return datetime(month.year + year, index + 1, 1)
+
+
+def parse_month(value):
+    """
+    Mes en formato AAAA-MM.
+
+    Raises:
+        ValueError: Si el formato no es válido
+    """
+    try:
+        return datetime.strptime(value, '%Y-%m')
+    except (TypeError, ValueError):
+        raise ValueError(f'Mes no válido: {value} (formato AAAA-MM)')
+
+
+def partition_name(table_name, month):
+    """Nombre de la partición de un mes: <tabla>_pAAAAMM"""
+    return f'{table_name}_p{month:%Y%m}'
+
+
+def _partition_month(table_name, name):
+    """Mes de una partición a partir de su nombre (None si no es de la tabla)"""
+    match = re.fullmatch(re.escape(table_name) + r'_p(\d{6})', name)
+    return datetime.strptime(match.group(1), '%Y%m') if match else None
+
+
+def _copy_table(table, name, metadata, index_suffix='', primary_key=('id',), **kwargs):
+    """Copia de las columnas e índices de table con otro nombre"""
+    columns = [
+        Column(column.name, column.type, primary_key=column.name in primary_key,
+               autoincrement=column.name == 'id', nullable=column.nullable)
+        for column in table.columns
+    ]
+    copy = Table(name, metadata, *columns, **kwargs)
+    for index in table.indexes:
+        Index(f'{index.name}{index_suffix}', *[copy.c[column.name] for column in index.columns],
+              unique=index.unique)
+    return copy
+
+
+def archive_table(data_type, month):
+    """Tabla SQLite con las lecturas archivadas de un mes"""
+    table = PARTITIONED_MODELS[data_type].__table__
+    name = partition_name(table.name, month)
+    if name in _archive_metadata.tables:
+        return _archive_metadata.tables[name]
+    return _copy_table(table, name, _archive_metadata, index_suffix=f'_p{month:%Y%m}')
+
+
+def partitioned_parent(data_type, metadata=None):
+    """
+    Tabla padre particionada por rango de timestamp (PostgreSQL).
+
+    La clave primaria incluye timestamp porque en PostgreSQL toda restricción
+    única de una tabla particionada debe contener la clave de partición.
+    """
+    table = PARTITIONED_MODELS[data_type].__table__
+    return _copy_table(table, table.name, metadata or MetaData(), primary_key=('id', 'timestamp'),
+                       postgresql_partition_by='RANGE (timestamp)')
+
+
+def _set_ddl_lock_timeout():
+    """
+    Limitar la espera de los bloqueos exclusivos de DDL en la transacción actual
+    (PostgreSQL).
+
+    Un ALTER/CREATE en cola detrás de una lectura larga bloquearía a todas las
+    escrituras que llegan después; con el límite el mantenimiento falla y se
+    reintenta en la siguiente pasada.
+    """
+    db.session.execute(text(f"SET LOCAL lock_timeout = '{DDL_LOCK_TIMEOUT_MS}ms'"))
+
+
+def union_select(tables, build):
+    """
+    Sentencia sobre varias tablas con las mismas columnas.
+
+    build(table) devuelve la consulta filtrada de una tabla; con varias tablas
+    se unen con UNION ALL para que cada rama use sus propios índices. Las
+    columnas del resultado están en stmt.selected_columns.
+    """
+    if len(tables) == 1:
+        return build(tables[0])
+    return select(union_all(*[build(table) for table in tables]).subquery())
+
+
+class PartitionManager:
+    """Creación, archivo y borrado de particiones mensuales"""
+
+    def __init__(self):
+        self.enabled = False
+        self.premake_months = DEFAULT_PREMAKE_MONTHS
+        self.live_months = DEFAULT_LIVE_MONTHS
+        self.batch_size = DEFAULT_BATCH_SIZE
+        self.interval_seconds = DEFAULT_MAINTENANCE_SECONDS
+        self._run_lock = threading.Lock()
+        self._thread = None
+        self.last_run = None
+
+    def configure(self, app):
+        """
+        Raises:
+            ValueError: Si PARTITION_LIVE_MONTHS es menor que el mínimo
+        """
+        self.enabled = app.config.get('TELEMETRY_PARTITIONING', False)
+        self.premake_months = max(0, app.config.get('PARTITION_PREMAKE_MONTHS', DEFAULT_PREMAKE_MONTHS))
+        self.live_months = app.config.get('PARTITION_LIVE_MONTHS', DEFAULT_LIVE_MONTHS)
+        self.batch_size = max(1, app.config.get('PARTITION_BATCH_SIZE', DEFAULT_BATCH_SIZE))
+        self.interval_seconds = app.config.get('PARTITION_MAINTENANCE_SECONDS', DEFAULT_MAINTENANCE_SECONDS)
+        if self.live_months < MIN_LIVE_MONTHS:
+            raise ValueError(f'PARTITION_LIVE_MONTHS debe ser al menos {MIN_LIVE_MONTHS}')
+
+    @property
+    def dialect(self):
+        return db.engine.dialect.name
+
+    # --- Lectura ---------------------------------------------------------
+
+    def sources(self, data_type, start=None, end=None):
+        """
+        Tablas que pueden contener lecturas de [start, end] (todas sin límites).
+
+        En PostgreSQL es siempre la tabla padre (la poda la hace el
+        planificador); en SQLite, los meses archivados que solapan el rango y
+        la tabla principal, que recibe también las lecturas tardías.
+        """
+        live = PARTITIONED_MODELS[data_type].__table__
+        if self.dialect != 'sqlite':
+            return [live]
+        first = month_start(start) if start else None
+        tables = [
+            archive_table(data_type, month) for month in self.months(data_type)
+            if (first is None or month >= first) and (end is None or month <= end)
+        ]
+        return tables + [live]
+
+    def months(self, data_type):
+        """Meses con partición propia, en orden"""
+        table_name = PARTITIONED_MODELS[data_type].__table__.name
+        if self.dialect == 'postgresql':
+            names = db.session.execute(text(
+                'SELECT child.relname FROM pg_inherits '
+                'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+                'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+                'WHERE parent.relname = :parent'
+            ), {'parent': table_name}).scalars().all()
+        else:
+            names = db.session.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE :pattern"
+            ), {'pattern': f'{table_name}_p%'}).scalars().all()
+        return sorted(m for m in (_partition_month(table_name, name) for name in names) if m)
+
+    # --- PostgreSQL -------------------------------------------------------
+
+    def is_partitioned(self, data_type):
+        """Si la tabla de PostgreSQL ya es una tabla particionada"""
+        return bool(db.session.execute(text(
+            'SELECT 1 FROM pg_partitioned_table '
+            'JOIN pg_class ON pg_class.oid = pg_partitioned_table.partrelid '
+            'WHERE pg_class.relname = :name'
+        ), {'name': PARTITIONED_MODELS[data_type].__table__.name}).first())
+
+    def create_partitioned(self, data_type, now=None):
+        """Crear la tabla padre, su partición DEFAULT y los meses próximos"""
+        parent = partitioned_parent(data_type)
+        parent.create(bind=db.session.connection())
+        db.session.execute(text(f'CREATE TABLE {parent.name}_default PARTITION OF {parent.name} DEFAULT'))
+        db.session.commit()
+        self.premake(data_type, now)
+
+    def premake(self, data_type, now=None):
+        """
+        Crear las particiones del mes anterior, el actual y los próximos.
+
+        Returns:
+            list: Meses creados
+        """
+        current = month_start(now or datetime.utcnow())
+        existing = set(self.months(data_type))
+        created = []
+        for offset in range(-1, self.premake_months + 1):
+            month = add_months(current, offset)
+            if month not in existing:
+                self.create_month(data_type, month)
+                created.append(month)
+        return created
+
+    def create_month(self, data_type, month):
+        """
+        Crear la partición de un mes.
+
+        Las lecturas del mes que ya estén en la partición DEFAULT se mueven a
+        la nueva con la DEFAULT separada, en una sola transacción.
+        """
+        parent = PARTITIONED_MODELS[data_type].__table__.name
+        default = f'{parent}_default'
+        name = partition_name(parent, month)
+        bounds = {'start': month, 'end': add_months(month, 1)}
+        in_month = 'timestamp >= :start AND timestamp < :end'
+        create = (f"CREATE TABLE {name} PARTITION OF {parent} FOR VALUES FROM "
+                  f"('{month:%Y-%m-%d}') TO ('{bounds['end']:%Y-%m-%d}')")
+
+        _set_ddl_lock_timeout()
+        if not db.session.execute(text(f'SELECT 1 FROM {default} WHERE {in_month} LIMIT 1'), bounds).first():
+            db.session.execute(text(create))
+        else:
+            db.session.execute(text(f'ALTER TABLE {parent} DETACH PARTITION {default}'))
+            db.session.execute(text(create))
+            db.session.execute(text(f'INSERT INTO {name} SELECT * FROM {default} WHERE {in_month}'), bounds)
+            db.session.execute(text(f'DELETE FROM {default} WHERE {in_month}'), bounds)
+            db.session.execute(text(f'ALTER TABLE {parent} ATTACH PARTITION {default} DEFAULT'))
+        db.session.commit()
+
+    def convert(self, data_type):
+        """
+        Convertir una tabla existente de PostgreSQL en tabla particionada.
+
+        La tabla anterior se renombra, sus lecturas se copian a la nueva
+        (repartidas por mes) y se elimina; toma un bloqueo exclusivo durante
+        la copia, por lo que debe ejecutarse en una ventana de mantenimiento.
+
+        Returns:
+            int: Lecturas copiadas
+        """
+        table = PARTITIONED_MODELS[data_type].__table__
+        name, old = table.name, f'{table.name}_unpartitioned'
+        db.session.execute(text(f'LOCK TABLE {name} IN ACCESS EXCLUSIVE MODE'))
+        db.session.execute(text(f'ALTER TABLE {name} RENAME TO {old}'))
+        db.session.execute(text(f'ALTER TABLE {old} RENAME CONSTRAINT {name}_pkey TO {old}_pkey'))
+        db.session.execute(text(f'ALTER SEQUENCE {name}_id_seq RENAME TO {old}_id_seq'))
+        for index in table.indexes:
+            db.session.execute(text(f'ALTER INDEX IF EXISTS {index.name} RENAME TO {index.name}_unpartitioned'))
+
+        parent = partitioned_parent(data_type)
+        parent.create(bind=db.session.connection())
+        db.session.execute(text(f'CREATE TABLE {name}_default PARTITION OF {name} DEFAULT'))
+        bounds = db.session.execute(text(f'SELECT min(timestamp), max(timestamp) FROM {old}')).one()
+        db.session.commit()
+
+        if bounds[0] is not None:
+            month = month_start(bounds[0])
+            while month <= bounds[1]:
+                self.create_month(data_type, month)
+                month = add_months(month, 1)
+        self.premake(data_type)
+
+        columns = ', '.join(column.name for column in table.columns)
+        copied = db.session.execute(
+            text(f'INSERT INTO {name} ({columns}) SELECT {columns} FROM {old}')
+        ).rowcount
+        db.session.execute(text(
+            f"SELECT setval('{name}_id_seq', (SELECT coalesce(max(id), 0) + 1 FROM {name}), false)"
+        ))
+        db.session.execute(text(f'DROP TABLE {old}'))
+        db.session.commit()
+        return copied
+
+    # --- SQLite ----------------------------------------------------------
+
+    def archive_month(self, data_type, month):
+        """
+        Mover las lecturas de un mes de la tabla principal a su tabla (SQLite).
+
+        Cada lote se copia y se borra en la misma transacción, así una lectura
+        concurrente nunca ve una lectura duplicada ni ausente. La lectura con
+        el mayor id se queda en la tabla principal para que SQLite no vuelva a
+        asignar ese id.
+
+        Returns:
+            int: Lecturas movidas
+        """
+        live = PARTITIONED_MODELS[data_type].__table__
+        archive = archive_table(data_type, month)
+        archive.create(bind=db.session.connection(), checkfirst=True)
+        db.session.commit()
+
+        max_id = db.session.execute(select(func.max(live.c.id))).scalar()
+        conditions = (
+            live.c.timestamp >= month, live.c.timestamp < add_months(month, 1), live.c.id < max_id
+        )
+        moved = 0
+        while True:
+            ids = db.session.execute(
+                select(live.c.id).where(*conditions).order_by(live.c.id).limit(self.batch_size)
+            ).scalars().all()
+            if not ids:
+                return moved
+            db.session.execute(insert(archive).from_select(
+                [column.name for column in live.columns],
+                select(*live.columns).where(live.c.id.in_(ids))
+            ).prefix_with('OR IGNORE'))
+            db.session.execute(delete(live).where(live.c.id.in_(ids)))
+            db.session.commit()
+            moved += len(ids)
+
+    def archive_closed(self, data_type, now=None):
+        """
+        Archivar los meses anteriores a los que conserva la tabla principal.
+
+        Returns:
+            dict: Lecturas movidas por mes (AAAA-MM)
+        """
+        live = PARTITIONED_MODELS[data_type].__table__
+        boundary = add_months(month_start(now or datetime.utcnow()), 1 - self.live_months)
+        moved = {}
+        while True:
+            # La lectura con el mayor id nunca se archiva (ver archive_month)
+            oldest = db.session.execute(
+                select(func.min(live.c.timestamp)).where(
+                    live.c.timestamp < boundary, live.c.id < select(func.max(live.c.id)).scalar_subquery()
+                )
+            ).scalar()
+            if oldest is None:
+                return moved
+            month = month_start(oldest)
+            moved[f'{month:%Y-%m}'] = self.archive_month(data_type, month)
+
+    # --- Mantenimiento ---------------------------------------------------
+
+    def drop_month(self, data_type, month):
+        """
+        Eliminar la partición de un mes completo sin borrar fila por fila.
+
+        Las lecturas del mes que sigan en la partición DEFAULT o en la tabla
+        principal de SQLite no se tocan (la retención las borra por lotes).
+
+        Returns:
+            bool: Si la partición existía
+        """
+        table_name = PARTITIONED_MODELS[data_type].__table__.name
+        if month not in self.months(data_type):
+            return False
+        name = partition_name(table_name, month)
+        if self.dialect == 'postgresql':
+            _set_ddl_lock_timeout()
+            db.session.execute(text(f'ALTER TABLE {table_name} DETACH PARTITION {name}'))
+        db.session.execute(text(f'DROP TABLE {name}'))
+        db.session.commit()
+        if name in _archive_metadata.tables:
+            _archive_metadata.remove(_archive_metadata.tables[name])
+        return True
+
+    def maintain(self, now=None):
+        """
+        Crear los meses próximos (PostgreSQL) o archivar los cerrados (SQLite).
+
+        Returns:
+            dict: Cambios por tipo de datos
+        """
+        summary = {}
+        with self._run_lock:
+            for data_type in PARTITIONED_MODELS:
+                if self.dialect == 'postgresql':
+                    if self.is_partitioned(data_type):
+                        created = self.premake(data_type, now)
+                        summary[data_type] = {'created': [f'{m:%Y-%m}' for m in created]}
+                elif self.dialect == 'sqlite':
+                    summary[data_type] = {'archived': self.archive_closed(data_type, now)}
+        self.last_run = {'finished_at': datetime.utcnow().isoformat(), **summary}
+        return summary
+
+    def start(self, app):
+        """Mantener las particiones periódicamente en un hilo de fondo"""
+        if not self.enabled or self.interval_seconds <= 0:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._loop, args=(app,), name='partitions', daemon=True)
+        self._thread.start()
+
+    def _loop(self, app):
+        while True:
+            with app.app_context():
+                try:
+                    self.maintain()
+                except Exception as e:
+                    db.session.rollback()
+                    self.last_run = {'error': str(e), 'failed_at': datetime.utcnow().isoformat()}
+                finally:
+                    db.session.remove()
+            time.sleep(self.interval_seconds)
+
+    def status(self):
+        return {
+            'enabled': self.enabled,
+            'dialect': self.dialect,
+            'months': {
+                data_type: [f'{month:%Y-%m}' for month in self.months(data_type)]
+                for data_type in PARTITIONED_MODELS
+            },
+            'premake_months': self.premake_months,
+            'live_months': self.live_months,
+            'interval_seconds': self.interval_seconds,
+            'last_run': self.last_run
+        }
+
+
+partitions = PartitionManager()
+
+
+def create_partitioned_tables():
+    """
+    Crear como tablas particionadas las tablas crudas que aún no existen
+    (PostgreSQL con TELEMETRY_PARTITIONING); se llama antes de db.create_all().
+
+    Returns:
+        list: Tipos de datos creados
+    """
+    partitions.configure(current_app)
+    if not partitions.enabled or partitions.dialect != 'postgresql':
+        return []
+    created = []
+    for data_type, model in PARTITIONED_MODELS.items():
+        if not db.inspect(db.engine).has_table(model.__tablename__):
+            partitions.create_partitioned(data_type)
+            created.append(data_type)
+    return created
+
+
+def init_partitions(app):
+    """Cargar la configuración e iniciar el mantenimiento periódico"""
+    partitions.configure(app)
+    partitions.start(app)
+
+
+@click.command('maintain-partitions')
+@with_appcontext
+def maintain_partitions_command():
+    """Crear los meses próximos (PostgreSQL) o archivar los meses cerrados (SQLite)."""
+    for data_type, changes in partitions.maintain().items():
+        for month in changes.get('created', []):
+            click.echo(f'{data_type}: partición {month} creada')
+        for month, moved in changes.get('archived', {}).items():
+            click.echo(f'{data_type}: {moved} lecturas archivadas en {month}')
+    click.echo('Particiones al día')
+
+
+@click.command('drop-partition')
+@click.argument('data_type', type=click.Choice(list(PARTITIONED_MODELS)))
+@click.argument('month')
+@with_appcontext
+def drop_partition_command(data_type, month):
+    """Eliminar la partición de un mes (AAAA-MM) tras asegurar sus agregados."""
+    from src.services.rollups import ensure_month_rollups
+
+    month = parse_month(month)
+    rolled_up = ensure_month_rollups(data_type, month)
+    if partitions.drop_month(data_type, month):
+        click.echo(f'Partición {month:%Y-%m} eliminada ({rolled_up} claves reagregadas)')
+    else:
+        click.echo(f'No existe la partición {month:%Y-%m}', err=True)
+
+
+@click.command('partition-tables')
+@with_appcontext
+def partition_tables_command():
+    """Convertir las tablas crudas de PostgreSQL en tablas particionadas por mes."""
+    if partitions.dialect != 'postgresql':
+        click.echo('El particionado nativo solo está disponible en PostgreSQL', err=True)
+        return
+    for data_type in PARTITIONED_MODELS:
+        if partitions.is_partitioned(data_type):
+            click.echo(f'{data_type}: ya está particionada')
+            continue
+        click.echo(f'{data_type}: {partitions.convert(data_type)} lecturas copiadas')
@@ -0,0 +1,222 @@
+"""
+Detección de anomalías por comparación entre módulos vecinos - HelioSentinel
+
+Las lecturas de un grupo de módulos (una ubicación) se alinean en una matriz
+tiempo × módulo; en cada instante la potencia de cada módulo se compara con la
+mediana de sus pares mediante un z-score robusto (mediana y MAD). Un módulo que
+queda sistemáticamente por debajo de sus vecinos bajo la misma irradiancia
+(suciedad, sombreado, desajuste de string) se registra como anomalía.
+"""
+
+from datetime import datetime
+import warnings
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import String, insert, literal, select, type_coerce
+
+from src.models.solar_data import db, SolarRollup, AnomalyDetection
+from src.services.anomaly_scan import existing_anomalies
+from src.services.dashboard_metrics import record_anomalies
+from src.services.partitions import partitions, union_select
+from src.services.rollups import RESOLUTIONS
+
+# Agregados utilizables por duración del intervalo en segundos
+ROLLUP_BY_SECONDS = {seconds: name for name, seconds in RESOLUTIONS if name != '1d'}
+
+ANOMALY_TYPE = 'Bajo Rendimiento vs Pares'
+RECOMMENDATION = {
+    'action': 'Inspeccionar suciedad, sombreado y conexiones del string',
+    'priority': 'Media',
+    'timeframe': '1-2 semanas'
+}
+
+DEFAULT_RESOLUTION_MINUTES = 15
+DEFAULT_Z_THRESHOLD = 3.5
+DEFAULT_MIN_FRACTION = 0.5   # Fracción de instantes por debajo del umbral
+MIN_PEERS = 5                # Módulos con lectura necesarios en un instante
+MIN_POINTS = 6               # Instantes válidos necesarios por módulo
+MIN_ACTIVE_POWER = 10.0      # Instantes con mediana menor (noche) se ignoran (W)
+HIGH_SEVERITY_RATIO = 0.7    # Potencia relativa a los pares para severidad Alta
+
+# Escala de la MAD equivalente a la desviación estándar normal
+MAD_SCALE = 1.4826
+
+
+def load_power_matrix(start, end, module_ids=None, resolution_minutes=DEFAULT_RESOLUTION_MINUTES):
+    """
+    Leer la potencia media de la ventana como matriz tiempo × módulo.
+
+    Las lecturas se promedian por intervalo de resolution_minutes para alinear
+    módulos que no reportan en el mismo segundo. Si la resolución coincide con
+    la de un agregado (1min, 15min, 1h) se leen los agregados en lugar de las
+    lecturas crudas.
+
+    Returns:
+        tuple: (matriz float con NaN donde no hay lectura, instantes, módulos)
+    """
+    resolution = ROLLUP_BY_SECONDS.get(resolution_minutes * 60)
+    if resolution is not None:
+        model = SolarRollup
+        stmt = select(
+            model.module_id, type_coerce(model.bucket_start, String), model.power_sum, model.count
+        ).where(
+            model.resolution == resolution,
+            model.bucket_start >= start,
+            model.bucket_start <= end
+        )
+        if module_ids:
+            stmt = stmt.where(model.module_id.in_(module_ids))
+    else:
+        def build(table):
+            stmt = select(
+                table.c.module_id, type_coerce(table.c.timestamp, String), table.c.max_power, literal(1)
+            ).where(table.c.timestamp >= start, table.c.timestamp <= end)
+            if module_ids:
+                stmt = stmt.where(table.c.module_id.in_(module_ids))
+            return stmt
+
+        # Las lecturas de meses archivados siguen en sus propias tablas
+        stmt = union_select(partitions.sources('solar', start, end), build)
+
+    rows = db.session.execute(stmt).all()
+    if not rows:
+        return np.empty((0, 0)), pd.DatetimeIndex([]), np.array([], dtype=object)
+
+    modules, timestamps, power, readings = zip(*rows)
+    buckets = pd.to_datetime(pd.Series(timestamps), format='ISO8601').dt.floor(f'{resolution_minutes}min')
+    time_codes, instants = pd.factorize(buckets, sort=True)
+    module_codes, module_names = pd.factorize(pd.Series(modules), sort=True)
+    power = np.asarray(power, dtype=float)
+    readings = np.asarray(readings, dtype=float)
+
+    shape = (len(instants), len(module_names))
+    sums = np.zeros(shape)
+    counts = np.zeros(shape)
+    valid = np.isfinite(power)
+    np.add.at(sums, (time_codes[valid], module_codes[valid]), power[valid])
+    np.add.at(counts, (time_codes[valid], module_codes[valid]), readings[valid])
+    with np.errstate(invalid='ignore'):
+        matrix = sums / counts
+    return matrix, pd.DatetimeIndex(instants), np.asarray(module_names, dtype=object)
+
+
+def peer_scores(matrix, z_threshold=DEFAULT_Z_THRESHOLD):
+    """
+    Z-scores robustos de cada módulo frente a la mediana de sus pares.
+
+    Returns:
+        dict: Arreglos por módulo (puntos válidos, fracción bajo el umbral,
+              z mediano y potencia relativa mediana) y la matriz de z
+    """
+    peers = np.sum(np.isfinite(matrix), axis=1)
+    usable = peers >= MIN_PEERS
+    with warnings.catch_warnings():
+        # Instantes o módulos sin lecturas producen medianas NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        median = np.nanmedian(np.where(usable[:, None], matrix, np.nan), axis=1)
+    usable &= np.nan_to_num(median, nan=0.0) >= MIN_ACTIVE_POWER
+
+    scores = np.full(matrix.shape, np.nan)
+    ratios = np.full(matrix.shape, np.nan)
+    if usable.any():
+        rows = matrix[usable]
+        row_median = median[usable][:, None]
+        mad = np.nanmedian(np.abs(rows - row_median), axis=1)[:, None]
+        # Piso de la dispersión: 1% de la mediana para grupos casi idénticos
+        scale = MAD_SCALE * np.maximum(mad, 0.01 * row_median)
+        scores[usable] = (rows - row_median) / scale
+        ratios[usable] = rows / row_median
+
+    valid = np.isfinite(scores)
+    points = valid.sum(axis=0)
+    below = (valid & (np.nan_to_num(scores, nan=0.0) < -z_threshold)).sum(axis=0)
+    fraction = below / np.maximum(points, 1)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        median_z = np.nanmedian(scores, axis=0)
+        median_ratio = np.nanmedian(ratios, axis=0)
+
+    return {
+        'points': points,
+        'fraction': fraction,
+        'median_z': median_z,
+        'median_ratio': median_ratio,
+        'scores': scores
+    }
+
+
+def detect_peer_anomalies(start, end, groups=None, resolution_minutes=DEFAULT_RESOLUTION_MINUTES,
+                          z_threshold=DEFAULT_Z_THRESHOLD, min_fraction=DEFAULT_MIN_FRACTION,
+                          persist=True):
+    """
+    Comparar cada módulo con sus pares en todos los grupos indicados.
+
+    Args:
+        groups (dict): {location_id: [module_id, ...]}; por defecto todos los
+                       módulos forman el grupo 'default'
+        persist (bool): Registrar los módulos señalados como AnomalyDetection
+
+    Returns:
+        dict: Resumen por grupo y módulos señalados
+    """
+    groups = groups or {'default': None}
+    existing = existing_anomalies(start, end) if persist else set()
+    now = datetime.utcnow()
+    summary = {'groups': {}, 'flagged': [], 'anomalies_created': 0, 'skipped_existing': 0}
+    records = []
+
+    for location_id, module_ids in groups.items():
+        matrix, instants, modules = load_power_matrix(start, end, module_ids, resolution_minutes)
+        result = peer_scores(matrix, z_threshold)
+        flagged = (result['points'] >= MIN_POINTS) & (result['fraction'] >= min_fraction)
+
+        summary['groups'][location_id] = {
+            'modules': len(modules),
+            'instants': len(instants),
+            'compared_instants': int(np.isfinite(result['scores']).any(axis=1).sum()) if len(modules) else 0,
+            'flagged': int(flagged.sum())
+        }
+
+        for index in np.flatnonzero(flagged):
+            module_id = modules[index]
+            ratio = float(result['median_ratio'][index])
+            entry = {
+                'module_id': module_id,
+                'location_id': location_id,
+                'median_ratio': round(ratio, 4),
+                'median_z': round(float(result['median_z'][index]), 2),
+                'flagged_fraction': round(float(result['fraction'][index]), 3),
+                'points': int(result['points'][index])
+            }
+            summary['flagged'].append(entry)
+
+            if not persist:
+                continue
+            if (module_id, ANOMALY_TYPE) in existing:
+                summary['skipped_existing'] += 1
+                continue
+            records.append({
+                'timestamp': min(now, end),
+                'module_id': module_id,
+                'anomaly_type': ANOMALY_TYPE,
+                'severity_level': 'Alta' if ratio < HIGH_SEVERITY_RATIO else 'Media',
+                'confidence': 'Alta' if entry['flagged_fraction'] >= 0.9 else 'Media',
+                'description': (
+                    f'Anomalía detectada en módulo {module_id}: {ANOMALY_TYPE} en {location_id} '
+                    f'({ratio * 100:.0f}% de la potencia mediana de sus pares, '
+                    f"z mediano {entry['median_z']})"
+                ),
+                'recommended_action': RECOMMENDATION['action'],
+                'priority': RECOMMENDATION['priority'],
+                'timeframe': RECOMMENDATION['timeframe'],
+                'status': 'active',
+                'created_at': now
+            })
+
+    if records:
+        db.session.execute(insert(AnomalyDetection.__table__), records)
+        record_anomalies(records)
+        db.session.commit()
+    summary['anomalies_created'] = len(records)
+    return summary
@@ -0,0 +1,221 @@
+"""
+Predicción de desempeño por lotes - HelioSentinel
+
+Evalúa una matriz de condiciones (o una serie por módulo) en una sola
+pasada vectorizada y guarda los resultados con una inserción masiva.
+"""
+
+from datetime import datetime
+import json
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert, select
+
+from src.models.solar_data import db, PredictionResult
+
+# Límite de condiciones evaluadas en una sola petición
+MAX_PREDICTION_ROWS = 100000
+
+REQUIRED_FEATURES = ['irradiance', 'ambient_temp', 'humidity', 'wind_speed']
+OPTIONAL_FEATURES = {'cloudiness': 0.0, 'precipitation': 0.0}
+FEATURES = ['irradiance', 'ambient_temp', 'cell_temp', 'humidity', 'wind_speed',
+            'cloudiness', 'precipitation']
+
+# Modelo físico simplificado
+BASE_POWER = 300  # Potencia nominal en W
+TEMPERATURE_COEFFICIENT = 0.004
+MODEL_CONFIDENCE = 0.85
+
+# Atributo con el que un predictor declara que predict(DataFrame de FEATURES)
+# devuelve una potencia por fila
+BATCH_PREDICT_FLAG = 'BATCH_PREDICT'
+PHYSICAL_CONFIDENCE = 0.75
+
+
+def parse_conditions(payload):
+    """
+    Convertir el cuerpo de la petición en un DataFrame de condiciones.
+
+    Formatos aceptados:
+        {'conditions': [{...}, ...]}
+        {'columns': [...], 'values': [[...], ...]}
+        {'series': [{'module_id': 'M1', 'conditions': [{...}, ...]}, ...]}
+
+    Raises:
+        ValueError: Si el formato no es reconocido
+    """
+    if not isinstance(payload, dict):
+        raise ValueError('Se esperaba un objeto JSON')
+
+    if 'conditions' in payload:
+        if not isinstance(payload['conditions'], list):
+            raise ValueError('conditions debe ser un arreglo')
+        return pd.DataFrame.from_records(payload['conditions'])
+
+    if 'columns' in payload and 'values' in payload:
+        return pd.DataFrame(payload['values'], columns=payload['columns'])
+
+    if 'series' in payload:
+        frames = []
+        for entry in payload['series']:
+            frame = pd.DataFrame.from_records(entry.get('conditions', []))
+            for key in ('module_id', 'location_id'):
+                if key in entry:
+                    frame[key] = entry[key]
+            frames.append(frame)
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    raise ValueError('Se esperaba conditions, columns/values o series')
+
+
+def validate_conditions(df):
+    """
+    Convertir las variables de entrada a float de forma vectorizada.
+
+    Returns:
+        tuple: (DataFrame con las columnas FEATURES, lista de mensajes 'Fila N: error')
+    """
+    n = len(df)
+    errors = np.full(n, None, dtype=object)
+    features = pd.DataFrame(index=df.index)
+
+    for field in REQUIRED_FEATURES:
+        if field not in df.columns:
+            errors[pd.isna(errors)] = f'Campo requerido faltante: {field}'
+            features[field] = np.nan
+            continue
+        values = pd.to_numeric(df[field], errors='coerce').astype(float)
+        missing = df[field].isna().to_numpy()
+        errors[missing & pd.isna(errors)] = f'Campo requerido faltante: {field}'
+        invalid = ~np.isfinite(values.to_numpy()) & pd.isna(errors)
+        errors[invalid] = f'Valor numérico inválido en {field}'
+        features[field] = values
+
+    # Temperatura de celda estimada como ambiente + 20 °C si no se informa
+    default_cell = features['ambient_temp'] + 20
+    if 'cell_temp' in df.columns:
+        features['cell_temp'] = pd.to_numeric(df['cell_temp'], errors='coerce').fillna(default_cell)
+    else:
+        features['cell_temp'] = default_cell
+
+    for field, default in OPTIONAL_FEATURES.items():
+        if field in df.columns:
+            features[field] = pd.to_numeric(df[field], errors='coerce').fillna(default)
+        else:
+            features[field] = default
+
+    messages = [
+        f'Fila {position + 1}: {message}'
+        for position, message in enumerate(errors.tolist()) if message is not None
+    ]
+    return features[FEATURES].astype(float), messages
+
+
+def physical_model(features):
+    """
+    Modelo físico irradiancia/temperatura/humedad/nubosidad sobre todo el lote.
+
+    Returns:
+        tuple: (potencia predicha, dict de factores como arreglos)
+    """
+    irradiance_factor = features['irradiance'].to_numpy() / 1000
+    temperature_factor = 1 - TEMPERATURE_COEFFICIENT * (features['cell_temp'].to_numpy() - 25)
+    humidity_factor = 1 - features['humidity'].to_numpy() / 100 * 0.1
+    cloud_factor = 1 - features['cloudiness'].to_numpy() / 100 * 0.8
+
+    power = BASE_POWER * irradiance_factor * temperature_factor * humidity_factor * cloud_factor
+    factors = {
+        'irradiance_factor': irradiance_factor,
+        'temperature_factor': temperature_factor,
+        'humidity_factor': humidity_factor
+    }
+    return power, factors
+
+
+def predict_batch(features, predictor=None):
+    """
+    Evaluar el predictor cargado o el modelo físico sobre todas las filas.
+
+    El predictor se evalúa fila a fila con predict_single; solo se llama a su
+    predict con el DataFrame completo si lo declara con BATCH_PREDICT = True
+    (un predict genérico puede esperar otras columnas o escalado).
+
+    Returns:
+        tuple: (potencia predicha, confianza, factores o None)
+    """
+    if predictor is not None and getattr(predictor, BATCH_PREDICT_FLAG, False):
+        power = np.asarray(predictor.predict(features[FEATURES]), dtype=float).reshape(-1)
+        return power, MODEL_CONFIDENCE, None
+
+    if predictor is not None and hasattr(predictor, 'predict_single'):
+        records = features.to_dict('records')
+        power = np.array([predictor.predict_single(record) for record in records], dtype=float)
+        return power, MODEL_CONFIDENCE, None
+
+    power, factors = physical_model(features)
+    return power, PHYSICAL_CONFIDENCE, factors
+
+
+def prediction_history_statement(start, end, model_type=None, limit=100):
+    """Predicciones más recientes de la ventana (GET /api/predictions/history)"""
+    stmt = select(PredictionResult).where(
+        PredictionResult.timestamp >= start,
+        PredictionResult.timestamp <= end
+    )
+    if model_type:
+        stmt = stmt.where(PredictionResult.model_type == model_type)
+    return stmt.order_by(PredictionResult.timestamp.desc()).limit(limit)
+
+
+def save_predictions(features, power, confidence, factors, source):
+    """
+    Guardar los resultados en una sola inserción masiva (sin confirmar).
+
+    Args:
+        source (pd.DataFrame): Condiciones originales (module_id, location_id, timestamp)
+
+    Returns:
+        list: Ids de las predicciones guardadas
+    """
+    now = datetime.utcnow()
+    n = len(features)
+    table = PredictionResult.__table__
+
+    def column(name):
+        if name not in source.columns:
+            return [None] * n
+        values = source[name].astype(object)
+        return values.where(values.notna(), None).tolist()
+
+    inputs = features.to_dict('records')
+    targets = column('timestamp')
+    for record, target in zip(inputs, targets):
+        if target is not None:
+            record['timestamp'] = str(target)
+
+    factor_rows = (
+        pd.DataFrame(factors).to_dict('records') if factors is not None else [None] * n
+    )
+    records = [
+        {
+            'timestamp': now,
+            'model_type': 'performance',
+            'input_data': json.dumps(record),
+            'prediction_result': json.dumps({
+                'predicted_power': predicted,
+                'confidence': confidence,
+                **({'factors': factor_row} if factor_row is not None else {})
+            }),
+            'confidence_score': confidence,
+            'module_id': module_id,
+            'location_id': location_id,
+            'created_at': now
+        }
+        for record, predicted, factor_row, module_id, location_id in zip(
+            inputs, power.tolist(), factor_rows, column('module_id'), column('location_id')
+        )
+    ]
+    return db.session.execute(
+        insert(table).returning(table.c.id, sort_by_parameter_order=True), records
+    ).scalars().all()
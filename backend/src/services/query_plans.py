@@ -0,0 +1,163 @@
+"""
+Verificación de planes de consulta de las rutas de lectura críticas - HelioSentinel
+
+Cada consulta caliente de los endpoints, construida con las mismas funciones
+que usan las rutas, se explica contra la base de datos configurada; la verificación falla si alguna recorre la tabla completa o
+necesita ordenar en memoria en lugar de usar un índice.
+"""
+
+from datetime import datetime, timedelta
+import re
+import sys
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import text
+
+from src.models.solar_data import db
+from src.services.anomaly_scan import active_anomalies_statement
+from src.services.dashboard_metrics import dashboard_metrics
+from src.services.hot_store import latest_statement
+from src.services.predictions import prediction_history_statement
+from src.services.range_reader import DEFAULT_PAGE_SIZE, range_statement
+from src.services.rollups import (
+    RESOLUTIONS, ROLLUP_SPECS, choose_resolution, plan_window, series_statement,
+    window_summary_statements
+)
+
+
+def hot_queries():
+    """
+    Consultas de los endpoints de lectura, generadas con las mismas funciones
+    que usan los endpoints (una consulta nueva o modificada se verifica sin
+    copiarla aquí).
+
+    Returns:
+        list: Tuplas (nombre, sentencia SQLAlchemy)
+    """
+    now = datetime.utcnow()
+    start = now - timedelta(days=7)
+    chart_resolution = choose_resolution(start, now)
+
+    queries = [
+        ('get_latest_data: solar', latest_statement('solar')),
+        ('get_latest_data: solar por módulo', latest_statement('solar', 'M1')),
+        ('get_latest_data: ambiental', latest_statement('environmental')),
+        ('get_latest_data: ambiental por ubicación', latest_statement('environmental', 'default')),
+        ('get_data_range: solar', range_statement('solar', start, now, limit=DEFAULT_PAGE_SIZE + 1)),
+        ('get_data_range: solar por módulo',
+         range_statement('solar', start, now, 'M1', limit=DEFAULT_PAGE_SIZE + 1)),
+        ('get_data_range: solar siguiente página',
+         range_statement('solar', start, now, after=[start.isoformat(), 1], limit=DEFAULT_PAGE_SIZE + 1)),
+        ('get_data_range: ambiental por ubicación',
+         range_statement('environmental', start, now, 'default', limit=DEFAULT_PAGE_SIZE + 1)),
+        ('get_data_range: solar agregados 1h',
+         range_statement('solar', start, now, limit=DEFAULT_PAGE_SIZE + 1, tier='1h')),
+    ]
+
+    for name, statement in dashboard_metrics.reconcile_statements(now).items():
+        queries.append((f'get_dashboard_metrics: {name}', statement))
+    for data_type in ROLLUP_SPECS:
+        queries.append((f'get_dashboard_metrics: serie 1min {data_type}',
+                        series_statement(data_type, start, now, RESOLUTIONS[0][0])))
+
+    for suffix, module_id in (('', None), (' por módulo', 'M1')):
+        queries.append((f'get_performance_charts: serie{suffix}',
+                        series_statement('solar', start, now, chart_resolution, module_id)))
+        # Los tramos de una misma resolución solo difieren en los límites
+        summaries = dict(zip(
+            (resolution for resolution, _, _ in plan_window(start, now)),
+            window_summary_statements('solar', start, now, module_id)
+        ))
+        for resolution, statement in summaries.items():
+            queries.append((f'get_performance_charts: módulos {resolution}{suffix}', statement))
+        queries.append((f'get_performance_charts: crudas{suffix}',
+                        range_statement('solar', start, now, module_id)))
+
+    queries += [
+        ('get_active_anomalies', active_anomalies_statement()),
+        ('get_active_anomalies por severidad', active_anomalies_statement(severity='Alta')),
+        ('get_active_anomalies por módulo', active_anomalies_statement(module_id='M1')),
+        ('get_prediction_history', prediction_history_statement(start, now)),
+        ('get_prediction_history por modelo',
+         prediction_history_statement(start, now, model_type='performance')),
+    ]
+    return queries
+
+
+def _explain(connection, statement):
+    """Obtener las líneas del plan de ejecución de una sentencia"""
+    dialect = connection.dialect
+    # Expandir las listas de IN (...) en parámetros individuales
+    compiled = statement.compile(dialect=dialect, compile_kwargs={'render_postcompile': True})
+    sql = str(compiled)
+
+    if dialect.name == 'sqlite':
+        params = compiled.construct_params()
+        values = [params[name] for name in compiled.positiontup]
+        values = [v.isoformat(' ') if isinstance(v, datetime) else v for v in values]
+        rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}', tuple(values))
+        return [row[-1] for row in rows]
+
+    if dialect.name == 'postgresql':
+        # Sin tablas grandes el planificador prefiere Seq Scan; se desactiva
+        # para comprobar que existe un índice utilizable
+        connection.execute(text('SET LOCAL enable_seqscan = off'))
+        rows = connection.exec_driver_sql(f'EXPLAIN {sql}', compiled.construct_params())
+        return [row[0] for row in rows]
+
+    raise ValueError(f'Dialecto no soportado para verificar planes: {dialect.name}')
+
+
+def _plan_problems(plan_lines, dialect_name):
+    """Detectar recorridos completos de tabla y ordenamientos en memoria"""
+    problems = []
+    for line in plan_lines:
+        if dialect_name == 'sqlite':
+            if re.match(r'^SCAN \w+$', line.strip()):
+                problems.append(f'recorrido completo: {line.strip()}')
+            elif 'USE TEMP B-TREE FOR ORDER BY' in line:
+                problems.append(f'ordenamiento sin índice: {line.strip()}')
+        elif 'Seq Scan' in line:
+            problems.append(f'recorrido completo: {line.strip()}')
+    return problems
+
+
+def check_query_plans():
+    """
+    Explicar todas las consultas calientes.
+
+    Returns:
+        list: Diccionarios con nombre, plan y problemas de cada consulta
+    """
+    results = []
+    with db.engine.connect() as connection:
+        for name, statement in hot_queries():
+            with connection.begin():
+                plan = _explain(connection, statement)
+            results.append({
+                'query': name,
+                'plan': plan,
+                'problems': _plan_problems(plan, connection.dialect.name)
+            })
+    return results
+
+
+@click.command('check-query-plans')
+@click.option('--verbose', is_flag=True, help='Mostrar el plan de cada consulta')
+@with_appcontext
+def check_query_plans_command(verbose):
+    """Fallar si alguna consulta caliente recorre una tabla completa."""
+    failures = 0
+    for result in check_query_plans():
+        status = 'FALLA' if result['problems'] else 'OK'
+        click.echo(f"[{status}] {result['query']}")
+        if verbose or result['problems']:
+            for line in result['plan']:
+                click.echo(f'    {line}')
+        failures += bool(result['problems'])
+
+    if failures:
+        click.echo(f'{failures} consultas sin cobertura de índices', err=True)
+        sys.exit(1)
+    click.echo('Todas las consultas calientes usan índices')
@@ -0,0 +1,179 @@
+"""
+Lectura de rangos de telemetría por páginas (keyset) y en streaming - HelioSentinel
+
+Los rangos se leen de las lecturas crudas o, cuando la retención ya las
+purgó, de un nivel de agregados (1min/15min/1h/1d) con el promedio, mínimo y
+máximo de cada métrica por intervalo.
+"""
+
+from datetime import datetime
+import base64
+import json
+
+from sqlalchemy import select, or_, and_
+
+from src.models.solar_data import db, SolarModuleData, EnvironmentalData
+from src.services.partitions import partitions, union_select
+from src.services.retention import TIERS
+from src.services.rollups import ROLLUP_SPECS, RESOLUTION_SECONDS, _floor
+
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+
+# Filas leídas del cursor del servidor en cada viaje a la base de datos
+STREAM_BATCH_SIZE = 2000
+
+RANGE_TABLES = {
+    'solar': {'model': SolarModuleData, 'key': 'module_id', 'response_key': 'solar_data'},
+    'environmental': {'model': EnvironmentalData, 'key': 'location_id', 'response_key': 'environmental_data'}
+}
+
+
+def encode_cursor(positions):
+    """Codificar las posiciones {data_type: [timestamp, id] | False} en un token opaco"""
+    raw = json.dumps(positions, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Decodificar un token de paginación.
+
+    El nivel debe ser uno de TIERS y cada posición False (tipo agotado) o un
+    par [timestamp ISO, id entero].
+
+    Raises:
+        ValueError: Si el token no es válido
+    """
+    if not token:
+        return {}
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        positions = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError('Cursor no válido')
+    if not isinstance(positions, dict) or not set(positions) <= set(RANGE_TABLES) | {'tier'}:
+        raise ValueError('Cursor no válido')
+    if 'tier' in positions and positions['tier'] not in TIERS:
+        raise ValueError('Cursor no válido')
+    for data_type in RANGE_TABLES:
+        if data_type in positions and positions[data_type] is not False \
+                and not _valid_position(positions[data_type]):
+            raise ValueError('Cursor no válido')
+    return positions
+
+
+def _valid_position(position):
+    """Si la posición es un par [timestamp ISO, id entero]"""
+    if not isinstance(position, list) or len(position) != 2:
+        return False
+    timestamp, row_id = position
+    if not isinstance(timestamp, str) or not isinstance(row_id, int) or isinstance(row_id, bool):
+        return False
+    try:
+        datetime.fromisoformat(timestamp)
+    except ValueError:
+        return False
+    return True
+
+
+def _tier_source(data_type, tier):
+    """
+    Columnas y columna de tiempo de un nivel de agregados.
+
+    Los agregados exponen bucket_start como timestamp, el conteo y por cada
+    métrica su promedio, mínimo y máximo.
+    """
+    spec = ROLLUP_SPECS[data_type]
+    model = spec['model']
+    columns = [model.id, model.bucket_start.label('timestamp'), model.resolution,
+               getattr(model, spec['key']), model.count]
+    for name in spec['metrics']:
+        columns += [
+            (getattr(model, f'{name}_sum') / model.count).label(f'{name}_avg'),
+            getattr(model, f'{name}_min'),
+            getattr(model, f'{name}_max')
+        ]
+    return model, model.bucket_start, columns
+
+
+def _range_conditions(timestamp, id_column, key_column, start, end, key_value, after):
+    conditions = [timestamp >= start, timestamp <= end]
+    if key_value:
+        conditions.append(key_column == key_value)
+    if after:
+        after_ts, after_id = datetime.fromisoformat(after[0]), int(after[1])
+        conditions.append(or_(
+            timestamp > after_ts,
+            and_(timestamp == after_ts, id_column > after_id)
+        ))
+    return conditions
+
+
+def range_statement(data_type, start, end, key_value=None, after=None, limit=None, tier='raw'):
+    """
+    Sentencia de lectura ordenada por (timestamp, id).
+
+    Las lecturas crudas se leen solo de las particiones mensuales que solapan
+    la ventana.
+
+    Args:
+        after (list): Posición [timestamp ISO, id] a partir de la cual continuar
+        tier (str): 'raw' o una resolución de agregados
+    """
+    key = RANGE_TABLES[data_type]['key']
+    if tier == 'raw':
+        stmt = union_select(
+            partitions.sources(data_type, start, end),
+            lambda table: select(*table.columns).where(*_range_conditions(
+                table.c.timestamp, table.c.id, table.c[key], start, end, key_value, after
+            ))
+        )
+        columns = stmt.selected_columns
+        stmt = stmt.order_by(columns.timestamp.asc(), columns.id.asc())
+    else:
+        model, timestamp, columns = _tier_source(data_type, tier)
+        # Incluir el intervalo que contiene el inicio de la ventana
+        start = _floor(start, RESOLUTION_SECONDS[tier])
+        stmt = select(*columns).where(
+            model.resolution == tier,
+            *_range_conditions(timestamp, model.id, getattr(model, key), start, end, key_value, after)
+        ).order_by(timestamp.asc(), model.id.asc())
+    if limit:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def row_to_dict(row):
+    """Serializar una fila (mapping) con el mismo formato que to_dict()"""
+    return {
+        key: value.isoformat() if isinstance(value, datetime) else value
+        for key, value in row.items()
+    }
+
+
+def fetch_page(data_type, start, end, key_value=None, after=None, limit=DEFAULT_PAGE_SIZE, tier='raw'):
+    """
+    Obtener una página y la posición para continuar.
+
+    Returns:
+        tuple: (filas serializadas, posición siguiente o False si no hay más)
+    """
+    rows = db.session.execute(
+        range_statement(data_type, start, end, key_value, after, limit + 1, tier)
+    ).mappings().all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_position = [rows[-1]['timestamp'].isoformat(), rows[-1]['id']] if has_more else False
+    return [row_to_dict(row) for row in rows], next_position
+
+
+def iter_rows(data_type, start, end, key_value=None, after=None, tier='raw'):
+    """Recorrer un rango con un cursor del lado del servidor, por lotes"""
+    stmt = range_statement(data_type, start, end, key_value, after, tier=tier).execution_options(
+        stream_results=True, yield_per=STREAM_BATCH_SIZE
+    )
+    result = db.session.execute(stmt).mappings()
+    for partition in result.partitions():
+        yield partition
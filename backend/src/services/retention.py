@@ -0,0 +1,297 @@
+"""
+Retención escalonada de telemetría - HelioSentinel
+
+Cada nivel tiene su propio plazo: las lecturas crudas (p. ej. 30 días), los
+agregados 1min/15min/1h/1d (p. ej. 15min durante 2 años y 1d para siempre),
+las predicciones y las anomalías ya cerradas. Antes de borrar un día de
+lecturas crudas se comprueba que sus agregados estén completos (y se
+recalculan si faltan). Los meses con partición propia se eliminan completos;
+el resto se borra por lotes de ids con una transacción corta por lote para no
+retener el bloqueo de escritura.
+
+Las lecturas de rangos eligen con choose_tier el nivel más fino que aún
+cubre el inicio de la ventana.
+"""
+
+from datetime import datetime, timedelta
+import threading
+import time
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import delete, func, select
+
+from src.models.solar_data import db, PredictionResult, AnomalyDetection
+from src.services.dashboard_metrics import dashboard_metrics
+from src.services.partitions import partitions, add_months
+from src.services.rollups import (
+    RESOLUTIONS, ROLLUP_SPECS, _floor, ensure_day_rollups, ensure_month_rollups
+)
+
+RAW_TIER = 'raw'
+TIERS = [RAW_TIER] + [resolution for resolution, _ in RESOLUTIONS]
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_BATCH_PAUSE_MS = 50
+DEFAULT_INTERVAL_SECONDS = 3600
+
+# Las métricas del dashboard, el almacén en memoria y los detectores leen el
+# último día de lecturas crudas y de agregados 1min
+MIN_RETENTION_DAYS = {RAW_TIER: 2, '1min': 2}
+
+DAY_SECONDS = RESOLUTIONS[-1][1]
+
+
+class RetentionPolicy:
+    """Días conservados por nivel (None = para siempre)"""
+
+    def __init__(self, tiers=None, predictions_days=None, anomalies_days=None):
+        self.tiers = {tier: None for tier in TIERS}
+        self.tiers.update(tiers or {})
+        self.predictions_days = predictions_days
+        self.anomalies_days = anomalies_days
+        self.validate()
+
+    @classmethod
+    def from_config(cls, config):
+        """Política a partir de RETENTION_<NIVEL>_DAYS (0 o ausente = para siempre)"""
+        def days(name):
+            value = config.get(name, 0)
+            return value if value and value > 0 else None
+        return cls(
+            tiers={tier: days(f'RETENTION_{tier.upper()}_DAYS') for tier in TIERS},
+            predictions_days=days('RETENTION_PREDICTIONS_DAYS'),
+            anomalies_days=days('RETENTION_ANOMALIES_DAYS')
+        )
+
+    def validate(self):
+        """
+        Raises:
+            ValueError: Si un nivel queda por debajo de su mínimo
+        """
+        for tier, minimum in MIN_RETENTION_DAYS.items():
+            days = self.tiers[tier]
+            if days is not None and days < minimum:
+                raise ValueError(f'La retención de {tier} debe ser de al menos {minimum} días')
+
+    @property
+    def enabled(self):
+        return any(days is not None for days in self.tiers.values()) or bool(
+            self.predictions_days or self.anomalies_days
+        )
+
+    def cutoff(self, tier, now=None):
+        """Instante antes del cual el nivel se borra (None si se conserva siempre)"""
+        days = self.tiers[tier]
+        if days is None:
+            return None
+        return (now or datetime.utcnow()) - timedelta(days=days)
+
+    def choose_tier(self, start, now=None):
+        """
+        Nivel más fino que conserva datos desde start.
+
+        Si ninguno llega tan atrás se usa el de mayor retención.
+        """
+        now = now or datetime.utcnow()
+        for tier in TIERS:
+            cutoff = self.cutoff(tier, now)
+            if cutoff is None or start >= cutoff:
+                return tier
+        return max(TIERS, key=lambda tier: self.tiers[tier])
+
+    def to_dict(self):
+        return {
+            'tiers': dict(self.tiers),
+            'predictions_days': self.predictions_days,
+            'anomalies_days': self.anomalies_days
+        }
+
+
+class RetentionEngine:
+    """Aplicación de la política por lotes, bajo demanda o en segundo plano"""
+
+    def __init__(self, policy=None, batch_size=DEFAULT_BATCH_SIZE, batch_pause_ms=DEFAULT_BATCH_PAUSE_MS):
+        self.policy = policy or RetentionPolicy()
+        self.batch_size = batch_size
+        self.batch_pause_ms = batch_pause_ms
+        self.interval_seconds = DEFAULT_INTERVAL_SECONDS
+        self._run_lock = threading.Lock()
+        self._thread = None
+        self.last_run = None
+
+    def configure(self, app):
+        self.policy = RetentionPolicy.from_config(app.config)
+        self.batch_size = max(1, app.config.get('RETENTION_BATCH_SIZE', DEFAULT_BATCH_SIZE))
+        self.batch_pause_ms = max(0, app.config.get('RETENTION_BATCH_PAUSE_MS', DEFAULT_BATCH_PAUSE_MS))
+        self.interval_seconds = app.config.get('RETENTION_INTERVAL_SECONDS', DEFAULT_INTERVAL_SECONDS)
+
+    def choose_tier(self, start, now=None):
+        return self.policy.choose_tier(start, now)
+
+    def raw_cutoff(self, now=None):
+        """
+        Inicio del primer día que conserva todas sus lecturas crudas (None si
+        no se purgan). Se alinea al día para no dejar días purgados a medias.
+        """
+        cutoff = self.policy.cutoff(RAW_TIER, now)
+        return None if cutoff is None else _floor(cutoff, DAY_SECONDS)
+
+    def _delete_batches(self, table, *conditions):
+        """Borrar por lotes de ids, confirmando cada lote; devuelve las filas borradas"""
+        deleted = 0
+        while True:
+            ids = db.session.execute(
+                select(table.c.id).where(*conditions).order_by(table.c.id).limit(self.batch_size)
+            ).scalars().all()
+            if not ids:
+                return deleted
+            db.session.execute(delete(table).where(table.c.id.in_(ids)))
+            db.session.commit()
+            deleted += len(ids)
+            if len(ids) < self.batch_size:
+                return deleted
+            if self.batch_pause_ms:
+                time.sleep(self.batch_pause_ms / 1000)
+
+    def purge_raw(self, data_type, cutoff):
+        """
+        Borrar las lecturas crudas anteriores al día de cutoff tras asegurar sus agregados.
+
+        Los meses completos con partición propia se eliminan de una vez; el
+        resto se borra día por día desde el más antiguo, por lotes.
+
+        Returns:
+            dict: Lecturas borradas, claves reagregadas y particiones eliminadas
+        """
+        cutoff = _floor(cutoff, DAY_SECONDS)
+        result = {'deleted': 0, 'rolled_up': 0, 'partitions_dropped': 0}
+        for month in partitions.months(data_type):
+            if add_months(month, 1) <= cutoff:
+                result['rolled_up'] += ensure_month_rollups(data_type, month)
+                result['partitions_dropped'] += partitions.drop_month(data_type, month)
+
+        for table in partitions.sources(data_type, end=cutoff):
+            while True:
+                oldest = db.session.execute(
+                    select(func.min(table.c.timestamp)).where(table.c.timestamp < cutoff)
+                ).scalar()
+                if oldest is None:
+                    break
+                day = _floor(oldest, DAY_SECONDS)
+                result['rolled_up'] += ensure_day_rollups(data_type, day)
+                end = min(day + timedelta(seconds=DAY_SECONDS), cutoff)
+                result['deleted'] += self._delete_batches(
+                    table, table.c.timestamp >= day, table.c.timestamp < end
+                )
+        return result
+
+    def purge_rollups(self, data_type, resolution, cutoff):
+        """Borrar los agregados de una resolución anteriores a cutoff"""
+        table = ROLLUP_SPECS[data_type]['model'].__table__
+        return self._delete_batches(
+            table, table.c.resolution == resolution, table.c.bucket_start < cutoff
+        )
+
+    def run(self, now=None):
+        """
+        Aplicar la política completa.
+
+        Returns:
+            dict: Filas borradas por nivel y tabla, y duración
+        """
+        now = now or datetime.utcnow()
+        started = time.monotonic()
+        summary = {'started_at': now.isoformat(), 'raw': {}, 'rollups': {}, 'rolled_up': {},
+                   'partitions_dropped': {}}
+        with self._run_lock:
+            raw_cutoff = self.raw_cutoff(now)
+            for data_type in ROLLUP_SPECS:
+                if raw_cutoff is not None:
+                    result = self.purge_raw(data_type, raw_cutoff)
+                    summary['raw'][data_type] = result['deleted']
+                    summary['rolled_up'][data_type] = result['rolled_up']
+                    summary['partitions_dropped'][data_type] = result['partitions_dropped']
+                for resolution, _ in RESOLUTIONS:
+                    cutoff = self.policy.cutoff(resolution, now)
+                    if cutoff is not None:
+                        summary['rollups'][f'{data_type}:{resolution}'] = self.purge_rollups(
+                            data_type, resolution, cutoff
+                        )
+
+            if self.policy.predictions_days:
+                table = PredictionResult.__table__
+                summary['predictions'] = self._delete_batches(
+                    table, table.c.timestamp < now - timedelta(days=self.policy.predictions_days)
+                )
+            if self.policy.anomalies_days:
+                # Las anomalías activas se conservan sin importar su antigüedad
+                table = AnomalyDetection.__table__
+                summary['anomalies'] = self._delete_batches(
+                    table, table.c.status != 'active',
+                    table.c.timestamp < now - timedelta(days=self.policy.anomalies_days)
+                )
+
+        if any(summary['rollups'].values()) or summary.get('anomalies'):
+            # Los módulos conocidos y las anomalías resueltas pueden haber cambiado
+            dashboard_metrics.mark_stale()
+        summary['elapsed_seconds'] = round(time.monotonic() - started, 3)
+        self.last_run = summary
+        return summary
+
+    def start(self, app):
+        """Aplicar la política periódicamente en un hilo de fondo"""
+        if self.interval_seconds <= 0 or not self.policy.enabled:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._loop, args=(app,), name='retention', daemon=True)
+        self._thread.start()
+
+    def _loop(self, app):
+        while True:
+            time.sleep(self.interval_seconds)
+            with app.app_context():
+                try:
+                    self.run()
+                except Exception as e:
+                    db.session.rollback()
+                    self.last_run = {'error': str(e), 'failed_at': datetime.utcnow().isoformat()}
+                finally:
+                    db.session.remove()
+
+    def status(self):
+        return {
+            'enabled': self.policy.enabled,
+            'policy': self.policy.to_dict(),
+            'batch_size': self.batch_size,
+            'batch_pause_ms': self.batch_pause_ms,
+            'interval_seconds': self.interval_seconds,
+            'last_run': self.last_run
+        }
+
+
+retention = RetentionEngine()
+
+
+def init_retention(app):
+    """Cargar la política desde la configuración e iniciar la purga periódica"""
+    retention.configure(app)
+    retention.start(app)
+
+
+@click.command('apply-retention')
+@with_appcontext
+def apply_retention_command():
+    """Aplicar la política de retención (agregar y purgar por lotes)."""
+    summary = retention.run()
+    for data_type, deleted in summary['raw'].items():
+        click.echo(f"{data_type}: {deleted} lecturas crudas borradas "
+                   f"({summary['rolled_up'][data_type]} claves reagregadas, "
+                   f"{summary['partitions_dropped'][data_type]} particiones eliminadas)")
+    for name, deleted in summary['rollups'].items():
+        click.echo(f'Agregados {name}: {deleted} filas borradas')
+    for name in ('predictions', 'anomalies'):
+        if name in summary:
+            click.echo(f'{name}: {summary[name]} filas borradas')
+    click.echo(f"Retención aplicada en {summary['elapsed_seconds']} s")
@@ -0,0 +1,474 @@
+"""
+Agregados pre-calculados por intervalo (1min/15min/1h/1d) - HelioSentinel
+
+Los agregados por módulo y por ubicación se actualizan de forma incremental
+con cada lote insertado (y se recalculan por día al sobrescribir lecturas);
+las consultas de ventanas combinan la resolución más gruesa que cabe en cada
+tramo, por lo que su costo no depende del histórico.
+"""
+
+from datetime import datetime, timedelta
+
+import click
+import pandas as pd
+from flask.cli import with_appcontext
+from sqlalchemy import select, func, delete
+
+from src.models.solar_data import (
+    db, SolarModuleData, EnvironmentalData, SolarRollup, EnvironmentalRollup
+)
+from src.services.partitions import partitions, union_select, add_months
+from src.services.upsert import accumulate_rows
+
+# Resoluciones de menor a mayor: (nombre, segundos)
+RESOLUTIONS = [('1min', 60), ('15min', 900), ('1h', 3600), ('1d', 86400)]
+RESOLUTION_SECONDS = dict(RESOLUTIONS)
+
+# Puntos mínimos que debe tener una serie al elegir la resolución automática
+MIN_CHART_POINTS = 48
+
+ROLLUP_SPECS = {
+    'solar': {
+        'source': SolarModuleData,
+        'model': SolarRollup,
+        'key': 'module_id',
+        'metrics': {
+            'power': 'max_power',
+            'efficiency': 'efficiency',
+            'temperature': 'cell_temperature'
+        }
+    },
+    'environmental': {
+        'source': EnvironmentalData,
+        'model': EnvironmentalRollup,
+        'key': 'location_id',
+        'metrics': {
+            'temperature': 'ambient_temperature',
+            'irradiance': 'irradiance',
+            'humidity': 'humidity'
+        }
+    }
+}
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _floor(dt, seconds):
+    """Inicio del intervalo que contiene dt"""
+    step = timedelta(seconds=seconds)
+    return EPOCH + ((dt - EPOCH) // step) * step
+
+
+def _ceil(dt, seconds):
+    """Primer inicio de intervalo mayor o igual a dt"""
+    floor = _floor(dt, seconds)
+    return floor if floor == dt else floor + timedelta(seconds=seconds)
+
+
+def _aggregate_spec(metrics):
+    """Columnas acumulables agrupadas por tipo de agregación"""
+    sums = ['count'] + [f'{name}_sum' for name in metrics]
+    mins = [f'{name}_min' for name in metrics]
+    maxs = [f'{name}_max' for name in metrics]
+    return sums, mins, maxs
+
+
+def aggregate_records(data_type, records):
+    """
+    Agregar lecturas a todas las resoluciones de forma vectorizada.
+
+    Returns:
+        list: Filas de agregados listas para acumular
+    """
+    spec = ROLLUP_SPECS[data_type]
+    key, metrics = spec['key'], spec['metrics']
+    df = pd.DataFrame.from_records(
+        records, columns=[key, 'timestamp'] + list(metrics.values())
+    )
+    df['bucket_start'] = pd.to_datetime(df['timestamp']).dt.floor('60s')
+
+    named = {'count': (key, 'size')}
+    for name, source in metrics.items():
+        named[f'{name}_sum'] = (source, 'sum')
+        named[f'{name}_min'] = (source, 'min')
+        named[f'{name}_max'] = (source, 'max')
+    level = df.groupby(['bucket_start', key], sort=False).agg(**named).reset_index()
+
+    # Las resoluciones gruesas se derivan de la anterior, no de las lecturas
+    sums, mins, maxs = _aggregate_spec(metrics)
+    reducers = {**{c: 'sum' for c in sums}, **{c: 'min' for c in mins}, **{c: 'max' for c in maxs}}
+
+    rows = []
+    for resolution, seconds in RESOLUTIONS:
+        if resolution != RESOLUTIONS[0][0]:
+            level = level.assign(bucket_start=level['bucket_start'].dt.floor(f'{seconds}s'))
+            level = level.groupby(['bucket_start', key], sort=False).agg(reducers).reset_index()
+
+        buckets = level['bucket_start'].to_numpy(dtype='datetime64[us]').astype(object).tolist()
+        level_rows = level.drop(columns='bucket_start').to_dict('records')
+        for row, bucket in zip(level_rows, buckets):
+            row['bucket_start'] = bucket
+            row['resolution'] = resolution
+        rows.extend(level_rows)
+
+    return rows
+
+
+def update_rollups(data_type, records):
+    """Acumular un lote de lecturas en los agregados (listener de ingesta)"""
+    spec = ROLLUP_SPECS[data_type]
+    sums, mins, maxs = _aggregate_spec(spec['metrics'])
+    accumulate_rows(
+        spec['model'], aggregate_records(data_type, records),
+        key_fields=['resolution', spec['key'], 'bucket_start'],
+        sum_fields=sums, min_fields=mins, max_fields=maxs
+    )
+
+
+def refresh_rollups(data_type, records):
+    """
+    Recalcular los agregados de los días afectados por lecturas sobrescritas.
+
+    Los mínimos y máximos no se pueden descontar, así que por cada módulo o
+    ubicación se borran los agregados de sus días contiguos afectados y se
+    vuelven a acumular desde las lecturas crudas (listener de actualización).
+    Los días anteriores al corte de retención solo se recalculan si la purga
+    aún no los alcanzó; si ya no tienen todas sus lecturas crudas, sus
+    agregados se conservan sin cambios.
+    """
+    from src.services.retention import retention
+
+    key = ROLLUP_SPECS[data_type]['key']
+    day_seconds = RESOLUTIONS[-1][1]
+    cutoff = retention.raw_cutoff()
+
+    days_by_key = {}
+    counts_by_day = {}
+    for record in records:
+        day = _floor(record['timestamp'], day_seconds)
+        if cutoff is not None and day < cutoff:
+            if day not in counts_by_day:
+                counts_by_day[day] = _day_counts(data_type, day)
+            raw_counts, rolled_counts = counts_by_day[day]
+            if raw_counts.get(record[key], 0) < rolled_counts.get(record[key], 0):
+                continue
+        days_by_key.setdefault(record[key], set()).add(day)
+    _recompute_days(data_type, days_by_key)
+
+
+def _recompute_days(data_type, days_by_key):
+    """Reconstruir desde las lecturas crudas los agregados de los días de cada clave"""
+    spec = ROLLUP_SPECS[data_type]
+    model, key = spec['model'], spec['key']
+    day = timedelta(seconds=RESOLUTIONS[-1][1])
+
+    for key_value, days in days_by_key.items():
+        days = sorted(days)
+        # Agrupar días consecutivos en tramos [inicio, fin)
+        spans = [[days[0], days[0] + day]]
+        for start in days[1:]:
+            if start == spans[-1][1]:
+                spans[-1][1] = start + day
+            else:
+                spans.append([start, start + day])
+
+        for start, end in spans:
+            db.session.execute(delete(model).where(
+                getattr(model, key) == key_value,
+                model.bucket_start >= start, model.bucket_start < end
+            ))
+            rows = db.session.execute(union_select(
+                partitions.sources(data_type, start, end),
+                lambda table: select(*_raw_columns(data_type, table)).where(
+                    table.c[key] == key_value,
+                    table.c.timestamp >= start, table.c.timestamp < end
+                )
+            )).mappings().all()
+            if rows:
+                update_rollups(data_type, [dict(row) for row in rows])
+
+
+def _raw_columns(data_type, table):
+    """Columnas de las lecturas crudas que alimentan los agregados"""
+    spec = ROLLUP_SPECS[data_type]
+    return [table.c.id, table.c[spec['key']], table.c.timestamp] + [
+        table.c[field] for field in spec['metrics'].values()
+    ]
+
+
+def _day_counts(data_type, day):
+    """
+    Lecturas crudas y agregadas de un día por módulo o ubicación.
+
+    Returns:
+        tuple: (lecturas crudas por clave, lecturas en el agregado diario por clave)
+    """
+    spec = ROLLUP_SPECS[data_type]
+    model, key = spec['model'], spec['key']
+    end = day + timedelta(seconds=RESOLUTIONS[-1][1])
+
+    raw_counts = {}
+    for table in partitions.sources(data_type, day, end):
+        for key_value, count in db.session.execute(
+            select(table.c[key], func.count()).where(table.c.timestamp >= day, table.c.timestamp < end)
+            .group_by(table.c[key])
+        ).all():
+            raw_counts[key_value] = raw_counts.get(key_value, 0) + count
+    rolled_counts = dict(db.session.execute(
+        select(getattr(model, key), model.count).where(
+            model.resolution == RESOLUTIONS[-1][0], model.bucket_start == day
+        )
+    ).all())
+    return raw_counts, rolled_counts
+
+
+def ensure_day_rollups(data_type, day):
+    """
+    Recalcular los agregados de un día si no contienen todas sus lecturas crudas.
+
+    Los días con menos lecturas crudas que agregadas (purga parcial) se
+    dejan como están.
+
+    Returns:
+        int: Módulos/ubicaciones cuyos agregados se recalcularon
+    """
+    raw_counts, rolled_counts = _day_counts(data_type, day)
+    missing = [k for k, count in raw_counts.items() if count > rolled_counts.get(k, 0)]
+    if missing:
+        # El día aún conserva todas sus lecturas crudas: se reconstruye aunque
+        # quede antes del corte de retención
+        _recompute_days(data_type, {k: {day} for k in missing})
+        db.session.commit()
+    return len(missing)
+
+
+def ensure_month_rollups(data_type, month):
+    """Asegurar los agregados de cada día de un mes antes de eliminarlo"""
+    day, end = month, add_months(month, 1)
+    rolled_up = 0
+    while day < end:
+        rolled_up += ensure_day_rollups(data_type, day)
+        day += timedelta(seconds=RESOLUTIONS[-1][1])
+    return rolled_up
+
+
+def plan_window(start, end):
+    """
+    Descomponer [start, end) en tramos cubiertos por intervalos completos.
+
+    El tramo central usa la resolución más gruesa posible y los extremos se
+    completan con resoluciones más finas (precisión de un minuto).
+
+    Returns:
+        list: Tuplas (resolución, inicio, fin)
+    """
+    segments = []
+
+    def split(seg_start, seg_end, level):
+        if seg_start >= seg_end:
+            return
+        resolution, seconds = RESOLUTIONS[level]
+        if level == 0:
+            segments.append((resolution, _floor(seg_start, seconds), seg_end))
+            return
+        first, last = _ceil(seg_start, seconds), _floor(seg_end, seconds)
+        if first >= last:
+            split(seg_start, seg_end, level - 1)
+            return
+        split(seg_start, first, level - 1)
+        segments.append((resolution, first, last))
+        split(last, seg_end, level - 1)
+
+    split(start, end, len(RESOLUTIONS) - 1)
+    return segments
+
+
+def _aggregate_columns(model, metrics):
+    """Expresiones SQL para combinar filas de agregados (orden: sumas, mínimos, máximos)"""
+    sums, mins, maxs = _aggregate_spec(metrics)
+    return (
+        [func.sum(getattr(model, c)).label(c) for c in sums]
+        + [func.min(getattr(model, c)).label(c) for c in mins]
+        + [func.max(getattr(model, c)).label(c) for c in maxs]
+    )
+
+
+def window_summary_statements(data_type, start, end, key_value=None):
+    """
+    Sentencias de window_summary: una por tramo de plan_window.
+
+    Returns:
+        list: Consultas agrupadas por módulo/ubicación
+    """
+    spec = ROLLUP_SPECS[data_type]
+    model, metrics = spec['model'], spec['metrics']
+    key_column = getattr(model, spec['key'])
+
+    statements = []
+    for resolution, seg_start, seg_end in plan_window(start, end):
+        query = select(key_column, *_aggregate_columns(model, metrics)).where(
+            model.resolution == resolution,
+            model.bucket_start >= seg_start,
+            model.bucket_start < seg_end
+        )
+        if key_value:
+            query = query.where(key_column == key_value)
+        statements.append(query.group_by(key_column))
+    return statements
+
+
+def window_summary(data_type, start, end, key_value=None):
+    """
+    Agregados por módulo/ubicación en la ventana [start, end).
+
+    Returns:
+        pd.DataFrame: Una fila por clave con count, sumas, mínimos y máximos
+    """
+    spec = ROLLUP_SPECS[data_type]
+    sums, mins, maxs = _aggregate_spec(spec['metrics'])
+
+    frames = []
+    for statement in window_summary_statements(data_type, start, end, key_value):
+        rows = db.session.execute(statement).all()
+        if rows:
+            frames.append(pd.DataFrame(rows, columns=[spec['key']] + sums + mins + maxs))
+
+    if not frames:
+        return pd.DataFrame(columns=[spec['key']] + sums + mins + maxs).set_index(spec['key'])
+
+    reducers = {**{c: 'sum' for c in sums}, **{c: 'min' for c in mins}, **{c: 'max' for c in maxs}}
+    return pd.concat(frames).groupby(spec['key']).agg(reducers)
+
+
+def count_keys(data_type):
+    """Número de módulos/ubicaciones con datos en todo el histórico"""
+    spec = ROLLUP_SPECS[data_type]
+    model = spec['model']
+    return db.session.execute(
+        select(func.count(func.distinct(getattr(model, spec['key']))))
+        .where(model.resolution == RESOLUTIONS[-1][0])
+    ).scalar() or 0
+
+
+def choose_resolution(start, end, min_points=MIN_CHART_POINTS):
+    """Resolución más gruesa que produce al menos min_points intervalos"""
+    span = (end - start).total_seconds()
+    for resolution, seconds in reversed(RESOLUTIONS):
+        if span / seconds >= min_points:
+            return resolution
+    return RESOLUTIONS[0][0]
+
+
+def series_statement(data_type, start, end, resolution, key_value=None):
+    """Sentencia de series: agregados por intervalo ordenados por bucket_start"""
+    spec = ROLLUP_SPECS[data_type]
+    model, metrics = spec['model'], spec['metrics']
+
+    query = select(model.bucket_start, *_aggregate_columns(model, metrics)).where(
+        model.resolution == resolution,
+        model.bucket_start >= _floor(start, RESOLUTION_SECONDS[resolution]),
+        model.bucket_start < end
+    )
+    if key_value:
+        query = query.where(getattr(model, spec['key']) == key_value)
+    return query.group_by(model.bucket_start).order_by(model.bucket_start.asc())
+
+
+def series(data_type, start, end, resolution, key_value=None):
+    """
+    Serie temporal agregada (todas las claves combinadas) a una resolución.
+
+    Returns:
+        pd.DataFrame: Columnas bucket_start, count y agregados por métrica
+    """
+    sums, mins, maxs = _aggregate_spec(ROLLUP_SPECS[data_type]['metrics'])
+    rows = db.session.execute(series_statement(data_type, start, end, resolution, key_value)).all()
+    return pd.DataFrame(rows, columns=['bucket_start'] + sums + mins + maxs)
+
+
+def _clear_rebuilt_days(data_type):
+    """
+    Borrar los agregados de los días que conservan todas sus lecturas crudas.
+
+    Los días sin lecturas crudas o con menos que las agregadas (purgados por
+    la retención) no se tocan: sus agregados son la única copia del histórico.
+
+    Returns:
+        set: (módulo o ubicación, día) cuyos agregados se conservan
+    """
+    spec = ROLLUP_SPECS[data_type]
+    model, key = spec['model'], spec['key']
+    day_seconds = RESOLUTIONS[-1][1]
+    day = timedelta(seconds=day_seconds)
+
+    bounds = [
+        db.session.execute(select(func.min(table.c.timestamp), func.max(table.c.timestamp))).one()
+        for table in partitions.sources(data_type)
+    ]
+    bounds = [(first, last) for first, last in bounds if first is not None]
+    if not bounds:
+        return set()
+
+    kept = set()
+    current = _floor(min(first for first, _ in bounds), day_seconds)
+    last = max(last for _, last in bounds)
+    while current <= last:
+        raw_counts, rolled_counts = _day_counts(data_type, current)
+        rebuilt = [k for k, count in raw_counts.items() if count >= rolled_counts.get(k, 0)]
+        kept.update((k, current) for k in set(raw_counts) - set(rebuilt))
+        for start in range(0, len(rebuilt), 500):
+            db.session.execute(delete(model).where(
+                getattr(model, key).in_(rebuilt[start:start + 500]),
+                model.bucket_start >= current, model.bucket_start < current + day
+            ))
+        db.session.commit()
+        current += day
+    return kept
+
+
+def rebuild_rollups(chunk_size=100000):
+    """
+    Recalcular los agregados a partir de las lecturas crudas.
+
+    Solo se reconstruyen los días de cada módulo o ubicación que conservan
+    todas sus lecturas crudas; los de días purgados se conservan.
+
+    Returns:
+        dict: Lecturas procesadas por tipo de datos
+    """
+    processed = {}
+    day_seconds = RESOLUTIONS[-1][1]
+    for data_type, spec in ROLLUP_SPECS.items():
+        key = spec['key']
+        kept = _clear_rebuilt_days(data_type)
+
+        total = 0
+        for table in partitions.sources(data_type):
+            columns = _raw_columns(data_type, table)
+            last_id = 0
+            while True:
+                rows = db.session.execute(
+                    select(*columns).where(table.c.id > last_id)
+                    .order_by(table.c.id.asc()).limit(chunk_size)
+                ).mappings().all()
+                if not rows:
+                    break
+                last_id = rows[-1]['id']
+                records = [
+                    dict(row) for row in rows
+                    if (row[key], _floor(row['timestamp'], day_seconds)) not in kept
+                ]
+                if records:
+                    update_rollups(data_type, records)
+                    db.session.commit()
+                total += len(records)
+        processed[data_type] = total
+    return processed
+
+
+@click.command('rebuild-rollups')
+@with_appcontext
+def rebuild_rollups_command():
+    """Recalcular los agregados 1min/15min/1h/1d desde los datos crudos."""
+    for data_type, total in rebuild_rollups().items():
+        click.echo(f'{data_type}: {total} lecturas agregadas')
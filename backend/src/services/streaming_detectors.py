@@ -0,0 +1,389 @@
+"""
+Detectores incrementales de anomalías por módulo (EWMA / CUSUM) - HelioSentinel
+
+Cada módulo guarda por métrica una referencia (media y varianza aprendidas en
+las primeras lecturas), el nivel suavizado actual (EWMA) y un acumulador
+CUSUM de desviaciones a la baja. Cada lectura ingerida actualiza ese estado en
+tiempo constante: un descenso lento acumula en el CUSUM (degradación) y una
+caída brusca supera el umbral de z de inmediato.
+
+Los lotes se procesan de forma vectorizada: las lecturas se ordenan por módulo
+y timestamp y se aplica un paso por posición, con todos los módulos a la vez.
+Las lecturas se aplican al estado solo cuando su transacción se confirma
+(una ingesta revertida o reintentada no las cuenta dos veces); las anomalías
+y el estado, que se guarda periódicamente en detector_states y se recarga al
+arrancar, se escriben entonces en una transacción propia. Cada proceso
+mantiene su propio estado, por lo que las lecturas de un módulo deben llegar
+siempre al mismo proceso.
+"""
+
+from datetime import datetime, timedelta
+import atexit
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import event, insert, select
+from sqlalchemy.orm import Session
+
+from src.models.solar_data import db, AnomalyDetection, DetectorState
+from src.services.anomaly_scan import RECOMMENDATIONS, DEFAULT_RECOMMENDATION
+from src.services.dashboard_metrics import record_anomalies
+from src.services.ingestion import register_ingest_listener
+from src.services.upsert import accumulate_rows
+
+# Métricas vigiladas (independientes de la irradiancia)
+METRICS = ['efficiency', 'open_circuit_voltage']
+
+# Anomalía registrada por métrica y tipo de alarma: (tipo, descripción, severidad)
+ALARMS = {
+    ('efficiency', 'drift'): (1, 'Degradación Gradual', 'Media'),
+    ('efficiency', 'drop'): (2, 'Falla de Celda', 'Alta'),
+    ('open_circuit_voltage', 'drift'): (2, 'Falla de Celda', 'Alta'),
+    ('open_circuit_voltage', 'drop'): (2, 'Falla de Celda', 'Alta')
+}
+
+WARMUP_READINGS = 120        # Lecturas para aprender la referencia
+EWMA_ALPHA = 0.05            # Suavizado del nivel actual
+CUSUM_K = 1.0                # Holgura por lectura (en desviaciones estándar)
+CUSUM_H = 10.0               # Umbral del acumulador
+DROP_Z = 5.0                 # Caída brusca (en desviaciones estándar)
+MIN_ACTIVE_POWER = 10.0      # Lecturas nocturnas o sin producción se ignoran (W)
+ALARM_COOLDOWN = timedelta(hours=6)
+CHECKPOINT_INTERVAL = 60     # Segundos entre guardados del estado
+
+_PENDING_KEY = 'streaming_detectors_pending'
+
+_STATE_FIELDS = ['count', 'mean', 'variance', 'level', 'cusum_low', 'last_value']
+_NAT = np.datetime64('NaT', 'us')
+
+# Arreglos de estado: valor inicial y tipo (last_timestamp es por módulo)
+_ARRAYS = {
+    'count': (0, np.int64),
+    'mean': (0.0, float),
+    'variance': (0.0, float),
+    'level': (0.0, float),
+    'cusum_low': (0.0, float),
+    'last_value': (np.nan, float),
+    'last_alarm': (_NAT, 'datetime64[us]'),
+    'last_timestamp': (_NAT, 'datetime64[us]')
+}
+
+
+class StreamingDetectors:
+    """Estado EWMA/CUSUM de todos los módulos en arreglos (módulo × métrica)"""
+
+    def __init__(self, capacity=1024):
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._module_ids = []
+        self._dirty = set()
+        self._unsaved = []
+        self._last_checkpoint = time.monotonic()
+        self.last_error = None
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        """Crear o ampliar los arreglos de estado conservando los valores actuales"""
+        for name, (fill, dtype) in _ARRAYS.items():
+            shape = capacity if name == 'last_timestamp' else (capacity, len(METRICS))
+            array = np.full(shape, fill, dtype=dtype)
+            current = getattr(self, name, None)
+            if current is not None:
+                array[:len(current)] = current
+            setattr(self, name, array)
+
+    def _slot_indices(self, module_ids):
+        """Posición de cada módulo en los arreglos, reservando las nuevas"""
+        slots = np.empty(len(module_ids), dtype=np.int64)
+        for i, module_id in enumerate(module_ids):
+            slot = self._slots.get(module_id)
+            if slot is None:
+                slot = len(self._module_ids)
+                if slot >= len(self.last_timestamp):
+                    self._allocate(len(self.last_timestamp) * 2)
+                self._slots[module_id] = slot
+                self._module_ids.append(module_id)
+            slots[i] = slot
+        return slots
+
+    def _step(self, slots, timestamps, values, active):
+        """
+        Aplicar una lectura por módulo (slots únicos) a todas las métricas.
+
+        Returns:
+            list: Alarmas (slot, índice de métrica, tipo, timestamp, estadístico)
+        """
+        # Lecturas fuera de orden o repetidas no modifican el estado
+        previous = self.last_timestamp[slots]
+        fresh = np.isnat(previous) | (timestamps > previous)
+        self.last_timestamp[slots[fresh]] = timestamps[fresh]
+        keep = fresh & active
+        slots, timestamps, x = slots[keep], timestamps[keep], values[keep]
+        if not len(slots):
+            return []
+
+        valid = np.isfinite(x)
+        count = self.count[slots] + valid
+        mean = self.mean[slots]
+        variance = self.variance[slots]
+        level = self.level[slots]
+        cusum = self.cusum_low[slots]
+
+        # Referencia: media y varianza exactas durante el aprendizaje
+        learning = valid & (count <= WARMUP_READINGS)
+        weight = np.where(learning, 1.0 / np.maximum(count, 1), 0.0)
+        delta = np.where(valid, x - mean, 0.0)
+        mean = mean + weight * delta
+        variance = (1 - weight) * (variance + weight * delta ** 2)
+        level = np.where(learning, mean, level)
+
+        # Vigilancia: z respecto a la referencia, CUSUM y nivel suavizado
+        watching = valid & (count > WARMUP_READINGS)
+        std = np.maximum(np.sqrt(variance), np.maximum(np.abs(mean) * 1e-3, 1e-9))
+        z = np.where(watching, (np.where(valid, x, mean) - mean) / std, 0.0)
+        cusum = np.where(watching, np.maximum(0.0, cusum - z - CUSUM_K), cusum)
+        level = np.where(watching, level + EWMA_ALPHA * (np.where(valid, x, level) - level), level)
+
+        drop = watching & (z < -DROP_Z)
+        drift = watching & ~drop & (cusum > CUSUM_H)
+        last_alarm = self.last_alarm[slots]
+        ready = np.isnat(last_alarm) | (timestamps[:, None] - last_alarm >= np.timedelta64(ALARM_COOLDOWN))
+        drop &= ready
+        drift &= ready
+
+        alarms = []
+        for kind, mask, statistic in (('drop', drop, z), ('drift', drift, cusum)):
+            for row, column in zip(*np.nonzero(mask)):
+                alarms.append((slots[row], column, kind, timestamps[row], float(statistic[row, column])))
+
+        # Tras una alarma se reinicia el acumulador; una deriva fija la nueva referencia
+        alarmed = drop | drift
+        cusum = np.where(alarmed, 0.0, cusum)
+        mean = np.where(drift, level, mean)
+        last_alarm = np.where(alarmed, timestamps[:, None], last_alarm)
+
+        self.count[slots] = count
+        self.mean[slots] = mean
+        self.variance[slots] = variance
+        self.level[slots] = level
+        self.cusum_low[slots] = cusum
+        self.last_value[slots] = np.where(valid, x, self.last_value[slots])
+        self.last_alarm[slots] = last_alarm
+        self._dirty.update(slots.tolist())
+        return alarms
+
+    def process(self, data_type, records):
+        """Listener de ingesta: aplazar las lecturas hasta que se confirmen"""
+        if data_type == 'solar' and records:
+            db.session.info.setdefault(_PENDING_KEY, []).extend(records)
+
+    def apply_committed(self, records):
+        """Actualizar el estado con lecturas confirmadas y guardar sus alarmas"""
+        self._persist(self.apply(records))
+
+    def apply(self, records):
+        """
+        Actualizar el estado con un lote de lecturas.
+
+        Returns:
+            list: Anomalías detectadas, listas para insertar
+        """
+        if not records:
+            return []
+
+        module_ids = [record['module_id'] for record in records]
+        timestamps = np.array([record['timestamp'] for record in records], dtype='datetime64[us]')
+        values = np.array(
+            [[record.get(metric) for metric in METRICS] for record in records], dtype=float
+        )
+        power = np.array([record.get('max_power') for record in records], dtype=float)
+        active = np.nan_to_num(power, nan=0.0) > MIN_ACTIVE_POWER
+
+        with self._lock:
+            slots = self._slot_indices(module_ids)
+
+            # Posición de cada lectura dentro de su módulo, en orden temporal
+            order = np.lexsort((timestamps, slots))
+            sorted_slots = slots[order]
+            starts = np.flatnonzero(np.r_[True, sorted_slots[1:] != sorted_slots[:-1]])
+            rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+
+            by_rank = order[np.argsort(rank, kind='stable')]
+            bounds = np.cumsum(np.bincount(rank))[:-1]
+            alarms = []
+            for positions in np.split(by_rank, bounds):
+                alarms += self._step(
+                    slots[positions], timestamps[positions], values[positions], active[positions]
+                )
+
+            module_names = [self._module_ids[slot] for slot, _, _, _, _ in alarms]
+
+        return self._alarm_records(alarms, module_names)
+
+    def _persist(self, alarms, force=False):
+        """
+        Insertar las anomalías y, cada CHECKPOINT_INTERVAL, el estado en una
+        transacción propia (la de la ingesta ya está confirmada).
+
+        Si falla, las anomalías y los módulos pendientes se reintentan en la
+        siguiente llamada.
+        """
+        with self._lock:
+            alarms, self._unsaved = self._unsaved + alarms, []
+        due = force or time.monotonic() - self._last_checkpoint >= CHECKPOINT_INTERVAL
+        if not alarms and not due:
+            return
+
+        session = Session(db.engine)
+        slots = []
+        try:
+            if alarms:
+                session.execute(insert(AnomalyDetection.__table__), alarms)
+                record_anomalies(alarms, session)
+            if due:
+                slots = self.checkpoint(session)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            with self._lock:
+                self._unsaved = alarms + self._unsaved
+                self._dirty.update(slots)
+                self.last_error = str(e)
+        finally:
+            session.close()
+
+    def _alarm_records(self, alarms, module_names):
+        """Filas de anomalías de las alarmas detectadas"""
+        records = []
+        for (slot, column, kind, timestamp, statistic), module_id in zip(alarms, module_names):
+            metric = METRICS[column]
+            code, description, severity = ALARMS[(metric, kind)]
+            rec = RECOMMENDATIONS.get(code, DEFAULT_RECOMMENDATION)
+            detail = (f'CUSUM de {metric} = {statistic:.1f}' if kind == 'drift'
+                      else f'desviación de {statistic:.1f}σ en {metric}')
+            records.append({
+                'timestamp': pd.Timestamp(timestamp).to_pydatetime(),
+                'module_id': module_id,
+                'anomaly_type': description,
+                'severity_level': severity,
+                'confidence': 'Alta' if abs(statistic) >= 2 * (CUSUM_H if kind == 'drift' else DROP_Z) else 'Media',
+                'description': f'Anomalía detectada en módulo {module_id}: {description} ({detail})',
+                'recommended_action': rec['action'],
+                'priority': rec['priority'],
+                'timeframe': rec['timeframe'],
+                'status': 'active'
+            })
+        return records
+
+    def state(self, module_id):
+        """Estado actual de un módulo o None si no tiene lecturas"""
+        with self._lock:
+            slot = self._slots.get(module_id)
+            if slot is None:
+                return None
+            return {
+                metric: {
+                    'count': int(self.count[slot, j]),
+                    'mean': float(self.mean[slot, j]),
+                    'std': float(np.sqrt(self.variance[slot, j])),
+                    'level': float(self.level[slot, j]),
+                    'cusum_low': float(self.cusum_low[slot, j]),
+                    'last_value': None if np.isnan(self.last_value[slot, j]) else float(self.last_value[slot, j]),
+                    'warming_up': bool(self.count[slot, j] <= WARMUP_READINGS),
+                    'last_alarm_at': None if np.isnat(self.last_alarm[slot, j])
+                    else pd.Timestamp(self.last_alarm[slot, j]).isoformat()
+                }
+                for j, metric in enumerate(METRICS)
+            }
+
+    def checkpoint(self, session=None):
+        """
+        Guardar el estado de los módulos modificados (sin confirmar).
+
+        Returns:
+            list: Posiciones guardadas (para volver a marcarlas si la transacción falla)
+        """
+        with self._lock:
+            slots = sorted(self._dirty)
+            self._dirty = set()
+            self._last_checkpoint = time.monotonic()
+            arrays = {field: getattr(self, field)[slots] for field in _STATE_FIELDS}
+            last_alarm = self.last_alarm[slots]
+            last_timestamp = self.last_timestamp[slots]
+            module_ids = [self._module_ids[slot] for slot in slots]
+
+        def to_datetime(value):
+            return None if np.isnat(value) else pd.Timestamp(value).to_pydatetime()
+
+        now = datetime.utcnow()
+        rows = []
+        for i, module_id in enumerate(module_ids):
+            for j, metric in enumerate(METRICS):
+                row = {'module_id': module_id, 'metric': metric, 'updated_at': now}
+                for field in _STATE_FIELDS:
+                    value = arrays[field][i, j].item()
+                    row[field] = None if isinstance(value, float) and np.isnan(value) else value
+                row['last_timestamp'] = to_datetime(last_timestamp[i])
+                row['last_alarm_at'] = to_datetime(last_alarm[i, j])
+                rows.append(row)
+
+        accumulate_rows(
+            DetectorState, rows, ['module_id', 'metric'],
+            replace_fields=_STATE_FIELDS + ['last_timestamp', 'last_alarm_at', 'updated_at'],
+            session=session
+        )
+        return slots
+
+    def load(self):
+        """Recargar el estado guardado en la base de datos"""
+        rows = db.session.execute(select(DetectorState)).scalars().all()
+        with self._lock:
+            for row in rows:
+                if row.metric not in METRICS:
+                    continue
+                slot = self._slot_indices([row.module_id])[0]
+                j = METRICS.index(row.metric)
+                self.count[slot, j] = row.count or 0
+                self.mean[slot, j] = row.mean or 0.0
+                self.variance[slot, j] = row.variance or 0.0
+                self.level[slot, j] = row.level if row.level is not None else self.mean[slot, j]
+                self.cusum_low[slot, j] = row.cusum_low or 0.0
+                self.last_value[slot, j] = np.nan if row.last_value is None else row.last_value
+                if row.last_alarm_at is not None:
+                    self.last_alarm[slot, j] = np.datetime64(row.last_alarm_at, 'us')
+                if row.last_timestamp is not None:
+                    current = self.last_timestamp[slot]
+                    stored = np.datetime64(row.last_timestamp, 'us')
+                    self.last_timestamp[slot] = stored if np.isnat(current) else max(current, stored)
+            self._dirty = set()
+        return len(self._slots)
+
+
+streaming_detectors = StreamingDetectors()
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_committed(session):
+    records = session.info.pop(_PENDING_KEY, None)
+    if records:
+        streaming_detectors.apply_committed(records)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def init_streaming_detectors(app):
+    """Cargar el estado guardado, registrar el listener y guardar al salir"""
+    with app.app_context():
+        streaming_detectors.load()
+    register_ingest_listener(streaming_detectors.process)
+
+    def save_on_exit():
+        with app.app_context():
+            streaming_detectors._persist([], force=True)
+
+    atexit.register(save_on_exit)
@@ -0,0 +1,97 @@
+"""
+Inserciones con resolución de conflictos (upsert) por dialecto - HelioSentinel
+"""
+
+from sqlalchemy import func, insert, select, and_
+
+from src.models.solar_data import db
+
+
+def dialect_name():
+    """Nombre del dialecto de la base de datos de la sesión actual"""
+    return db.session.get_bind().dialect.name
+
+
+def dialect_insert(table):
+    """
+    Sentencia INSERT con soporte de ON CONFLICT para el dialecto actual.
+
+    Returns:
+        Insert o None si el dialecto no soporta ON CONFLICT
+    """
+    name = dialect_name()
+    if name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(table)
+    if name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert(table)
+    return None
+
+
+def least(a, b):
+    """Mínimo escalar entre dos expresiones"""
+    return func.least(a, b) if dialect_name() == 'postgresql' else func.min(a, b)
+
+
+def greatest(a, b):
+    """Máximo escalar entre dos expresiones"""
+    return func.greatest(a, b) if dialect_name() == 'postgresql' else func.max(a, b)
+
+
+def accumulate_rows(model, rows, key_fields, sum_fields=(), min_fields=(), max_fields=(),
+                    replace_fields=(), session=None):
+    """
+    Insertar filas agregadas o acumularlas sobre las existentes con la misma clave.
+
+    Args:
+        model: Modelo SQLAlchemy destino
+        rows (list): Diccionarios con claves y valores agregados
+        key_fields (list): Columnas de la restricción única
+        sum_fields (list): Columnas que se suman
+        min_fields (list): Columnas que conservan el mínimo
+        max_fields (list): Columnas que conservan el máximo
+        replace_fields (list): Columnas que toman el valor nuevo
+        session: Sesión donde ejecutar (por defecto db.session)
+    """
+    if not rows:
+        return
+    session = session or db.session
+
+    table = model.__table__
+    stmt = dialect_insert(table)
+
+    if stmt is not None:
+        excluded = stmt.excluded
+        set_ = {}
+        for field in sum_fields:
+            set_[field] = table.c[field] + excluded[field]
+        for field in min_fields:
+            set_[field] = least(table.c[field], excluded[field])
+        for field in max_fields:
+            set_[field] = greatest(table.c[field], excluded[field])
+        for field in replace_fields:
+            set_[field] = excluded[field]
+        session.execute(
+            stmt.on_conflict_do_update(index_elements=list(key_fields), set_=set_),
+            rows
+        )
+        return
+
+    # Alternativa genérica para dialectos sin ON CONFLICT
+    for row in rows:
+        condition = and_(*[table.c[field] == row[field] for field in key_fields])
+        current = session.execute(select(table).where(condition)).mappings().first()
+        if current is None:
+            session.execute(insert(table), [row])
+            continue
+        values = {}
+        for field in sum_fields:
+            values[field] = current[field] + row[field]
+        for field in min_fields:
+            values[field] = min(v for v in (current[field], row[field]) if v is not None)
+        for field in max_fields:
+            values[field] = max(v for v in (current[field], row[field]) if v is not None)
+        for field in replace_fields:
+            values[field] = row[field]
+        session.execute(table.update().where(condition).values(**values))
@@ -0,0 +1,528 @@
+"""
+Escritura diferida de lecturas individuales - HelioSentinel
+
+Con WRITE_BEHIND_ENABLED las lecturas de /api/data/solar y
+/api/data/environmental se validan, se confirman al dispositivo (202) y se
+encolan en memoria. Un hilo escritor las inserta en bloque con upsert_records
+y una sola confirmación cada WRITE_BEHIND_FLUSH_MS o WRITE_BEHIND_FLUSH_ROWS
+lecturas, de modo que los agregados, el hot store y los detectores reciben
+los mismos registros que con la ingesta por lotes.
+
+Opcionalmente cada lectura aceptada se anexa a un registro local por
+segmentos (WRITE_BEHIND_LOG_DIR). Tras cada confirmación se guarda la última
+secuencia escrita y se borran los segmentos ya confirmados; al arrancar se
+reinsertan las lecturas pendientes de los registros de procesos terminados.
+
+Los errores de conexión o bloqueo se reintentan sin límite. Cualquier otro
+error se reintenta WRITE_BEHIND_MAX_RETRIES veces; después el lote se divide
+por mitades hasta aislar las lecturas que la base de datos rechaza, que se
+apartan (contador dead_lettered y, con registro local, dead-letter.log) sin
+bloquear al resto.
+"""
+
+from collections import deque
+from datetime import datetime
+import atexit
+import glob
+import json
+import os
+import queue
+import threading
+import time
+
+from sqlalchemy.exc import DisconnectionError, OperationalError, TimeoutError as PoolTimeoutError
+
+from src.models.solar_data import db
+from src.services.ingestion import upsert_records
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+DEFAULT_MAX_QUEUE = 10000
+DEFAULT_FLUSH_MS = 200
+DEFAULT_FLUSH_ROWS = 1000
+DEFAULT_BLOCK_TIMEOUT_MS = 1000
+
+# Con la cola llena: esperar hasta el límite, rechazar de inmediato o escribir en línea
+BACKPRESSURE_POLICIES = ('block', 'reject', 'sync')
+
+# Tamaño a partir del cual se abre un nuevo segmento del registro
+LOG_SEGMENT_BYTES = 16 * 1024 * 1024
+
+# Reintentos de una escritura fallida (espera exponencial hasta el máximo)
+RETRY_INITIAL_SECONDS = 0.1
+RETRY_MAX_SECONDS = 5.0
+DEFAULT_MAX_RETRIES = 5
+
+# Archivo (en WRITE_BEHIND_LOG_DIR) con las lecturas rechazadas por la base de datos
+DEAD_LETTER_FILE = 'dead-letter.log'
+
+# Errores de conexión, bloqueo o pool: se reintentan sin aislar lecturas
+TRANSIENT_ERRORS = (OperationalError, DisconnectionError, PoolTimeoutError)
+
+# Muestras recientes usadas para las latencias
+LATENCY_SAMPLES = 1000
+
+_DATETIME_FIELDS = ('timestamp', 'created_at')
+
+
+class BufferFull(Exception):
+    """La cola de escritura diferida está llena"""
+
+
+def _encode(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _decode_record(record):
+    for field in _DATETIME_FIELDS:
+        if record.get(field) is not None:
+            record[field] = datetime.fromisoformat(record[field])
+    return record
+
+
+def _percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 3)
+
+
+class AppendLog:
+    """
+    Registro de solo anexado por segmentos de un proceso.
+
+    Cada línea es {"seq", "type", "on_duplicate", "record"}; el archivo de control guarda la
+    última secuencia confirmada en la base de datos.
+    """
+
+    def __init__(self, directory, segment_bytes=LOG_SEGMENT_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.prefix = os.path.join(directory, f'wal-{os.getpid()}')
+        # El bloqueo indica a otros procesos que este registro sigue activo
+        self._lock_file = open(self.prefix + '.lock', 'w')
+        if fcntl is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self.sequence = 0
+        self.committed = 0
+        self.segment = 0
+        self._closed_segments = []   # (ruta, última secuencia)
+        self._file = None
+        self._open_segment()
+
+    def _segment_path(self, number):
+        return f'{self.prefix}.{number:06d}.log'
+
+    def _open_segment(self):
+        self.segment += 1
+        self._file = open(self._segment_path(self.segment), 'a', encoding='utf-8')
+
+    def append(self, data_type, record, on_duplicate='skip'):
+        """Anexar un registro; devuelve su número de secuencia"""
+        self.sequence += 1
+        line = json.dumps({
+            'seq': self.sequence,
+            'type': data_type,
+            'on_duplicate': on_duplicate,
+            'record': {key: _encode(value) for key, value in record.items()}
+        })
+        self._file.write(line + '\n')
+        self._file.flush()
+        if self._file.tell() >= self.segment_bytes:
+            self._file.close()
+            self._closed_segments.append((self._segment_path(self.segment), self.sequence))
+            self._open_segment()
+        return self.sequence
+
+    def sync(self):
+        """Forzar a disco el segmento actual"""
+        os.fsync(self._file.fileno())
+
+    def commit(self, sequence):
+        """Registrar la última secuencia confirmada y borrar los segmentos cubiertos"""
+        self.committed = max(self.committed, sequence)
+        checkpoint = self.prefix + '.checkpoint'
+        with open(checkpoint + '.tmp', 'w') as handle:
+            handle.write(str(self.committed))
+        os.replace(checkpoint + '.tmp', checkpoint)
+        while self._closed_segments and self._closed_segments[0][1] <= self.committed:
+            path, _ = self._closed_segments.pop(0)
+            os.remove(path)
+
+    def close(self):
+        self._file.close()
+        if self.committed >= self.sequence:
+            # Todo confirmado: no queda nada que recuperar
+            for path in glob.glob(glob.escape(self.prefix) + '.*'):
+                if not path.endswith('.lock'):
+                    os.remove(path)
+        self._lock_file.close()
+
+    @staticmethod
+    def recover(directory):
+        """
+        Lecturas no confirmadas de registros de procesos terminados.
+
+        Devuelve una lista de (prefijo, [(tipo, registro, on_duplicate), ...]); los archivos
+        se borran con discard() una vez reinsertadas las lecturas.
+        """
+        pending = []
+        for lock_path in sorted(glob.glob(os.path.join(glob.escape(directory), 'wal-*.lock'))):
+            prefix = lock_path[:-len('.lock')]
+            with open(lock_path, 'a') as lock_file:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        continue   # Proceso activo
+                elif prefix.endswith(f'wal-{os.getpid()}'):
+                    continue
+                try:
+                    with open(prefix + '.checkpoint') as handle:
+                        committed = int(handle.read().strip() or 0)
+                except (OSError, ValueError):
+                    committed = 0
+                readings = []
+                for segment in sorted(glob.glob(glob.escape(prefix) + '.*.log')):
+                    with open(segment, encoding='utf-8') as handle:
+                        for line in handle:
+                            try:
+                                entry = json.loads(line)
+                            except ValueError:
+                                break   # Línea truncada por una caída
+                            if entry['seq'] > committed:
+                                readings.append((
+                                    entry['type'], _decode_record(entry['record']),
+                                    entry.get('on_duplicate', 'skip')
+                                ))
+                pending.append((prefix, readings))
+        return pending
+
+    @staticmethod
+    def dead_letter(directory, data_type, record, on_duplicate, error):
+        """Anexar una lectura rechazada al registro de descartes del directorio"""
+        line = json.dumps({
+            'type': data_type,
+            'on_duplicate': on_duplicate,
+            'record': {key: _encode(value) for key, value in record.items()},
+            'error': error,
+            'failed_at': datetime.utcnow().isoformat()
+        })
+        with open(os.path.join(directory, DEAD_LETTER_FILE), 'a', encoding='utf-8') as handle:
+            handle.write(line + '\n')
+
+    @staticmethod
+    def discard(prefix):
+        """Borrar los archivos de un registro ya recuperado"""
+        for path in glob.glob(glob.escape(prefix) + '.*'):
+            os.remove(path)
+
+
+class WriteBehindBuffer:
+    """Cola acotada de lecturas escrita en bloque por un hilo en segundo plano"""
+
+    def __init__(self):
+        self.enabled = False
+        self.app = None
+        self.max_queue = DEFAULT_MAX_QUEUE
+        self.flush_ms = DEFAULT_FLUSH_MS
+        self.flush_rows = DEFAULT_FLUSH_ROWS
+        self.backpressure = 'block'
+        self.block_timeout_ms = DEFAULT_BLOCK_TIMEOUT_MS
+        self.fsync = False
+        self.max_retries = DEFAULT_MAX_RETRIES
+        self.log = None
+        self._queue = queue.Queue(self.max_queue)
+        self._append_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._worker = None
+        self._stopping = threading.Event()
+        self._flush_samples = deque(maxlen=LATENCY_SAMPLES)
+        self._commit_samples = deque(maxlen=LATENCY_SAMPLES)
+        self._stats = {
+            'accepted': 0, 'written': 0, 'inserted': 0, 'updated': 0, 'skipped': 0,
+            'flushes': 0, 'rejected': 0,
+            'sync_fallbacks': 0, 'errors': 0, 'recovered': 0, 'dead_lettered': 0,
+            'last_error': None, 'last_flush_at': None
+        }
+
+    def configure(self, app):
+        """Leer la configuración, recuperar registros pendientes y preparar la cola"""
+        self.app = app
+        self.enabled = app.config.get('WRITE_BEHIND_ENABLED', False)
+        self.max_queue = max(1, app.config.get('WRITE_BEHIND_MAX_QUEUE', DEFAULT_MAX_QUEUE))
+        self.flush_ms = max(0, app.config.get('WRITE_BEHIND_FLUSH_MS', DEFAULT_FLUSH_MS))
+        self.flush_rows = max(1, app.config.get('WRITE_BEHIND_FLUSH_ROWS', DEFAULT_FLUSH_ROWS))
+        self.block_timeout_ms = app.config.get('WRITE_BEHIND_BLOCK_TIMEOUT_MS', DEFAULT_BLOCK_TIMEOUT_MS)
+        self.fsync = app.config.get('WRITE_BEHIND_FSYNC', False)
+        self.max_retries = max(0, app.config.get('WRITE_BEHIND_MAX_RETRIES', DEFAULT_MAX_RETRIES))
+        self.backpressure = app.config.get('WRITE_BEHIND_BACKPRESSURE', 'block')
+        if self.backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError(
+                f'WRITE_BEHIND_BACKPRESSURE inválido: {self.backpressure} '
+                f'(opciones: {", ".join(BACKPRESSURE_POLICIES)})'
+            )
+        self._queue = queue.Queue(self.max_queue)
+        if not self.enabled:
+            return
+
+        log_dir = app.config.get('WRITE_BEHIND_LOG_DIR')
+        if log_dir:
+            self._recover(log_dir)
+            self.log = AppendLog(log_dir)
+        atexit.register(self.close)
+
+    def _recover(self, log_dir):
+        """Reinsertar las lecturas que quedaron sin confirmar en registros anteriores"""
+        with self.app.app_context():
+            for prefix, readings in AppendLog.recover(log_dir):
+                if readings:
+                    _, rejected = self._isolate(readings)
+                    self._dead_letter(rejected, log_dir)
+                    print(f"Escritura diferida: {len(readings)} lecturas recuperadas de {prefix}")
+                AppendLog.discard(prefix)
+                with self._stats_lock:
+                    self._stats['recovered'] += len(readings)
+
+    def submit(self, data_type, record, on_duplicate='skip'):
+        """
+        Encolar un registro validado.
+
+        Args:
+            on_duplicate (str): 'skip' o 'update' si la clave natural ya existe
+
+        Returns:
+            bool: True si quedó en cola; False si la cola está llena y la
+                  política es 'sync' (el llamador debe escribirlo en línea)
+
+        Raises:
+            BufferFull: Si la cola está llena con las políticas 'block' o 'reject'
+        """
+        self._ensure_worker()
+        block = self.backpressure == 'block'
+        timeout = self.block_timeout_ms / 1000 if block else None
+        entry = [None, data_type, record, time.perf_counter(), on_duplicate]
+        with self._append_lock:
+            try:
+                # Encolar antes de anexar: si la cola está llena no queda rastro en el registro
+                self._queue.put(entry, block=block, timeout=timeout)
+            except queue.Full:
+                with self._stats_lock:
+                    if self.backpressure == 'sync':
+                        self._stats['sync_fallbacks'] += 1
+                        return False
+                    self._stats['rejected'] += 1
+                raise BufferFull('Cola de escritura llena, intente más tarde')
+            if self.log is not None:
+                # El escritor lee la secuencia con este lock tomado, después de confirmar
+                entry[0] = self.log.append(data_type, record, on_duplicate)
+                if self.fsync:
+                    self.log.sync()
+        with self._stats_lock:
+            self._stats['accepted'] += 1
+        return True
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._stats_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._stopping.clear()
+                self._worker = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._worker.start()
+
+    def _collect(self):
+        """Tomar hasta flush_rows entradas o las que lleguen en flush_ms"""
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = batch[0][3] + self.flush_ms / 1000
+        while len(batch) < self.flush_rows:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                batch = self._collect()
+                if batch:
+                    self._flush(batch)
+                elif self._stopping.is_set():
+                    return
+
+    def _write_records(self, readings):
+        """
+        Escribir (tipo, registro, on_duplicate) agrupados en una sola transacción.
+
+        Returns:
+            dict: Lecturas insertadas, actualizadas y omitidas
+        """
+        groups = {}
+        for data_type, record, on_duplicate in readings:
+            # upsert_records añade el id al diccionario
+            groups.setdefault((data_type, on_duplicate), []).append(dict(record))
+        totals = {'inserted': 0, 'updated': 0, 'skipped': 0}
+        try:
+            for (data_type, on_duplicate), records in groups.items():
+                for name, count in upsert_records(data_type, records, on_duplicate).items():
+                    totals[name] += count
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return totals
+
+    def _isolate(self, readings):
+        """
+        Escribir las lecturas dividiendo por mitades los grupos que fallan.
+
+        Returns:
+            tuple: (totales escritos, [(lectura, error)] rechazadas una a una)
+
+        Raises:
+            Exception: Los errores transitorios, para reintentar el lote
+        """
+        totals = {'inserted': 0, 'updated': 0, 'skipped': 0}
+        rejected = []
+        pending = [readings]
+        while pending:
+            group = pending.pop()
+            try:
+                counts = self._write_records(group)
+            except TRANSIENT_ERRORS:
+                raise
+            except Exception as e:
+                if len(group) == 1:
+                    rejected.append((group[0], str(e)))
+                else:
+                    middle = len(group) // 2
+                    pending += [group[middle:], group[:middle]]
+                continue
+            for name, count in counts.items():
+                totals[name] += count
+        return totals, rejected
+
+    def _dead_letter(self, rejected, log_dir=None):
+        """Apartar las lecturas rechazadas para que no bloqueen al resto"""
+        if not rejected:
+            return
+        if log_dir is None and self.log is not None:
+            log_dir = self.log.directory
+        for (data_type, record, on_duplicate), error in rejected:
+            if log_dir:
+                AppendLog.dead_letter(log_dir, data_type, record, on_duplicate, error)
+            print(f"Escritura diferida: lectura {data_type} descartada: {error.splitlines()[0]}")
+        with self._stats_lock:
+            self._stats['dead_lettered'] += len(rejected)
+
+    def _flush(self, batch):
+        """
+        Escribir un lote reintentando con espera exponencial.
+
+        Los errores transitorios se reintentan sin límite; tras max_retries
+        fallos de otro tipo se aíslan y descartan las lecturas rechazadas.
+        """
+        readings = [
+            (data_type, record, on_duplicate)
+            for _, data_type, record, _, on_duplicate in batch
+        ]
+        delay = RETRY_INITIAL_SECONDS
+        failures = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                if failures > self.max_retries:
+                    counts, rejected = self._isolate(readings)
+                else:
+                    counts, rejected = self._write_records(readings), []
+                break
+            except Exception as e:
+                with self._stats_lock:
+                    self._stats['errors'] += 1
+                    self._stats['last_error'] = str(e)
+                if self._stopping.is_set():
+                    # Al cerrar no se reintenta: el registro local conserva las lecturas
+                    print(f"Escritura diferida: {len(batch)} lecturas sin escribir: {e}")
+                    return
+                if not isinstance(e, TRANSIENT_ERRORS):
+                    failures += 1
+                    if failures > self.max_retries:
+                        continue
+                time.sleep(delay)
+                delay = min(delay * 2, RETRY_MAX_SECONDS)
+        finished = time.perf_counter()
+        self._dead_letter(rejected)
+
+        if self.log is not None:
+            with self._append_lock:
+                sequences = [entry[0] for entry in batch if entry[0] is not None]
+                if sequences:
+                    self.log.commit(max(sequences))
+        with self._stats_lock:
+            self._stats['written'] += len(batch) - len(rejected)
+            for name, count in counts.items():
+                self._stats[name] += count
+            self._stats['flushes'] += 1
+            self._stats['last_flush_at'] = datetime.utcnow().isoformat()
+            self._flush_samples.append((finished - started) * 1000)
+            self._commit_samples.extend((finished - entry[3]) * 1000 for entry in batch)
+
+    def close(self, timeout=10):
+        """Detener el escritor vaciando la cola"""
+        if self._worker is not None and self._worker.is_alive():
+            self._stopping.set()
+            self._worker.join(timeout)
+        if self.log is not None and self._queue.empty():
+            with self._append_lock:
+                self.log.close()
+            self.log = None
+
+    def stats(self):
+        """Profundidad de la cola, contadores y latencias de escritura"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+            flush_samples = list(self._flush_samples)
+            commit_samples = list(self._commit_samples)
+        flushes = stats['flushes']
+        return {
+            'enabled': self.enabled,
+            'queue_depth': self._queue.qsize(),
+            'max_queue': self.max_queue,
+            'backpressure': self.backpressure,
+            'flush_ms': self.flush_ms,
+            'flush_rows': self.flush_rows,
+            'durable_log': self.log is not None,
+            **stats,
+            'mean_rows_per_flush': round(stats['written'] / flushes, 2) if flushes else None,
+            'flush_latency_ms': {
+                'p50': _percentile(flush_samples, 0.5),
+                'p99': _percentile(flush_samples, 0.99),
+                'max': round(max(flush_samples), 3) if flush_samples else None
+            },
+            # Desde que la lectura se encola hasta que queda confirmada
+            'commit_latency_ms': {
+                'p50': _percentile(commit_samples, 0.5),
+                'p99': _percentile(commit_samples, 0.99),
+                'max': round(max(commit_samples), 3) if commit_samples else None
+            }
+        }
+
+
+write_behind = WriteBehindBuffer()
+
+
+def init_write_behind(app):
+    """Configurar el búfer de escritura diferida"""
+    write_behind.configure(app)
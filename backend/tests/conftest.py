@@ -0,0 +1,151 @@
+"""
+Configuración común de las pruebas del backend - HelioSentinel
+
+La aplicación se crea una sola vez sobre una base SQLite temporal, sin
+precarga de modelos ni hilos de sincronización opcionales; cada prueba
+trabaja dentro de un contexto de aplicación y las tablas se vacían al final.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+_DATABASE_DIR = tempfile.mkdtemp(prefix='heliosentinel-tests-')
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(_DATABASE_DIR, 'test.db')}",
+    'MODEL_PRELOAD': 'false',
+    'MODEL_RELOAD_CHECK_SECONDS': '0',
+    'HOT_STORE_SYNC_SECONDS': '0',
+    'DASHBOARD_SNAPSHOT_SECONDS': '0',
+    'UPLOAD_FOLDER': os.path.join(_DATABASE_DIR, 'uploads')
+})
+
+# Lecturas válidas de referencia (se completan con module_id/location_id y timestamp)
+SOLAR_READING = {
+    'open_circuit_voltage': 45.0, 'max_power_voltage': 37.0, 'max_power_current': 8.0,
+    'short_circuit_current': 9.0, 'max_power': 300.0, 'efficiency': 0.18,
+    'cell_temperature': 45.0
+}
+ENVIRONMENTAL_READING = {
+    'ambient_temperature': 30.0, 'irradiance': 800.0, 'humidity': 70.0,
+    'wind_speed': 2.0, 'precipitation': 0.0, 'cloudiness': 0.0
+}
+
+# Inicio de las series de lecturas de prueba
+START = datetime(2026, 7, 1)
+
+
+@pytest.fixture(scope='session')
+def app():
+    from src.main import app as flask_app
+
+    flask_app.config['TESTING'] = True
+    yield flask_app
+    shutil.rmtree(_DATABASE_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def app_context(app):
+    """Contexto de aplicación; al terminar se vacían las tablas"""
+    from src.models.solar_data import db
+
+    with app.app_context():
+        yield app
+        db.session.rollback()
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+        db.session.remove()
+
+
+@pytest.fixture(scope='session')
+def backend_dir():
+    return BACKEND_DIR
+
+
+@pytest.fixture
+def start():
+    return START
+
+
+@pytest.fixture
+def solar_reading():
+    """Fábrica de lecturas solares válidas para module_id y timestamp"""
+    def make(module_id, timestamp, **values):
+        return {**SOLAR_READING, 'module_id': module_id, 'timestamp': timestamp, **values}
+
+    return make
+
+
+@pytest.fixture
+def environmental_reading():
+    """Fábrica de lecturas ambientales válidas para location_id y timestamp"""
+    def make(location_id, timestamp, **values):
+        return {**ENVIRONMENTAL_READING, 'location_id': location_id, 'timestamp': timestamp, **values}
+
+    return make
+
+
+@pytest.fixture
+def solar_records(solar_reading):
+    """
+    Fábrica de registros solares para upsert_records, uno por desplazamiento
+    desde `start` (START por defecto) en pasos de `step`. Un valor puede ser
+    una función del desplazamiento.
+    """
+    from src.services.ingestion import reading_to_record
+
+    def make(module_id, offsets, step=timedelta(minutes=1), start=START, **values):
+        return [
+            reading_to_record('solar', solar_reading(
+                module_id, (start + offset * step).isoformat(),
+                **{name: value(offset) if callable(value) else value for name, value in values.items()}
+            ))
+            for offset in offsets
+        ]
+
+    return make
+
+
+@pytest.fixture
+def stored_readings(app_context):
+    """Columnas (timestamp por defecto) de las lecturas solares guardadas de un módulo, por timestamp"""
+    from src.models.solar_data import db, SolarModuleData
+
+    def fetch(module_id, *columns):
+        selected = [getattr(SolarModuleData, column) for column in columns or ('timestamp',)]
+        rows = db.session.execute(
+            db.select(*selected).where(SolarModuleData.module_id == module_id)
+            .order_by(SolarModuleData.timestamp)
+        ).all()
+        return [row[0] if len(selected) == 1 else tuple(row) for row in rows]
+
+    return fetch
+
+
+@pytest.fixture
+def solar_rollup(app_context):
+    """(count, power_sum) del agregado solar de un módulo en una resolución y bucket"""
+    from src.models.solar_data import db, SolarRollup
+
+    def fetch(module_id, resolution, bucket_start):
+        return tuple(db.session.execute(
+            db.select(SolarRollup.count, SolarRollup.power_sum).where(
+                SolarRollup.resolution == resolution, SolarRollup.module_id == module_id,
+                SolarRollup.bucket_start == bucket_start
+            )
+        ).one())
+
+    return fetch
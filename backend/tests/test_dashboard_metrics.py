@@ -0,0 +1,73 @@
+"""
+Pruebas de las métricas incrementales del dashboard: solo cuentan cambios confirmados
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.models.solar_data import db, AnomalyDetection
+from src.services.dashboard_metrics import dashboard_metrics, CRITICAL_SEVERITY
+from src.services.ingestion import upsert_records
+
+
+@pytest.fixture
+def baseline(app_context):
+    """Contadores reconciliados con la base de datos al inicio de la prueba"""
+    dashboard_metrics.reconcile()
+    return dict(dashboard_metrics.snapshot()['values'])
+
+
+@pytest.fixture
+def recent():
+    """Inicio de lecturas dentro de la ventana reciente del dashboard"""
+    return datetime.utcnow().replace(second=0, microsecond=0) - timedelta(minutes=10)
+
+
+def critical_anomaly(module_id):
+    return AnomalyDetection(
+        module_id=module_id, anomaly_type='Punto caliente', severity_level=CRITICAL_SEVERITY,
+        confidence='Alta', description=f'Anomalía de prueba en {module_id}', status='active'
+    )
+
+
+def test_rolled_back_readings_are_not_counted(baseline, solar_records, recent):
+    upsert_records('solar', solar_records('DM-1', range(3), start=recent, max_power=250.0))
+    assert dashboard_metrics.snapshot()['values'] == baseline
+
+    db.session.rollback()
+
+    assert dashboard_metrics.snapshot()['values'] == baseline
+
+
+def test_committed_readings_are_counted(baseline, solar_records, recent):
+    upsert_records('solar', solar_records('DM-2', range(3), start=recent, max_power=250.0))
+    db.session.commit()
+
+    values = dashboard_metrics.snapshot()['values']
+    assert values['total_modules'] == baseline['total_modules'] + 1
+    assert values['total_power_generated'] == pytest.approx(baseline['total_power_generated'] + 750.0)
+
+
+def test_anomalies_are_counted_on_commit_only(baseline):
+    db.session.add(critical_anomaly('DM-3'))
+    db.session.flush()
+    db.session.rollback()
+    assert dashboard_metrics.snapshot()['values'] == baseline
+
+    db.session.add(critical_anomaly('DM-3'))
+    db.session.commit()
+
+    values = dashboard_metrics.snapshot()['values']
+    assert values['total_anomalies'] == baseline['total_anomalies'] + 1
+    assert values['critical_anomalies'] == baseline['critical_anomalies'] + 1
+
+
+def test_etag_changes_only_after_commit(baseline, solar_records, recent):
+    etag = dashboard_metrics.snapshot()['etag']
+
+    upsert_records('solar', solar_records('DM-4', range(2), start=recent, max_power=250.0))
+    assert dashboard_metrics.snapshot()['etag'] == etag
+    db.session.commit()
+
+    assert dashboard_metrics.snapshot()['etag'] != etag
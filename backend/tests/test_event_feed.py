@@ -0,0 +1,89 @@
+"""
+Pruebas del canal de eventos: solo se publican cambios confirmados
+"""
+
+import json
+
+import pytest
+
+from src.models.solar_data import db, AnomalyDetection
+from src.services.event_feed import broker
+from src.services.ingestion import upsert_records
+
+
+@pytest.fixture
+def subscribe(app_context):
+    """Crear suscripciones que se cierran al terminar la prueba"""
+    subscriptions = []
+
+    def create(topics, module_id):
+        subscription = broker.subscribe(topics=topics, module_ids=[module_id])
+        subscriptions.append(subscription)
+        return subscription
+
+    yield create
+    for subscription in subscriptions:
+        subscription.close()
+
+
+def parse(message):
+    """Campos (event, data) de un mensaje SSE"""
+    fields = dict(line.split(': ', 1) for line in message.strip().split('\n'))
+    return fields['event'], json.loads(fields['data'])
+
+
+def test_rolled_back_readings_are_not_published(subscribe, solar_records):
+    subscription = subscribe(('readings',), 'EV-1')
+
+    upsert_records('solar', solar_records('EV-1', range(3)))
+    db.session.rollback()
+    db.session.commit()
+
+    assert subscription.get(timeout=0.05) is None
+
+
+def test_committed_readings_are_published(subscribe, solar_records):
+    subscription = subscribe(('readings',), 'EV-2')
+
+    upsert_records('solar', solar_records('EV-2', range(3)))
+    assert subscription.get(timeout=0.05) is None
+    db.session.commit()
+
+    topic, payload = parse(subscription.get(timeout=1))
+    assert topic == 'readings'
+    assert payload['status'] == 'inserted'
+    assert payload['count'] == 3
+    assert {reading['module_id'] for reading in payload['readings']} == {'EV-2'}
+
+
+def test_overwritten_readings_are_published_as_updated(subscribe, solar_records):
+    upsert_records('solar', solar_records('EV-3', [0]))
+    db.session.commit()
+    subscription = subscribe(('readings',), 'EV-3')
+
+    upsert_records('solar', solar_records('EV-3', [0], max_power=410.0), on_duplicate='update')
+    db.session.commit()
+
+    topic, payload = parse(subscription.get(timeout=1))
+    assert payload['status'] == 'updated'
+    assert payload['readings'][0]['max_power'] == 410.0
+
+
+def test_anomalies_are_published_after_commit(subscribe):
+    subscription = subscribe(('anomalies',), 'EV-4')
+    anomaly = dict(
+        module_id='EV-4', anomaly_type='Sombreado parcial', severity_level='Media',
+        confidence='Media', description='Anomalía de prueba en EV-4', status='active'
+    )
+
+    db.session.add(AnomalyDetection(**anomaly))
+    db.session.flush()
+    db.session.rollback()
+    assert subscription.get(timeout=0.05) is None
+
+    db.session.add(AnomalyDetection(**anomaly))
+    db.session.commit()
+
+    topic, payload = parse(subscription.get(timeout=1))
+    assert topic == 'anomalies'
+    assert payload['module_id'] == 'EV-4'
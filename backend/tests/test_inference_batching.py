@@ -0,0 +1,109 @@
+"""
+Pruebas de la agrupación de inferencias de desempeño y anomalías
+"""
+
+import json
+
+import pandas as pd
+import pytest
+
+from src.models.solar_data import db, PredictionResult
+from src.routes import ai_endpoints
+
+CONDITIONS = {'irradiance': 800, 'ambient_temp': 30, 'humidity': 70, 'wind_speed': 2}
+MODULE = {
+    'voltage_oc': 45.0, 'voltage_mp': 37.0, 'current_mp': 8.0, 'current_sc': 9.0,
+    'power_max': 300.0, 'efficiency': 0.18, 'cell_temp': 45.0
+}
+
+
+class PredictOnly:
+    """Predictor con predict genérico, sin declarar BATCH_PREDICT"""
+
+    def predict(self, features):
+        raise AssertionError('predict no debe llamarse sin BATCH_PREDICT')
+
+
+class BatchPredictor:
+    BATCH_PREDICT = True
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, features):
+        self.calls += 1
+        return features['irradiance'].to_numpy() * 0.3
+
+
+class AnomalousRowsDetector:
+    """Detector que solo devuelve las filas anómalas (conservando su índice)"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def detect_anomalies(self, frame):
+        self.calls += 1
+        anomalous = frame[frame['efficiency'] < 0.12]
+        return anomalous.assign(is_anomaly=True)
+
+
+class ModuleIdDetector:
+    def detect_anomalies(self, frame):
+        return [{'module_id': 'AN-2', 'is_anomaly': True}]
+
+
+def stored_prediction(prediction_id):
+    return json.loads(db.session.get(PredictionResult, prediction_id).prediction_result)
+
+
+def test_predict_only_model_uses_physical_model(app_context, client, monkeypatch):
+    monkeypatch.setattr(ai_endpoints, 'load_performance_predictor', PredictOnly)
+
+    body = client.post('/api/predict/performance', json=CONDITIONS).get_json()
+
+    result = stored_prediction(body['prediction_id'])
+    assert body['prediction']['confidence'] == 0.75
+    assert result['factors']['irradiance_factor'] == pytest.approx(0.8)
+    assert result['factors']['temperature_factor'] != 1.0
+
+
+def test_batch_predictor_result_has_model_confidence(app_context, client, monkeypatch):
+    predictor = BatchPredictor()
+    monkeypatch.setattr(ai_endpoints, 'load_performance_predictor', lambda: predictor)
+
+    body = client.post('/api/predict/performance', json=CONDITIONS).get_json()
+
+    assert predictor.calls == 1
+    assert body['prediction']['predicted_power'] == pytest.approx(240.0)
+    assert body['prediction']['confidence'] == 0.85
+    assert stored_prediction(body['prediction_id'])['factors'] is None
+
+
+def test_partial_detector_results_are_matched_in_one_call(monkeypatch):
+    detector = AnomalousRowsDetector()
+    monkeypatch.setattr(ai_endpoints, 'load_anomaly_detector', lambda: detector)
+    entries = [('AN-1', MODULE), ('AN-2', {**MODULE, 'efficiency': 0.05}), ('AN-3', MODULE)]
+
+    results = ai_endpoints._detect_anomalies_batch(entries)
+
+    assert detector.calls == 1
+    assert results[0] is None and results[2] is None
+    assert results[1]['is_anomaly'] and results[1]['efficiency'] == 0.05
+
+
+def test_detector_results_are_matched_by_module_id(monkeypatch):
+    monkeypatch.setattr(ai_endpoints, 'load_anomaly_detector', ModuleIdDetector)
+    entries = [('AN-1', MODULE), ('AN-2', MODULE)]
+
+    assert ai_endpoints._detect_anomalies_batch(entries) == [None, {'module_id': 'AN-2', 'is_anomaly': True}]
+
+
+def test_unmatched_detector_result_is_rejected(monkeypatch):
+    class Unmatched:
+        def detect_anomalies(self, frame):
+            return pd.DataFrame([{'is_anomaly': True}], index=['x'])
+
+    monkeypatch.setattr(ai_endpoints, 'load_anomaly_detector', Unmatched)
+
+    with pytest.raises(ValueError):
+        ai_endpoints._detect_anomalies_batch([('AN-1', MODULE), ('AN-2', MODULE)])
@@ -0,0 +1,81 @@
+"""
+Pruebas de la migración de una base de datos con el esquema original
+"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+# Tabla de lecturas solares del esquema original (sin índice único ni agregados)
+BASELINE_SCHEMA = '''
+CREATE TABLE solar_modules_data (
+    id INTEGER PRIMARY KEY, timestamp DATETIME NOT NULL, module_id VARCHAR(50) NOT NULL,
+    open_circuit_voltage FLOAT NOT NULL, max_power_voltage FLOAT NOT NULL,
+    max_power_current FLOAT NOT NULL, short_circuit_current FLOAT NOT NULL,
+    max_power FLOAT NOT NULL, efficiency FLOAT NOT NULL, cell_temperature FLOAT NOT NULL,
+    created_at DATETIME
+);
+CREATE INDEX ix_solar_modules_data_module_timestamp ON solar_modules_data (module_id, timestamp);
+'''
+
+READING = "(?, ?, 45.0, 37.0, 8.0, 9.0, ?, 0.18, 45.0, '2026-08-01 00:00:00.000000')"
+
+
+def baseline_database(path):
+    """Base con el esquema original y una lectura duplicada"""
+    connection = sqlite3.connect(path)
+    connection.executescript(BASELINE_SCHEMA)
+    connection.executemany(
+        f'INSERT INTO solar_modules_data (timestamp, module_id, open_circuit_voltage, max_power_voltage, '
+        f'max_power_current, short_circuit_current, max_power, efficiency, cell_temperature, created_at) '
+        f'VALUES {READING}',
+        [('2026-08-01 10:00:00.000000', 'MIG-1', 300.0),
+         ('2026-08-01 10:00:00.000000', 'MIG-1', 300.0),
+         ('2026-08-01 11:00:00.000000', 'MIG-1', 500.0)]
+    )
+    connection.commit()
+    connection.close()
+
+
+@pytest.fixture
+def flask(backend_dir):
+    """Ejecutar un comando de flask en un proceso nuevo sobre la base path"""
+    def run(path, *args):
+        env = {**os.environ, 'DATABASE_URL': f'sqlite:///{path}'}
+        return subprocess.run(
+            [sys.executable, '-m', 'flask', '--app', 'src.main', *args],
+            cwd=backend_dir, env=env, capture_output=True, text=True, timeout=300
+        )
+
+    return run
+
+
+def test_upgrade_db_migrates_baseline_schema(tmp_path, flask):
+    path = tmp_path / 'baseline.db'
+    baseline_database(path)
+
+    result = flask(path, 'upgrade-db')
+
+    assert result.returncode == 0, result.stderr
+    assert 'Esquema de base de datos desactualizado' in result.stderr
+    assert 'Lecturas duplicadas eliminadas en solar_modules_data: 1' in result.stdout
+    assert 'Índice creado: uq_solar_modules_data_module_timestamp' in result.stdout
+
+    connection = sqlite3.connect(path)
+    indexes = {row[1] for row in connection.execute('PRAGMA index_list(solar_modules_data)')}
+    rollup = connection.execute(
+        "SELECT count, power_sum FROM solar_rollups WHERE resolution = '1d' AND module_id = 'MIG-1'"
+    ).fetchall()
+    connection.close()
+    assert 'uq_solar_modules_data_module_timestamp' in indexes
+    assert 'ix_solar_modules_data_module_timestamp' not in indexes
+    assert rollup == [(2, 800.0)]
+
+    # Con el esquema al día el arranque ya no avisa y la migración no cambia nada
+    again = flask(path, 'upgrade-db')
+    assert again.returncode == 0, again.stderr
+    assert 'desactualizado' not in again.stderr
+    assert 'Agregados' not in again.stdout
@@ -0,0 +1,128 @@
+"""
+Pruebas de la retención de lecturas crudas y su relación con los agregados
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.models.solar_data import db, SolarModuleData, SolarRollup
+from src.services.retention import retention, RetentionPolicy
+from src.services.rollups import rebuild_rollups
+
+
+@pytest.fixture
+def raw_policy(app_context):
+    """Conservar 30 días de lecturas crudas durante la prueba"""
+    previous = retention.policy
+    retention.policy = RetentionPolicy(tiers={'raw': 30})
+    yield retention.policy
+    retention.policy = previous
+
+
+@pytest.fixture
+def post_day(client, solar_reading):
+    """Enviar por la API una lectura por hora de un día completo"""
+    def post(module_id, day):
+        readings = [solar_reading(module_id, (day + timedelta(hours=hour)).isoformat()) for hour in range(24)]
+        response = client.post('/api/data/solar/batch', json=readings)
+        assert response.status_code == 201
+        assert response.get_json()['inserted'] == 24
+
+    return post
+
+
+def days_ago(days):
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=days)
+
+
+def test_raw_cutoff_is_aligned_to_day(raw_policy):
+    assert retention.raw_cutoff(datetime(2026, 9, 10, 15, 30)) == datetime(2026, 8, 11)
+
+
+def test_raw_cutoff_disabled_without_raw_retention(app_context):
+    previous = retention.policy
+    retention.policy = RetentionPolicy()
+    try:
+        assert retention.raw_cutoff(datetime(2026, 9, 10)) is None
+    finally:
+        retention.policy = previous
+
+
+def test_purge_keeps_rollups_of_purged_day(raw_policy, post_day, stored_readings, solar_rollup):
+    day = datetime(2026, 8, 1)
+    post_day('RET-1', day)
+
+    summary = retention.run(day + timedelta(days=31, hours=12))
+
+    assert summary['raw']['solar'] == 24
+    assert len(stored_readings('RET-1')) == 0
+    assert solar_rollup('RET-1', '1d', day) == (24, 7200.0)
+
+
+def test_purge_does_not_split_a_day(raw_policy, post_day, stored_readings):
+    day = datetime(2026, 8, 1)
+    post_day('RET-2', day)
+
+    # El corte cae a mitad del día siguiente: el día se conserva entero
+    summary = retention.run(day + timedelta(days=30, hours=12))
+
+    assert summary['raw']['solar'] == 0
+    assert len(stored_readings('RET-2')) == 24
+
+
+def test_overwrite_before_cutoff_refreshes_unpurged_day(
+        raw_policy, client, post_day, solar_reading, solar_rollup):
+    day = days_ago(40)
+    post_day('RET-3', day)
+
+    response = client.post(
+        '/api/data/solar?on_duplicate=update',
+        json=solar_reading('RET-3', (day + timedelta(hours=13)).isoformat(), max_power=700.0)
+    )
+
+    assert response.get_json()['status'] == 'updated'
+    assert solar_rollup('RET-3', '1d', day) == (24, 7600.0)
+
+
+def test_overwrite_keeps_rollup_of_partially_purged_day(
+        raw_policy, client, post_day, solar_reading, solar_rollup):
+    day = days_ago(40)
+    post_day('RET-4', day)
+    # Purga interrumpida a mitad del día: solo quedan las últimas 12 horas
+    db.session.execute(db.delete(SolarModuleData).where(
+        SolarModuleData.module_id == 'RET-4', SolarModuleData.timestamp < day + timedelta(hours=12)
+    ))
+    db.session.commit()
+
+    response = client.post(
+        '/api/data/solar?on_duplicate=update',
+        json=solar_reading('RET-4', (day + timedelta(hours=13)).isoformat(), max_power=700.0)
+    )
+
+    assert response.get_json()['status'] == 'updated'
+    assert solar_rollup('RET-4', '1d', day) == (24, 7200.0)
+
+
+def test_rebuild_keeps_rollups_of_purged_days(raw_policy, post_day, solar_rollup):
+    purged, partial, kept = days_ago(40), days_ago(10), days_ago(2)
+    for day in (purged, partial, kept):
+        post_day('RET-5', day)
+    retention.run()
+    # Purga interrumpida a mitad de un día
+    db.session.execute(db.delete(SolarModuleData).where(
+        SolarModuleData.module_id == 'RET-5', SolarModuleData.timestamp >= partial,
+        SolarModuleData.timestamp < partial + timedelta(hours=12)
+    ))
+    # Agregado desactualizado de un día con todas sus lecturas crudas
+    db.session.execute(db.update(SolarRollup).where(
+        SolarRollup.module_id == 'RET-5', SolarRollup.bucket_start == kept
+    ).values(count=1, power_sum=1.0))
+    db.session.commit()
+
+    assert rebuild_rollups()['solar'] == 24
+
+    assert solar_rollup('RET-5', '1d', purged) == (24, 7200.0)
+    assert solar_rollup('RET-5', '1d', partial) == (24, 7200.0)
+    assert solar_rollup('RET-5', '1d', kept) == (24, 7200.0)
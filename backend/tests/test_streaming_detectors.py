@@ -0,0 +1,56 @@
+"""
+Pruebas de los detectores en línea: solo se aplican lecturas confirmadas
+"""
+
+import pytest
+
+from src.models.solar_data import db, AnomalyDetection, DetectorState
+from src.services import streaming_detectors as detectors_module
+from src.services.ingestion import upsert_records
+from src.services.streaming_detectors import streaming_detectors, METRICS, WARMUP_READINGS
+
+# Variación pequeña de potencia y eficiencia entre lecturas consecutivas
+VARYING = {
+    'max_power': lambda minute: 300.0 + minute % 3,
+    'efficiency': lambda minute: 0.18 + 0.001 * (minute % 5)
+}
+
+
+@pytest.fixture
+def checkpoint_always(monkeypatch):
+    monkeypatch.setattr(detectors_module, 'CHECKPOINT_INTERVAL', 0)
+
+
+def test_rolled_back_readings_do_not_update_state(app_context, solar_records):
+    upsert_records('solar', solar_records('SD-1', range(5), **VARYING))
+    assert streaming_detectors.state('SD-1') is None
+
+    db.session.rollback()
+
+    assert streaming_detectors.state('SD-1') is None
+    # Las lecturas descartadas no se aplican en la siguiente confirmación
+    db.session.commit()
+    assert streaming_detectors.state('SD-1') is None
+
+
+def test_committed_readings_update_state(app_context, solar_records):
+    upsert_records('solar', solar_records('SD-2', range(5), **VARYING))
+    db.session.commit()
+
+    state = streaming_detectors.state('SD-2')
+    assert state['efficiency']['count'] == 5
+    assert state['efficiency']['warming_up']
+
+
+def test_alarms_are_persisted_after_warmup(app_context, solar_records, checkpoint_always):
+    upsert_records('solar', solar_records('SD-3', range(WARMUP_READINGS + 30), **VARYING))
+    db.session.commit()
+    assert not streaming_detectors.state('SD-3')['efficiency']['warming_up']
+    assert AnomalyDetection.query.filter_by(module_id='SD-3').count() == 0
+
+    low_efficiency = solar_records('SD-3', range(WARMUP_READINGS + 30, WARMUP_READINGS + 33), **{**VARYING, 'efficiency': 0.05})
+    upsert_records('solar', low_efficiency)
+    db.session.commit()
+
+    assert AnomalyDetection.query.filter_by(module_id='SD-3').count() > 0
+    assert DetectorState.query.filter_by(module_id='SD-3').count() == len(METRICS)
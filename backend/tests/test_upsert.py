@@ -0,0 +1,86 @@
+"""
+Pruebas de la inserción sin duplicados por clave natural (módulo/ubicación, timestamp)
+"""
+
+from datetime import timedelta
+
+import pytest
+
+from src.models.solar_data import db
+from src.models.migrations import pending_migrations
+from src.services.ingestion import upsert_records
+
+HOUR = timedelta(hours=1)
+
+
+def test_schema_has_no_pending_migrations(app_context):
+    assert pending_migrations(db.engine) == []
+
+
+def test_skip_omits_stored_readings(app_context, solar_records, stored_readings):
+    counts = upsert_records('solar', solar_records('UP-1', range(3), step=HOUR))
+    db.session.commit()
+    assert counts == {'inserted': 3, 'updated': 0, 'skipped': 0}
+
+    counts = upsert_records('solar', solar_records('UP-1', range(4), step=HOUR, max_power=999.0))
+    db.session.commit()
+
+    assert counts == {'inserted': 1, 'updated': 0, 'skipped': 3}
+    assert stored_readings('UP-1', 'max_power') == [300.0, 300.0, 300.0, 999.0]
+
+
+def test_skip_keeps_first_reading_within_batch(app_context, solar_records, stored_readings, start):
+    batch = solar_records('UP-2', [0]) + solar_records('UP-2', [0], max_power=999.0)
+
+    counts = upsert_records('solar', batch)
+    db.session.commit()
+
+    assert counts == {'inserted': 1, 'updated': 0, 'skipped': 1}
+    assert stored_readings('UP-2', 'timestamp', 'max_power') == [(start, 300.0)]
+
+
+def test_update_overwrites_without_double_counting_rollups(
+        app_context, solar_records, stored_readings, solar_rollup, start):
+    upsert_records('solar', solar_records('UP-3', [0]))
+    db.session.commit()
+
+    counts = upsert_records('solar', solar_records('UP-3', [0], max_power=450.0), on_duplicate='update')
+    db.session.commit()
+
+    assert counts == {'inserted': 0, 'updated': 1, 'skipped': 0}
+    assert stored_readings('UP-3', 'timestamp', 'max_power') == [(start, 450.0)]
+    assert solar_rollup('UP-3', '1h', start) == (1, 450.0)
+
+
+def test_update_with_same_values_is_skipped(app_context, solar_records):
+    upsert_records('solar', solar_records('UP-4', [0]))
+    db.session.commit()
+
+    counts = upsert_records('solar', solar_records('UP-4', [0]), on_duplicate='update')
+
+    assert counts == {'inserted': 0, 'updated': 0, 'skipped': 1}
+
+
+def test_invalid_policy_is_rejected(app_context, solar_records):
+    with pytest.raises(ValueError):
+        upsert_records('solar', solar_records('UP-5', [0]), on_duplicate='replace')
+
+
+def test_endpoint_reports_duplicate_reading(client, solar_reading, stored_readings, start):
+    reading = solar_reading('UP-6', start.isoformat())
+
+    first = client.post('/api/data/solar', json=reading)
+    second = client.post('/api/data/solar', json=reading)
+
+    assert first.status_code == 201
+    assert first.get_json()['status'] == 'inserted'
+    assert second.status_code == 200
+    assert second.get_json()['status'] == 'skipped'
+    assert len(stored_readings('UP-6')) == 1
+
+
+def test_endpoint_rejects_invalid_policy(client, solar_reading, stored_readings, start):
+    response = client.post('/api/data/solar?on_duplicate=replace', json=solar_reading('UP-7', start.isoformat()))
+
+    assert response.status_code == 400
+    assert stored_readings('UP-7') == []
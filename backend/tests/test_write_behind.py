@@ -0,0 +1,105 @@
+"""
+Pruebas de la escritura diferida: recuperación del registro local y descarte de lecturas inválidas
+"""
+
+import json
+import os
+import time
+from datetime import timedelta
+
+import pytest
+
+from src.services.write_behind import AppendLog, WriteBehindBuffer, DEAD_LETTER_FILE
+
+
+@pytest.fixture
+def buffer(app_context):
+    """Búfer propio de la prueba (sin hilo escritor ni registro activo)"""
+    buffer = WriteBehindBuffer()
+    buffer.app = app_context
+    buffer.max_retries = 0
+    return buffer
+
+
+def write_log(directory, readings, committed):
+    """Dejar un registro como el de un proceso terminado tras confirmar `committed` lecturas"""
+    log = AppendLog(str(directory))
+    for record in readings:
+        log.append('solar', record)
+    log.commit(committed)
+    log.close()
+    return log.prefix
+
+
+def dead_letters(directory):
+    with open(os.path.join(directory, DEAD_LETTER_FILE), encoding='utf-8') as handle:
+        return [json.loads(line) for line in handle]
+
+
+def test_recover_returns_uncommitted_readings(tmp_path, solar_records, start):
+    prefix = write_log(tmp_path, solar_records('WB-1', range(3)), committed=1)
+
+    [(recovered_prefix, readings)] = AppendLog.recover(str(tmp_path))
+
+    assert recovered_prefix == prefix
+    assert [record['timestamp'] for _, record, _ in readings] == [
+        start + timedelta(minutes=1), start + timedelta(minutes=2)
+    ]
+    assert all(data_type == 'solar' and on_duplicate == 'skip' for data_type, _, on_duplicate in readings)
+
+
+def test_recover_skips_active_log(tmp_path, solar_records):
+    log = AppendLog(str(tmp_path))
+    try:
+        log.append('solar', solar_records('WB-2', [0])[0])
+        assert AppendLog.recover(str(tmp_path)) == []
+    finally:
+        log.commit(log.sequence)
+        log.close()
+
+
+def test_recover_ignores_truncated_line(tmp_path, solar_records):
+    prefix = write_log(tmp_path, solar_records('WB-3', range(2)), committed=0)
+    with open(prefix + '.000001.log', 'a', encoding='utf-8') as handle:
+        handle.write('{"seq": 3, "type": "so')
+
+    [(_, readings)] = AppendLog.recover(str(tmp_path))
+
+    assert len(readings) == 2
+
+
+def test_buffer_reinserts_recovered_readings(buffer, tmp_path, solar_records, stored_readings, start):
+    write_log(tmp_path, solar_records('WB-4', range(3)), committed=1)
+
+    buffer._recover(str(tmp_path))
+
+    assert stored_readings('WB-4') == [start + timedelta(minutes=1), start + timedelta(minutes=2)]
+    assert buffer.stats()['recovered'] == 2
+    assert os.listdir(tmp_path) == []
+
+
+def test_recovery_dead_letters_invalid_reading(buffer, tmp_path, solar_records, stored_readings, start):
+    readings = solar_records('WB-5', range(3))
+    readings[1]['module_id'] = None
+    write_log(tmp_path, readings, committed=0)
+
+    buffer._recover(str(tmp_path))
+
+    assert stored_readings('WB-5') == [start, start + timedelta(minutes=2)]
+    [letter] = dead_letters(tmp_path)
+    assert letter['type'] == 'solar'
+    assert letter['record']['module_id'] is None
+    assert buffer.stats()['dead_lettered'] == 1
+
+
+def test_flush_isolates_invalid_reading_after_retries(buffer, solar_records, stored_readings, start):
+    readings = solar_records('WB-6', range(4))
+    readings[2]['module_id'] = None
+    batch = [[None, 'solar', record, time.perf_counter(), 'skip'] for record in readings]
+
+    buffer._flush(batch)
+
+    stats = buffer.stats()
+    assert stored_readings('WB-6') == [start, start + timedelta(minutes=1), start + timedelta(minutes=3)]
+    assert stats['written'] == 3
+    assert stats['dead_lettered'] == 1